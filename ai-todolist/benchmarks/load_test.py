@@ -0,0 +1,371 @@
+# load_test.py
+"""/v1 API 压力测试
+
+在临时数据库中预置 N 个用户 × M 个任务，启动若干并发模拟客户端按比例执行登录、
+查询列表、创建任务、切换完成状态和批量同步离线操作，输出各接口的吞吐量和
+p50/p95/p99 延迟（JSON）。
+
+默认在进程内通过Flask测试客户端调用，不需要网络；--http 会在本机回环地址上启动
+服务器子进程（prefork或asgi模式），包含HTTP解析和多进程的开销。
+
+    python benchmarks/load_test.py --users 20 --tasks 500 --clients 8 --duration 10
+    python benchmarks/load_test.py --http --server prefork --workers 4 --output report.json
+"""
+import argparse
+import contextlib
+import datetime
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'todolist', 'server'))
+sys.path.insert(0, SERVER_DIR)
+
+PASSWORD = 'benchmark'
+CATEGORIES = ('工作', '学习', '生活', '其他')
+WORDS = ('写周报', '项目评审', '健身', '买菜', '阅读论文', '准备会议', '修复缺陷', '整理文档')
+
+# 默认的操作比例
+DEFAULT_MIX = {'login': 2, 'list': 50, 'create': 20, 'toggle': 18, 'batch': 10}
+
+
+def parse_mix(value):
+    """解析 login=2,list=50 形式的操作比例"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"未知的操作: {name}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的比例: {item}")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("至少一个操作的比例大于0")
+    return mix
+
+
+def percentile(sorted_values, p):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def seed_database(database, users, tasks_per_user, rng):
+    """直接写入数据库预置用户和任务，所有用户使用同一个密码哈希以节省时间
+
+    Returns:
+        list: 用户名列表
+    """
+    import server
+    from auth import hash_password
+
+    server.close_pool()
+    server.DATABASE = database
+    with server.app.app_context():
+        server.ensure_db_structure()
+        db = server.get_db()
+        password_hash = hash_password(PASSWORD)
+        now = datetime.datetime.now()
+        usernames = []
+        db.execute("BEGIN IMMEDIATE")
+        for i in range(users):
+            user_id = str(uuid.uuid4())
+            username = f"bench{i}"
+            usernames.append(username)
+            db.execute("INSERT INTO users (id, username, email, password_hash, created_at, settings) "
+                       "VALUES (?, ?, ?, ?, ?, '{}')",
+                       (user_id, username, f"{username}@example.com", password_hash,
+                        now.isoformat()))
+            rows = []
+            for _ in range(tasks_per_user):
+                created = now - datetime.timedelta(days=rng.randint(0, 365),
+                                                   minutes=rng.randint(0, 1440))
+                completed = rng.random() < 0.4
+                completed_at = (created + datetime.timedelta(hours=rng.randint(1, 72))).isoformat() \
+                    if completed else None
+                due = (created + datetime.timedelta(days=rng.randint(0, 30))).date().isoformat()
+                rows.append((str(uuid.uuid4()), user_id, rng.choice(WORDS), rng.choice(CATEGORIES),
+                             int(completed), created.isoformat(), completed_at, due))
+            db.executemany("INSERT INTO tasks (id, user_id, text, category, completed, created_at, "
+                           "completed_at, due_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        db.commit()
+    server.close_pool()
+    return usernames
+
+
+class InProcessTransport:
+    """通过Flask测试客户端调用，每个模拟客户端一个实例"""
+
+    def __init__(self):
+        import server
+        self.client = server.app.test_client()
+
+    def request(self, method, path, headers=None, body=None):
+        response = self.client.open(path, method=method, headers=headers, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPTransport:
+    """通过HTTP调用本机启动的服务器，每个模拟客户端保持一个长连接"""
+
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def request(self, method, path, headers=None, body=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        raw = response.read()
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        return response.status, data
+
+
+class SimulatedClient:
+    """模拟一个客户端：登录后按比例随机执行操作，记录每次请求的耗时"""
+
+    def __init__(self, transport, username, mix, batch_size, rng):
+        self.transport = transport
+        self.username = username
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.batch_size = batch_size
+        self.rng = rng
+        self.headers = None
+        self.task_ids = []
+        self.samples = {}  # 操作 -> [耗时秒数]
+        self.errors = {}  # 操作 -> 失败次数
+
+    def timed(self, name, method, path, body=None, headers=None):
+        started = time.perf_counter()
+        status, data = self.transport.request(method, path, headers or self.headers, body)
+        self.samples.setdefault(name, []).append(time.perf_counter() - started)
+        if status >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return status, data
+
+    def login(self):
+        status, data = self.timed('login', 'POST', '/v1/auth/login',
+                                  {'username': self.username, 'password': PASSWORD}, headers={})
+        if status == 200:
+            self.headers = {'Authorization': f"Bearer {data['token']}"}
+        elif status == 503:
+            # 密码哈希队列已满，按Retry-After的量级稍后重试
+            time.sleep(0.1)
+
+    def list(self):
+        status, data = self.timed('list', 'GET', '/v1/tasks?limit=100')
+        if status == 200 and data:
+            ids = [task['id'] for task in data['tasks']]
+            if ids:
+                self.task_ids = ids
+
+    def create(self):
+        status, data = self.timed('create', 'POST', '/v1/tasks', {
+            'text': self.rng.choice(WORDS), 'category': self.rng.choice(CATEGORIES),
+            'due_date': datetime.date.today().isoformat()
+        })
+        if status == 201 and data:
+            self.task_ids.append(data['id'])
+
+    def toggle(self):
+        if not self.task_ids:
+            return self.list()
+        task_id = self.rng.choice(self.task_ids)
+        self.timed('toggle', 'PUT', f'/v1/tasks/{task_id}',
+                   {'completed': self.rng.random() < 0.5})
+
+    def batch(self):
+        """离线期间积累的操作：新建、修改和删除混合"""
+        operations = []
+        for i in range(self.batch_size):
+            roll = self.rng.random()
+            op = {'op_id': str(uuid.uuid4())}
+            if roll < 0.6 or not self.task_ids:
+                op.update(type='create', data={'text': self.rng.choice(WORDS),
+                                               'category': self.rng.choice(CATEGORIES),
+                                               'temp_id': f"temp-{i}"})
+            elif roll < 0.9:
+                op.update(type='update', id=self.rng.choice(self.task_ids),
+                          data={'completed': True})
+            else:
+                op.update(type='delete', id=self.task_ids.pop(self.rng.randrange(len(self.task_ids))))
+            operations.append(op)
+        headers = dict(self.headers, **{'Idempotency-Key': str(uuid.uuid4())})
+        self.timed('batch', 'POST', '/v1/tasks/batch', {'operations': operations}, headers=headers)
+
+    def run(self, deadline, max_requests):
+        while self.headers is None and time.perf_counter() < deadline:
+            self.login()
+        if self.headers is None:
+            return
+        self.list()
+        done = 0
+        while time.perf_counter() < deadline and (not max_requests or done < max_requests):
+            name = self.rng.choices(self.operations, self.weights)[0]
+            getattr(self, name)()
+            done += 1
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database, args):
+    """在子进程中启动服务器，等待 /v1/ping 可用"""
+    port = free_port()
+    command = [sys.executable, os.path.join(SERVER_DIR, 'server.py'), '--server', args.server,
+               '--bind', f"127.0.0.1:{port}"]
+    if args.server == 'prefork':
+        command += ['--workers', str(args.workers), '--threads', str(args.threads)]
+    env = dict(os.environ, TODO_DATABASE=database, TODO_MAINTENANCE_INTERVAL='0')
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器启动失败，退出码 {process.returncode}")
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+        try:
+            connection.request('GET', '/v1/ping')
+            if connection.getresponse().status == 200:
+                return process, port
+        except OSError:
+            time.sleep(0.2)
+        finally:
+            connection.close()
+    process.terminate()
+    raise RuntimeError("等待服务器启动超时")
+
+
+def build_report(clients, elapsed, config):
+    samples, errors = {}, {}
+    for client in clients:
+        for name, values in client.samples.items():
+            samples.setdefault(name, []).extend(values)
+        for name, count in client.errors.items():
+            errors[name] = errors.get(name, 0) + count
+
+    endpoints = {}
+    for name in sorted(samples):
+        values = sorted(samples[name])
+        endpoints[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+        }
+
+    total = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "config": config,
+        "elapsed_s": round(elapsed, 3),
+        "total_requests": total,
+        "total_errors": sum(errors.values()),
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+    }
+
+
+def run(args):
+    """执行一次压力测试，返回报告字典"""
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = os.path.join(tmpdir, 'load_test.db')
+        # 迁移输出写到标准错误，标准输出只包含报告
+        with contextlib.redirect_stdout(sys.stderr):
+            usernames = seed_database(database, args.users, args.tasks, rng)
+
+        process = None
+        if args.http:
+            process, port = start_server(database, args)
+        try:
+            clients = []
+            for i in range(args.clients):
+                transport = HTTPTransport(port) if args.http else InProcessTransport()
+                clients.append(SimulatedClient(transport, usernames[i % len(usernames)], args.mix,
+                                               args.batch_size, random.Random(rng.random())))
+
+            started = time.perf_counter()
+            deadline = started + args.duration
+            threads = [threading.Thread(target=client.run, args=(deadline, args.requests))
+                       for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=60)
+            else:
+                import server
+                server.close_pool()
+
+    config = {key: value for key, value in vars(args).items() if key != 'output'}
+    return build_report(clients, elapsed, config)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AI-TodoList API 压力测试")
+    parser.add_argument('--users', type=int, default=10, help="预置用户数")
+    parser.add_argument('--tasks', type=int, default=200, help="每个用户预置的任务数")
+    parser.add_argument('--clients', type=int, default=8, help="并发模拟客户端数")
+    parser.add_argument('--duration', type=float, default=10, help="测试时长（秒）")
+    parser.add_argument('--requests', type=int, default=0,
+                        help="每个客户端最多发送的请求数，0表示只受时长限制")
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="操作比例，如 login=2,list=50,create=20,toggle=18,batch=10")
+    parser.add_argument('--batch-size', type=int, default=20, help="每次批量同步的操作数")
+    parser.add_argument('--seed', type=int, default=1, help="随机数种子，相同参数可重复")
+    parser.add_argument('--http', action='store_true', help="在本机启动服务器子进程，通过HTTP调用")
+    parser.add_argument('--server', choices=['prefork', 'asgi'], default='prefork',
+                        help="--http时的服务器模式")
+    parser.add_argument('--workers', type=int, default=2, help="prefork模式的worker数")
+    parser.add_argument('--threads', type=int, default=8, help="prefork模式每个worker的线程数")
+    parser.add_argument('--output', help="报告写入的文件，默认输出到标准输出")
+    args = parser.parse_args(argv)
+    if args.users < 1 or args.clients < 1:
+        parser.error("--users和--clients至少为1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return report
+
+
+if __name__ == '__main__':
+    main()
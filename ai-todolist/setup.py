@@ -24,10 +24,14 @@ setup(
         'openai',
         # Add other dependencies as needed
     ],
+    extras_require={
+        'asgi': ['uvicorn'],  # 异步服务模式: todolist-server --server asgi
+        'brotli': ['brotli'],  # 支持brotli压缩，未安装时只使用gzip
+    },
     entry_points={
         'console_scripts': [
             'todolist-desktop=todolist.desktop.app:main',  # 修改入口点为toollist.desktop.app
-            'todolist-server=todolist.server.main:main',  # 修改入口点为toollist.server.app
+            'todolist-server=todolist.server.cli:main',  # 多用户API服务器，见 todolist-server --help
         ],
     },
 )
\ No newline at end of file
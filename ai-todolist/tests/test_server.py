@@ -0,0 +1,1592 @@
+import asyncio
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'todolist', 'server'))
+
+import auth
+import db
+import events
+import group_commit
+import maintenance
+import metrics
+import migrations
+import profiler
+import server
+from db import ConnectionPool
+from schema import (TASK_INDEXES, check_query_plans, ensure_indexes, rebuild_analytics,
+                    rebuild_user_stats)
+
+
+class ServerTestCase(unittest.TestCase):
+    """基于临时数据库的API测试基类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        server.close_pool()
+        server.DATABASE = os.path.join(self.tmpdir.name, 'test.db')
+        with server.app.app_context():
+            server.ensure_db_structure()
+        self.client = server.app.test_client()
+
+    def tearDown(self):
+        server.close_pool()
+        self.tmpdir.cleanup()
+
+    def register(self, username='alice'):
+        response = self.client.post('/v1/auth/register', json={
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': 'secret'
+        })
+        self.assertEqual(response.status_code, 201)
+        return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+    def create_task(self, headers, **fields):
+        data = {'text': '写周报', 'category': '工作'}
+        data.update(fields)
+        response = self.client.post('/v1/tasks', json=data, headers=headers)
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()
+
+
+class TestConnectionPool(ServerTestCase):
+
+    def test_connections_use_wal(self):
+        pool = ConnectionPool(server.DATABASE, size=2)
+        conn = pool.acquire()
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, 'wal')
+        pool.release(conn)
+        pool.close()
+
+    def test_connections_are_reused(self):
+        pool = ConnectionPool(server.DATABASE, size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(pool.stats()['opened'], 1)
+        pool.close()
+
+    def test_invalid_synchronous_level(self):
+        with self.assertRaises(ValueError):
+            ConnectionPool(server.DATABASE, synchronous='FAST')
+
+    def test_request_releases_connection(self):
+        headers = self.register()
+        for _ in range(5):
+            self.client.get('/v1/tasks', headers=headers)
+        stats = server.get_pool().stats()
+        self.assertEqual(stats['opened'], stats['idle'])
+
+    def test_view_errors_are_not_auth_errors(self):
+        headers = self.register()
+        app = server.Flask('errors')
+
+        @app.route('/boom')
+        @auth.login_required
+        def boom():
+            raise RuntimeError('boom')
+
+        client = app.test_client()
+        self.assertEqual(client.get('/boom', headers=headers).status_code, 500)
+        self.assertEqual(client.get('/boom', headers={'Authorization': 'Bearer'}).status_code, 401)
+
+    def test_exhausted_pool_returns_503(self):
+        headers = self.register()
+        server.close_pool()
+        server._pool = pool = ConnectionPool(server.DATABASE, size=1, busy_timeout=50)
+        conn = pool.acquire()
+        try:
+            response = self.client.get('/v1/tasks', headers=headers)
+        finally:
+            pool.release(conn)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_concurrent_requests(self):
+        headers = self.register()
+        errors = []
+
+        def worker():
+            client = server.app.test_client()
+            for _ in range(10):
+                response = client.post('/v1/tasks', json={'text': 't', 'category': '工作'},
+                                       headers=headers)
+                if response.status_code != 201:
+                    errors.append(response.status_code)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        response = self.client.get('/v1/tasks', headers=headers)
+        self.assertEqual(len(response.get_json()['tasks']), 40)
+
+
+class TestQueryPlans(ServerTestCase):
+
+    def test_hot_queries_use_indexes(self):
+        with server.app.app_context():
+            self.assertEqual(check_query_plans(server.get_db()), {})
+
+    def test_scan_is_reported(self):
+        with server.app.app_context():
+            db = server.get_db()
+            for name in TASK_INDEXES:
+                db.execute(f"DROP INDEX {name}")
+            problems = check_query_plans(db)
+        self.assertIn('list_tasks', problems)
+
+    def test_stale_indexes_are_dropped(self):
+        with server.app.app_context():
+            db = server.get_db()
+            db.execute("CREATE INDEX idx_tasks_user_v0 ON tasks (user_id)")
+            ensure_indexes(db)
+            names = {row[0] for row in db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_tasks_%'")}
+        self.assertEqual(names, set(TASK_INDEXES))
+
+
+class TestMigrations(ServerTestCase):
+
+    def test_current_schema_is_noop(self):
+        with server.app.app_context():
+            db = server.get_db()
+            self.assertEqual(migrations.schema_version(db), migrations.LATEST_VERSION)
+            self.assertEqual(server.ensure_db_structure(), [])
+
+    def test_legacy_single_user_database(self):
+        server.close_pool()
+        server.DATABASE = os.path.join(self.tmpdir.name, 'legacy.db')
+        conn = sqlite3.connect(server.DATABASE)
+        conn.execute("CREATE TABLE tasks (id TEXT PRIMARY KEY, text TEXT NOT NULL, "
+                     "category TEXT NOT NULL, completed INTEGER NOT NULL DEFAULT 0, "
+                     "created_at TEXT NOT NULL, completed_at TEXT, due_date TEXT, due_time TEXT, "
+                     "deleted INTEGER NOT NULL DEFAULT 0)")
+        conn.execute("INSERT INTO tasks (id, text, category, created_at) "
+                     "VALUES ('t1', '写周报', '工作', '2025-01-01T09:00:00')")
+        conn.commit()
+        conn.close()
+
+        with server.app.app_context():
+            applied = server.ensure_db_structure()
+            db = server.get_db()
+            task = db.execute("SELECT * FROM tasks").fetchone()
+            admin = db.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()
+            total = db.execute("SELECT total FROM user_stats WHERE user_id = ?",
+                               (admin['id'],)).fetchone()
+        self.assertEqual(applied, [m[0] for m in migrations.MIGRATIONS])
+        self.assertEqual((task['user_id'], task['seq']), (admin['id'], 1))
+        self.assertEqual(total['total'], 1)
+
+    def test_failed_migration_is_rolled_back(self):
+        def broken(conn):
+            conn.execute("CREATE TABLE half_done (id INTEGER)")
+            raise sqlite3.OperationalError("boom")
+
+        steps = migrations.MIGRATIONS + [(migrations.LATEST_VERSION + 1, "broken", broken)]
+        with server.app.app_context():
+            db = server.get_db()
+            with self.assertRaises(sqlite3.OperationalError):
+                migrations.migrate(db, steps)
+            self.assertEqual(migrations.schema_version(db), migrations.LATEST_VERSION)
+            self.assertIsNone(db.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone())
+
+
+class TestTaskMutations(ServerTestCase):
+
+    def tearDown(self):
+        server.SUPPORTS_RETURNING = db.SUPPORTS_RETURNING
+        super().tearDown()
+
+    def test_mutations_with_and_without_returning(self):
+        headers = self.register()
+        other = self.register('bob')
+        for returning in (True, False):
+            if returning and not db.SUPPORTS_RETURNING:
+                continue
+            with self.subTest(returning=returning):
+                server.SUPPORTS_RETURNING = returning
+                task = self.create_task(headers, completed='yes', due_date='2024-05-01')
+                self.assertIs(task['completed'], True)
+                self.assertEqual(task['due_date'], '2024-05-01')
+                self.assertIsNotNone(task['completed_at'])
+
+                url = f"/v1/tasks/{task['id']}"
+                self.assertEqual(self.client.put(url, headers=other, json={'text': 'x'}).status_code, 404)
+                response = self.client.put(url, headers=headers, json={'text': '改', 'completed': False})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get_json(), dict(task, text='改', completed=False,
+                                                           completed_at=None))
+
+                self.assertEqual(self.client.delete(url, headers=other).status_code, 404)
+                self.assertEqual(self.client.delete(url, headers=headers).status_code, 200)
+                self.assertEqual(self.client.delete(url, headers=headers).status_code, 404)
+                self.assertEqual(self.client.put(url, headers=headers, json={'text': 'x'}).status_code, 404)
+
+
+class TestTaskPagination(ServerTestCase):
+
+    def fetch_all(self, headers, **params):
+        tasks = []
+        cursor = None
+        while True:
+            query = dict(params)
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get('/v1/tasks', query_string=query, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            self.assertLessEqual(len(body['tasks']), int(params.get('limit', 100)))
+            tasks.extend(body['tasks'])
+            cursor = body['next_cursor']
+            if not cursor:
+                return tasks
+
+    def test_pages_cover_all_tasks_in_order(self):
+        headers = self.register()
+        dates = ['2025-03-02', None, '2025-03-01', '2025-03-02', None, '2025-03-03', '2025-03-01']
+        for due_date in dates:
+            self.create_task(headers, due_date=due_date)
+
+        for sort in ('due_date', '-due_date'):
+            tasks = self.fetch_all(headers, sort=sort, limit=2)
+            self.assertEqual(len(tasks), len(dates))
+            self.assertEqual(len({t['id'] for t in tasks}), len(dates))
+            keys = [(t['due_date'] is not None, t['due_date'] or '', t['id']) for t in tasks]
+            self.assertEqual(keys, sorted(keys, reverse=sort.startswith('-')))
+
+    def test_malformed_cursor_values(self):
+        import base64
+        headers = self.register()
+
+        def cursor(*parts):
+            return base64.urlsafe_b64encode(json.dumps(parts).encode()).decode()
+
+        for value, task_id in (([1], 'x'), ('2025-01-01', [1]), ({}, 'x'), ('2025-01-01', None)):
+            response = self.client.get('/v1/tasks', headers=headers, query_string={
+                'sort': 'created_at', 'cursor': cursor('created_at', value, task_id)})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/v1/tasks/search', headers=headers, query_string={
+            'q': '周报', 'cursor': cursor('search', 1.0, [1])})
+        self.assertEqual(response.status_code, 400)
+
+    def test_category_sort(self):
+        headers = self.register()
+        for category in ['学习', '工作', '生活', '工作']:
+            self.create_task(headers, category=category)
+        tasks = self.fetch_all(headers, sort='category', limit=3)
+        categories = [t['category'] for t in tasks]
+        self.assertEqual(categories, sorted(categories))
+
+    def test_limit_is_capped(self):
+        headers = self.register()
+        response = self.client.get('/v1/tasks?limit=100000', headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_parameters(self):
+        headers = self.register()
+        for query in ('sort=priority', 'limit=0', 'limit=abc', 'cursor=%%%'):
+            response = self.client.get(f'/v1/tasks?{query}', headers=headers)
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_cursor_bound_to_sort(self):
+        headers = self.register()
+        for _ in range(3):
+            self.create_task(headers)
+        body = self.client.get('/v1/tasks?limit=1&sort=created_at', headers=headers).get_json()
+        response = self.client.get(f"/v1/tasks?limit=1&sort=category&cursor={body['next_cursor']}",
+                                   headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+
+class TestDateFilters(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.headers = self.register()
+        today = datetime.date.today()
+        self.dates = {
+            'yesterday': (today - datetime.timedelta(days=1)).isoformat(),
+            'today': today.isoformat(),
+            'next_week': (today + datetime.timedelta(days=6)).isoformat(),
+            'next_month': (today + datetime.timedelta(days=30)).isoformat(),
+        }
+        for name, due_date in self.dates.items():
+            self.create_task(self.headers, text=name, due_date=due_date)
+        self.create_task(self.headers, text='done', due_date=self.dates['yesterday'], completed=True)
+        self.create_task(self.headers, text='undated')
+
+    def texts(self, query):
+        response = self.client.get(f'/v1/tasks?{query}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return {t['text'] for t in response.get_json()['tasks']}
+
+    def test_due_date(self):
+        self.assertEqual(self.texts(f"due_date={self.dates['today']}"), {'today'})
+
+    def test_due_range(self):
+        query = f"due_from={self.dates['today']}&due_to={self.dates['next_month']}"
+        self.assertEqual(self.texts(query), {'today', 'next_week', 'next_month'})
+
+    def test_upcoming(self):
+        self.assertEqual(self.texts('upcoming=true'), {'today', 'next_week'})
+        self.assertEqual(self.texts('upcoming=0'), {'today'})
+
+    def test_overdue(self):
+        self.assertEqual(self.texts('overdue=true'), {'yesterday'})
+
+    def test_invalid_dates(self):
+        for query in ('due_date=tomorrow', 'due_from=2025-13-01', 'upcoming=-1'):
+            response = self.client.get(f'/v1/tasks?{query}', headers=self.headers)
+            self.assertEqual(response.status_code, 400, query)
+
+
+class TestTaskChanges(ServerTestCase):
+
+    def changes(self, headers, since, **params):
+        response = self.client.get('/v1/tasks/changes', query_string=dict(since=since, **params),
+                                   headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_changes_since_sequence(self):
+        headers = self.register()
+        first = self.create_task(headers, text='first')
+        body = self.changes(headers, 0)
+        self.assertEqual([c['id'] for c in body['changes']], [first['id']])
+        seq = body['seq']
+
+        second = self.create_task(headers, text='second')
+        self.client.put(f"/v1/tasks/{first['id']}", json={'completed': True}, headers=headers)
+        self.client.delete(f"/v1/tasks/{second['id']}", headers=headers)
+
+        body = self.changes(headers, seq)
+        latest = {c['id']: c for c in body['changes']}
+        self.assertTrue(latest[first['id']]['completed'])
+        self.assertTrue(latest[second['id']]['deleted'])
+        self.assertGreater(body['seq'], seq)
+
+        idle = self.changes(headers, body['seq'])
+        self.assertEqual(idle['changes'], [])
+        self.assertEqual(idle['seq'], body['seq'])
+
+    def test_changes_are_paged(self):
+        headers = self.register()
+        for _ in range(5):
+            self.create_task(headers)
+        seq, seen = 0, []
+        while True:
+            body = self.changes(headers, seq, limit=2)
+            seen.extend(c['id'] for c in body['changes'])
+            seq = body['seq']
+            if not body['has_more']:
+                break
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_changes_are_per_user(self):
+        alice = self.register('alice')
+        bob = self.register('bob')
+        self.create_task(alice)
+        self.assertEqual(self.changes(bob, 0)['changes'], [])
+
+    def test_existing_tasks_are_backfilled(self):
+        headers = self.register()
+        with server.app.app_context():
+            db = server.get_db()
+            db.execute("DROP TRIGGER tasks_seq_insert")
+            db.execute("DROP TRIGGER tasks_seq_update")
+            for name in TASK_INDEXES:
+                db.execute(f"DROP INDEX {name}")
+            db.execute("DELETE FROM user_seq")
+            db.execute("ALTER TABLE tasks DROP COLUMN seq")
+            # 回到添加变更序列号之前的版本
+            db.execute("PRAGMA user_version = 1")
+            db.commit()
+        for _ in range(3):
+            self.client.post('/v1/tasks', json={'text': 't', 'category': '工作'}, headers=headers)
+        with server.app.app_context():
+            server.ensure_db_structure()
+        body = self.changes(headers, 0)
+        self.assertEqual(sorted(c['seq'] for c in body['changes']), [1, 2, 3])
+
+
+class TestTaskSearch(ServerTestCase):
+
+    def search(self, headers, query, **params):
+        params['q'] = query
+        response = self.client.get('/v1/tasks/search', query_string=params, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_chinese_search_and_sync(self):
+        headers = self.register()
+        other = self.register('bob')
+        report = self.create_task(headers, text='整理项目周报并发给经理')
+        self.create_task(headers, text='去超市买牛奶')
+        self.create_task(other, text='写项目周报')
+
+        body = self.search(headers, '周报')
+        self.assertEqual([t['id'] for t in body['tasks']], [report['id']])
+        self.assertEqual(len(self.search(headers, '项目')['tasks']), 1)
+
+        # 修改和删除通过触发器同步到索引
+        self.client.put(f"/v1/tasks/{report['id']}", json={'text': '准备季度总结'}, headers=headers)
+        self.assertEqual(self.search(headers, '周报')['tasks'], [])
+        self.assertEqual(len(self.search(headers, '总结')['tasks']), 1)
+        self.client.delete(f"/v1/tasks/{report['id']}", headers=headers)
+        self.assertEqual(self.search(headers, '总结')['tasks'], [])
+
+        response = self.client.get('/v1/tasks/search?q=', headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_ranking_and_pagination(self):
+        headers = self.register()
+        best = self.create_task(headers, text='会议 会议 会议')
+        for i in range(4):
+            self.create_task(headers, text=f'第{i}个会议的议程安排和准备材料')
+
+        body = self.search(headers, '会议', limit=2)
+        self.assertEqual(body['tasks'][0]['id'], best['id'])
+        ids = [t['id'] for t in body['tasks']]
+        while body['next_cursor']:
+            body = self.search(headers, '会议', limit=2, cursor=body['next_cursor'])
+            ids += [t['id'] for t in body['tasks']]
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_pagination_stable_across_other_users_writes(self):
+        headers = self.register()
+        other = self.register('bob')
+        created = {self.create_task(headers, text=f'第{i}个会议' + '的议程' * (i % 4))['id']
+                   for i in range(12)}
+
+        body = self.search(headers, '会议', limit=3)
+        ids = [t['id'] for t in body['tasks']]
+        while body['next_cursor']:
+            # 其他用户的任务改变索引的文档数、平均长度和词频统计
+            for i in range(10):
+                self.create_task(other, text='会议 ' * (i + 1) + '纪要' * (i * 3))
+            body = self.search(headers, '会议', limit=3, cursor=body['next_cursor'])
+            ids += [t['id'] for t in body['tasks']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), created)
+
+
+class TestBatchOperations(ServerTestCase):
+
+    def batch(self, headers, operations):
+        response = self.client.post('/v1/tasks/batch', json={'operations': operations},
+                                    headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_mixed_batch_results(self):
+        headers = self.register()
+        other = self.register('bob')
+        mine = self.create_task(headers, text='mine')
+        removed = self.create_task(headers, text='removed')
+        theirs = self.create_task(other, text='theirs')
+        self.client.delete(f"/v1/tasks/{removed['id']}", headers=headers)
+
+        body = self.batch(headers, [
+            {'type': 'create', 'data': {'text': 'new', 'category': '学习', 'temp_id': 'tmp-1'}},
+            {'type': 'update', 'id': mine['id'], 'data': {'completed': True}},
+            {'type': 'update', 'id': removed['id'], 'data': {'text': 'x'}},
+            {'type': 'delete', 'id': theirs['id']},
+            {'type': 'delete', 'task_id': mine['id']},
+            {'type': 'rename'},
+        ])
+
+        statuses = [r['status'] for r in body['results']]
+        self.assertEqual(statuses, ['ok', 'ok', 'conflict', 'not_found', 'ok', 'invalid'])
+        self.assertFalse(body['success'])
+        self.assertEqual(body['id_mapping'], {'tmp-1': body['results'][0]['id']})
+
+        tasks = self.client.get('/v1/tasks', headers=headers).get_json()['tasks']
+        self.assertEqual([t['text'] for t in tasks], ['new'])
+        theirs_now = self.client.get('/v1/tasks', headers=other).get_json()['tasks']
+        self.assertEqual(len(theirs_now), 1)
+
+    def test_operations_on_same_task_keep_order(self):
+        headers = self.register()
+        task = self.create_task(headers, text='old')
+        other = self.create_task(headers, text='other')
+
+        body = self.batch(headers, [
+            {'type': 'update', 'id': task['id'], 'data': {'text': 'a'}},
+            {'type': 'update', 'id': task['id'], 'data': {'text': 'b', 'completed': True}},
+            {'type': 'update', 'id': task['id'], 'data': {'text': 'c'}},
+            {'type': 'delete', 'id': other['id']},
+            {'type': 'update', 'id': other['id'], 'data': {'text': 'x'}},
+        ])
+        self.assertEqual([r['status'] for r in body['results']],
+                         ['ok', 'ok', 'ok', 'ok', 'conflict'])
+
+        tasks = self.client.get('/v1/tasks', headers=headers).get_json()['tasks']
+        self.assertEqual([(t['text'], t['completed']) for t in tasks], [('c', True)])
+
+    def test_non_scalar_values_are_invalid(self):
+        headers = self.register()
+        task = self.create_task(headers)
+        body = self.batch(headers, [
+            {'type': 'update', 'id': {'x': 1}, 'data': {'text': 'x'}},
+            {'type': 'delete', 'id': [task['id']]},
+            {'type': 'create', 'data': {'text': 'a', 'category': '工作', 'due_date': {'d': 1}}},
+            {'type': 'update', 'id': task['id'], 'data': {'due_time': ['09:00']}},
+            {'type': 'create', 'data': {'text': 'b', 'category': '工作', 'temp_id': ['t']}},
+            {'type': 'update', 'id': task['id'], 'data': {'text': 'ok'}},
+        ])
+        self.assertEqual([r['status'] for r in body['results']],
+                         ['invalid'] * 5 + ['ok'])
+
+    def test_operations_must_be_list(self):
+        headers = self.register()
+        for operations in (5, None, {'type': 'create'}):
+            response = self.client.post('/v1/tasks/batch', json={'operations': operations},
+                                        headers=headers)
+            self.assertEqual(response.status_code, 400)
+
+    def test_idempotent_replay(self):
+        headers = self.register()
+        operations = [
+            {'type': 'create', 'op_id': 'op-1',
+             'data': {'text': 'new', 'category': '学习', 'temp_id': 'tmp-1'}},
+        ]
+        keyed = dict(headers, **{'Idempotency-Key': 'batch-1'})
+        first = self.client.post('/v1/tasks/batch', json={'operations': operations}, headers=keyed)
+        replay = self.client.post('/v1/tasks/batch', json={'operations': operations}, headers=keyed)
+        self.assertEqual(replay.get_json(), first.get_json())
+        self.assertEqual(replay.headers['Idempotent-Replayed'], 'true')
+
+        # 同一个键用于不同内容的请求
+        response = self.client.post('/v1/tasks/batch', json={'operations': []}, headers=keyed)
+        self.assertEqual(response.status_code, 422)
+
+        # 重发时队列中增加了新操作，已处理的op_id不再执行
+        body = self.batch(headers, operations + [
+            {'type': 'create', 'op_id': 'op-2', 'data': {'text': 'more', 'category': '学习'}}])
+        self.assertEqual(body['id_mapping'], first.get_json()['id_mapping'])
+        self.assertEqual(body['results'][0], first.get_json()['results'][0])
+
+        tasks = self.client.get('/v1/tasks', headers=headers).get_json()['tasks']
+        self.assertEqual(sorted(t['text'] for t in tasks), ['more', 'new'])
+
+        # 幂等键按用户隔离
+        other = self.register('bob')
+        body = self.batch(other, operations)
+        self.assertNotEqual(body['id_mapping'], first.get_json()['id_mapping'])
+
+    def test_large_batch(self):
+        headers = self.register()
+        operations = [{'type': 'create', 'data': {'text': f't{i}', 'category': '工作'}}
+                      for i in range(600)]
+        body = self.batch(headers, operations)
+        self.assertTrue(body['success'])
+        ids = [r['id'] for r in body['results']]
+
+        body = self.batch(headers, [{'type': 'update', 'id': task_id, 'data': {'completed': True}}
+                                    for task_id in ids])
+        self.assertTrue(body['success'])
+        response = self.client.get('/v1/tasks?completed=true&limit=500', headers=headers)
+        self.assertEqual(len(response.get_json()['tasks']), 500)
+
+
+class TestPasswordHashing(ServerTestCase):
+
+    def login(self, username='alice'):
+        return self.client.post('/v1/auth/login', json={'username': username, 'password': 'secret'})
+
+    def stored_hash(self, username='alice'):
+        with server.app.app_context():
+            row = server.get_db().execute("SELECT password_hash FROM users WHERE username = ?",
+                                          (username,)).fetchone()
+        return row['password_hash']
+
+    def test_hash_format(self):
+        stored = auth.hash_password('secret')
+        self.assertTrue(stored.startswith(f'pbkdf2_sha256${auth.PASSWORD_ITERATIONS}$'))
+        self.assertTrue(auth.verify_password(stored, 'secret'))
+        self.assertFalse(auth.verify_password(stored, 'wrong'))
+        self.assertFalse(auth.needs_rehash(stored))
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        self.register()
+        salt = os.urandom(32)
+        key = auth._pbkdf2('secret', salt, auth.LEGACY_ITERATIONS)
+        with server.app.app_context():
+            db = server.get_db()
+            db.execute("UPDATE users SET password_hash = ?", (salt.hex() + ':' + key.hex(),))
+            db.commit()
+
+        self.assertEqual(self.login().status_code, 200)
+        self.assertFalse(auth.needs_rehash(self.stored_hash()))
+
+    def test_work_factor_change_rehashes(self):
+        self.register()
+        original = auth.PASSWORD_ITERATIONS
+        auth.PASSWORD_ITERATIONS = 1000
+        try:
+            self.assertEqual(self.login().status_code, 200)
+            self.assertTrue(self.stored_hash().startswith('pbkdf2_sha256$1000$'))
+        finally:
+            auth.PASSWORD_ITERATIONS = original
+
+    def test_full_queue_returns_503(self):
+        self.register()
+        original = auth._hash_slots
+        auth._hash_slots = threading.BoundedSemaphore(1)
+        auth._hash_slots.acquire()
+        try:
+            response = self.login()
+        finally:
+            auth._hash_slots = original
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    @unittest.skipIf(auth.HASH_WORKERS <= 0, "未使用哈希进程池")
+    def test_timeout_returns_503_and_keeps_slot(self):
+        self.register()
+        original = auth._hash_slots, auth.HASH_TIMEOUT
+        auth._hash_slots = slots = threading.BoundedSemaphore(1)
+        auth.HASH_TIMEOUT = 0
+        try:
+            response = self.login()
+            # 超时的哈希仍在进程池中执行，完成前占用排队名额
+            self.assertFalse(slots.acquire(blocking=False))
+            self.assertTrue(slots.acquire(timeout=10))
+        finally:
+            auth._hash_slots, auth.HASH_TIMEOUT = original
+        self.assertEqual(response.status_code, 503)
+
+    def test_busy_rehash_keeps_old_hash(self):
+        self.register()
+        stored = self.stored_hash()
+        original = auth.PASSWORD_ITERATIONS, server.hash_password
+
+        def busy(password):
+            raise auth.HashingBusy("密码哈希队列已满")
+
+        auth.PASSWORD_ITERATIONS, server.hash_password = 1000, busy
+        try:
+            self.assertEqual(self.login().status_code, 200)
+        finally:
+            auth.PASSWORD_ITERATIONS, server.hash_password = original
+        self.assertEqual(self.stored_hash(), stored)
+
+
+class TestTokenCache(ServerTestCase):
+
+    def test_hot_token_hits_cache(self):
+        auth.token_cache.clear()
+        headers = self.register()
+        before = auth.token_cache.stats()
+        for _ in range(3):
+            self.assertEqual(self.client.get('/v1/users/me', headers=headers).status_code, 200)
+        after = auth.token_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 2)
+
+    def test_expired_entries_are_evicted(self):
+        cache = auth.TokenCache(max_size=10, ttl=60)
+        cache.put('token', 'user', time.time() - 1)
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_lru_eviction(self):
+        cache = auth.TokenCache(max_size=2, ttl=60)
+        exp = time.time() + 60
+        cache.put('a', 'user-a', exp)
+        cache.put('b', 'user-b', exp)
+        cache.get('a')
+        cache.put('c', 'user-c', exp)
+        self.assertEqual(cache.get('a'), 'user-a')
+        self.assertIsNone(cache.get('b'))
+
+    def test_invalid_token_not_cached(self):
+        response = self.client.get('/v1/users/me', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(response.status_code, 401)
+        self.assertIsNone(auth.token_cache.get('nope'))
+
+
+class TestUserStats(ServerTestCase):
+
+    def stats(self, headers):
+        response = self.client.get('/v1/users/me', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['stats']
+
+    def test_counters_follow_writes(self):
+        headers = self.register()
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        work = self.create_task(headers, category='工作', due_date=yesterday)
+        study = self.create_task(headers, category='学习', due_date=yesterday)
+        self.create_task(headers, category='学习', completed=True)
+
+        stats = self.stats(headers)
+        self.assertEqual((stats['total_tasks'], stats['completed_tasks'], stats['overdue_tasks']),
+                         (3, 1, 2))
+        self.assertEqual(stats['categories']['学习'], {'total': 2, 'completed': 1})
+
+        self.client.put(f"/v1/tasks/{work['id']}", json={'completed': True, 'category': '生活'},
+                        headers=headers)
+        self.client.delete(f"/v1/tasks/{study['id']}", headers=headers)
+        self.client.post('/v1/tasks/batch', headers=headers, json={'operations': [
+            {'type': 'create', 'data': {'text': 'b', 'category': '工作', 'due_date': yesterday}},
+        ]})
+
+        stats = self.stats(headers)
+        self.assertEqual((stats['total_tasks'], stats['completed_tasks'], stats['overdue_tasks']),
+                         (3, 2, 1))
+        self.assertEqual(stats['categories']['生活'], {'total': 1, 'completed': 1})
+        self.assertEqual(stats['categories']['学习'], {'total': 1, 'completed': 1})
+
+        with server.app.app_context():
+            db = server.get_db()
+            rebuild_user_stats(db)
+            db.commit()
+        self.assertEqual(self.stats(headers), stats)
+
+    def test_stats_for_new_user(self):
+        headers = self.register()
+        stats = self.stats(headers)
+        self.assertEqual(stats, {'total_tasks': 0, 'completed_tasks': 0, 'overdue_tasks': 0,
+                                 'categories': {}})
+
+
+class TestAnalytics(ServerTestCase):
+
+    def get(self, headers, path, **params):
+        response = self.client.get(f'/v1/analytics/{path}', query_string=params, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_rollups_follow_writes(self):
+        headers = self.register()
+        today = datetime.date.today()
+        work = self.create_task(headers, category='工作')
+        study = self.create_task(headers, category='学习')
+        self.create_task(headers, category='学习', completed=True)
+        self.client.put(f"/v1/tasks/{work['id']}", json={'completed': True}, headers=headers)
+        self.client.delete(f"/v1/tasks/{study['id']}", headers=headers)
+
+        body = self.get(headers, 'activity', granularity='day')
+        self.assertEqual(len(body['buckets']), 30)
+        self.assertEqual(body['buckets'][-1],
+                         {'start': today.isoformat(), 'created': 2, 'completed': 2,
+                          'completion_rate': 100.0})
+
+        week = self.get(headers, 'activity', granularity='week')['buckets']
+        self.assertEqual(sum(b['created'] for b in week), 2)
+        self.assertEqual(datetime.date.fromisoformat(week[-1]['start']).weekday(), 0)
+
+        categories = self.get(headers, 'categories', **{'from': today.isoformat()})['categories']
+        self.assertEqual({c['category']: (c['total'], c['completed']) for c in categories},
+                         {'工作': (1, 1), '学习': (1, 1)})
+        self.assertIsNotNone(categories[0]['avg_completion_days'])
+
+        hours = self.get(headers, 'productivity')['hours']
+        self.assertEqual(sum(hours), 2)
+
+        # 增量维护的结果与重新计算一致
+        with server.app.app_context():
+            db = server.get_db()
+            before = [tuple(r) for r in db.execute("SELECT * FROM user_daily_stats WHERE created > 0")]
+            rebuild_analytics(db)
+            after = [tuple(r) for r in db.execute("SELECT * FROM user_daily_stats")]
+        self.assertEqual(sorted(before), sorted(after))
+
+    def test_dashboard_stats(self):
+        headers = self.register()
+        day = datetime.date(2025, 3, 12)  # 周三
+        self.create_task(headers, due_date='2025-03-12')
+        self.create_task(headers, due_date='2025-03-12', completed=True)
+        self.create_task(headers, due_date='2025-03-16')
+        self.create_task(headers, due_date='2025-03-17')
+        self.create_task(headers, due_date='2025-03-01')
+        self.create_task(headers, completed=True)
+
+        response = self.client.get('/v1/stats', query_string={'date': day.isoformat()},
+                                   headers=headers)
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['total_tasks'], 6)
+        self.assertEqual(body['completed_tasks'], 2)
+        self.assertEqual(body['overdue_tasks'], 1)
+        self.assertEqual(body['due_today'], 1)
+        self.assertEqual(body['due_this_week'], 2)
+        self.assertEqual(body['completion_rate_last_30_days'], 33.3)
+        # 完成时间为今天（服务器日期），不在2025-03-12之前的7天内
+        self.assertEqual(body['completed_last_7_days'], 0)
+        today = self.client.get('/v1/stats', headers=headers).get_json()
+        self.assertEqual(today['completed_last_7_days'], 2)
+
+        response = self.client.get('/v1/stats?date=2025-13-01', headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_range(self):
+        headers = self.register()
+        response = self.client.get('/v1/analytics/activity?from=2025-02-01&to=2025-01-01',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/v1/analytics/activity?granularity=year', headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+
+class TestMaintenance(ServerTestCase):
+
+    def changes(self, headers, since, client_id):
+        return self.client.get(f'/v1/tasks/changes?since={since}',
+                               headers=dict(headers, **{'X-Client-Id': client_id}))
+
+    def test_purge_waits_for_active_clients(self):
+        headers = self.register()
+        kept = self.create_task(headers)
+        gone = self.create_task(headers)
+        seq = self.changes(headers, 0, 'laptop').get_json()['seq']
+        self.client.delete(f"/v1/tasks/{gone['id']}", headers=headers)
+
+        with server.app.app_context():
+            db = server.get_db()
+            db.execute("UPDATE tasks SET deleted_at = '2000-01-01T00:00:00' WHERE deleted = 1")
+            db.commit()
+            # laptop还没有同步到删除记录
+            self.assertEqual(maintenance.purge_tombstones(db), 0)
+
+        latest = self.changes(headers, seq, 'laptop').get_json()['seq']
+        self.changes(headers, latest, 'laptop')
+        with server.app.app_context():
+            self.assertEqual(maintenance.purge_tombstones(server.get_db()), 1)
+
+        # 从清理之前的序列号同步需要重新全量同步，从0开始同步不受影响
+        response = self.changes(headers, seq, 'phone')
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.get_json()['reset'])
+        changes = self.changes(headers, 0, 'phone').get_json()['changes']
+        self.assertEqual([c['id'] for c in changes], [kept['id']])
+
+    def test_archive_completed_tasks(self):
+        headers = self.register()
+        old = self.create_task(headers, completed=True)
+        self.create_task(headers, completed=True)
+        self.create_task(headers)
+        with server.app.app_context():
+            db = server.get_db()
+            db.execute("UPDATE tasks SET completed_at = '2020-01-01T09:00:00' WHERE id = ?",
+                       (old['id'],))
+            db.commit()
+        etag = self.client.get('/v1/tasks', headers=headers).headers['ETag']
+        seq = self.changes(headers, 0, 'laptop').get_json()['seq']
+
+        published = []
+        with server.app.app_context():
+            db = server.get_db()
+            daily = sorted(tuple(r) for r in db.execute("SELECT * FROM user_daily_stats"))
+            self.assertEqual(maintenance.archive_completed_tasks(db, on_archived=published.extend), 1)
+            # 归档的任务仍计入统计分析，与重新计算的结果一致
+            self.assertEqual(sorted(tuple(r) for r in db.execute("SELECT * FROM user_daily_stats")),
+                             daily)
+            rebuild_analytics(db)
+            self.assertEqual(sorted(tuple(r) for r in db.execute("SELECT * FROM user_daily_stats")),
+                             daily)
+
+        response = self.client.get('/v1/tasks', headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['tasks']), 2)
+
+        archived = self.client.get('/v1/tasks/archive', headers=headers).get_json()
+        self.assertEqual([t['id'] for t in archived['tasks']], [old['id']])
+        self.assertTrue(archived['tasks'][0]['completed'])
+        self.assertIsNotNone(archived['tasks'][0]['archived_at'])
+        self.assertIsNone(archived['next_cursor'])
+
+        # 归档在增量同步中作为删除返回
+        body = self.changes(headers, seq, 'laptop').get_json()
+        self.assertEqual([(c['id'], c['deleted'], c.get('archived')) for c in body['changes']],
+                         [(old['id'], True, True)])
+        self.assertEqual(body['seq'], seq + 1)
+        self.assertEqual([row['id'] for row in published], [old['id']])
+
+        # 升级前归档的任务没有序列号，之前同步过的客户端需要重新同步
+        with server.app.app_context():
+            db = server.get_db()
+            db.execute("UPDATE tasks_archive SET seq = 0")
+            db.execute("PRAGMA user_version = 8")
+            db.commit()
+            migrations.migrate(db)
+        self.assertEqual(self.changes(headers, seq + 1, 'laptop').status_code, 410)
+
+    def test_incremental_vacuum(self):
+        headers = self.register()
+        for _ in range(20):
+            self.create_task(headers, text='x' * 2000)
+        with server.app.app_context():
+            db = server.get_db()
+            self.assertEqual(db.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+            db.execute("DELETE FROM tasks")
+            db.commit()
+            self.assertGreater(maintenance.incremental_vacuum(db), 0)
+            self.assertEqual(db.execute("PRAGMA freelist_count").fetchone()[0], 0)
+
+
+class TestGroupCommit(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.writer = group_commit.GroupCommitWriter(server.get_pool, window=20)
+        server.group_writer = self.writer
+
+    def tearDown(self):
+        server.group_writer = None
+        super().tearDown()
+
+    def test_concurrent_writes_share_transactions(self):
+        headers = self.register()
+        errors = []
+
+        def create(n):
+            client = server.app.test_client()
+            for i in range(5):
+                response = client.post('/v1/tasks', headers=headers,
+                                       json={'text': f'任务{n}-{i}', 'category': '工作'})
+                if response.status_code != 201:
+                    errors.append(response.status_code)
+
+        threads = [threading.Thread(target=create, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        tasks = self.client.get('/v1/tasks?limit=100', headers=headers).get_json()['tasks']
+        self.assertEqual(len(tasks), 40)
+        stats = self.writer.stats()
+        self.assertEqual(stats['operations'], 40)
+        self.assertLess(stats['transactions'], 40)
+
+    def test_update_and_delete(self):
+        headers = self.register()
+        other = self.register('bob')
+        task = self.create_task(headers)
+
+        response = self.client.put(f"/v1/tasks/{task['id']}", headers=other, json={'completed': True})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.put(f"/v1/tasks/{task['id']}", headers=headers, json={'completed': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['completed'])
+        response = self.client.put(f"/v1/tasks/{task['id']}", headers=headers, json={'color': 'red'})
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.client.delete(f"/v1/tasks/{task['id']}", headers=headers).status_code, 200)
+        self.assertEqual(self.client.delete(f"/v1/tasks/{task['id']}", headers=headers).status_code, 404)
+
+    def test_locked_database_returns_503(self):
+        headers = self.register()
+        server.close_pool()
+        server._pool = ConnectionPool(server.DATABASE, busy_timeout=50,
+                                      on_connect=server.register_functions)
+        blocker = sqlite3.connect(server.DATABASE)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            for writer in (self.writer, None):
+                server.group_writer = writer
+                response = self.client.post('/v1/tasks', headers=headers,
+                                            json={'text': 't', 'category': '工作'})
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.headers['Retry-After'], '1')
+        finally:
+            blocker.rollback()
+            blocker.close()
+
+    def test_failed_operation_is_isolated(self):
+        results = {}
+
+        def submit(name, operation):
+            try:
+                results[name] = self.writer.submit(operation)
+            except Exception as e:
+                results[name] = e
+
+        def good(conn):
+            conn.execute("INSERT INTO maintenance_state (name, value) VALUES ('good', '1')")
+            return 'ok'
+
+        def bad(conn):
+            conn.execute("INSERT INTO maintenance_state (name, value) VALUES ('bad', '1')")
+            raise ValueError('失败')
+
+        threads = [threading.Thread(target=submit, args=args)
+                   for args in (('good', good), ('bad', bad))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results['good'], 'ok')
+        self.assertIsInstance(results['bad'], ValueError)
+        with server.app.app_context():
+            names = {row[0] for row in server.get_db().execute("SELECT name FROM maintenance_state")}
+        self.assertIn('good', names)
+        self.assertNotIn('bad', names)
+
+
+class TestMetrics(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.metrics.reset()
+
+    def scrape(self):
+        response = self.client.get('/v1/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.get_data(as_text=True).splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_request_metrics(self):
+        headers = self.register()
+        self.create_task(headers)
+        self.client.get('/v1/tasks', headers=headers)
+        self.client.get('/v1/tasks', headers=headers)
+        self.client.post('/v1/tasks/batch', headers=headers, json={'operations': [
+            {'type': 'create', 'data': {'text': 'a', 'category': '工作'}},
+            {'type': 'create', 'data': {'text': 'b', 'category': '工作'}},
+        ]})
+
+        samples = self.scrape()
+        labels = '{route="/v1/tasks",method="GET",status="200"}'
+        self.assertEqual(samples[f'todo_http_request_duration_seconds_count{labels}'], 2)
+        self.assertEqual(samples['todo_http_request_duration_seconds_bucket'
+                                 '{route="/v1/tasks",method="GET",status="200",le="+Inf"}'], 2)
+        self.assertGreater(samples['todo_http_db_queries_total{route="/v1/tasks"}'], 0)
+        self.assertGreater(samples['todo_http_db_seconds_total{route="/v1/tasks"}'], 0)
+        self.assertEqual(samples['todo_batch_operations_count'], 1)
+        self.assertEqual(samples['todo_batch_operations_sum'], 2)
+        self.assertEqual(samples['todo_batch_operations_bucket{le="5.0"}'], 1)
+        self.assertEqual(samples['todo_http_requests_in_flight'], 1)
+        self.assertIn('todo_token_cache_requests_total{result="hit"}', samples)
+
+    def test_snapshot_while_recording_new_routes(self):
+        registry = metrics.Metrics()
+        registry.request_finished('/', 'GET', 200, 0.001, 0.0005, 1)
+
+        def record():
+            for i in range(20000):
+                registry.request_finished(f'/route/{i}', 'GET', 200, 0.001, 0.0005, 1)
+
+        thread = threading.Thread(target=record)
+        thread.start()
+        while thread.is_alive():
+            registry.snapshot()
+        thread.join()
+        self.assertEqual(len(registry.snapshot().durations), 20001)
+
+    def test_routes_are_labelled_by_rule(self):
+        self.client.get('/v1/nope')
+        self.client.get('/v1/other')
+        self.client.patch('/v1/ping')
+        samples = self.scrape()
+        # 按路由规则统计，任意路径不会产生新的标签
+        self.assertEqual(samples['todo_http_request_duration_seconds_count'
+                                 '{route="/<path:path>",method="GET",status="200"}'], 2)
+        self.assertIn('todo_http_request_duration_seconds_count'
+                      '{route="unmatched",method="PATCH",status="405"}', samples)
+
+
+class TestProfiler(ServerTestCase):
+
+    def test_disabled_by_default(self):
+        self.assertFalse(profiler.SamplingProfiler(sample_rate=0, admin_token=None).enabled)
+        hooks = [f.__name__ for f in server.app.before_request_funcs.get(None, [])]
+        self.assertNotIn('start_profile', hooks)
+
+    def test_profiles_sampled_requests(self):
+        app = server.Flask('profiled')
+        sampler = profiler.SamplingProfiler(sample_rate=2, interval=0.001, history=2,
+                                            admin_token='secret')
+        profiler.install(app, sampler)
+
+        @app.route('/slow')
+        def slow():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+            return 'ok'
+
+        client = app.test_client()
+        self.assertNotIn('X-Profile-Id', client.get('/slow').headers)
+        self.assertIn('X-Profile-Id', client.get('/slow').headers)
+        forced = client.get('/slow', headers={profiler.PROFILE_HEADER: 'secret'})
+        self.assertIn('X-Profile-Id', forced.headers)
+
+        profile = sampler.get(int(forced.headers['X-Profile-Id']))
+        self.assertEqual((profile.route, profile.status), ('/slow', 200))
+        self.assertIn('slow (test_server.py', profile.collapsed())
+        self.assertGreater(profile.summary()['samples'], 0)
+
+        client.get('/slow')
+        client.get('/slow')
+        self.assertEqual(len(sampler.profiles), 2)
+
+    def test_admin_endpoints(self):
+        original = server.profiler
+        server.profiler = profiler.SamplingProfiler(sample_rate=0, admin_token='secret')
+        try:
+            profile = server.profiler.start('GET', '/v1/tasks', '/v1/tasks')
+            time.sleep(0.01)
+            server.profiler.stop(profile)
+
+            self.assertEqual(self.client.get('/v1/admin/profiles').status_code, 401)
+            admin = {'Authorization': 'Bearer secret'}
+            listed = self.client.get('/v1/admin/profiles', headers=admin).get_json()['profiles']
+            self.assertEqual([p['id'] for p in listed], [profile.id])
+
+            response = self.client.get(f'/v1/admin/profiles/{profile.id}', headers=admin)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('attachment', response.headers['Content-Disposition'])
+            self.assertEqual(self.client.get('/v1/admin/profiles/999', headers=admin).status_code,
+                             404)
+        finally:
+            server.profiler = original
+
+
+class TestConditionalRequests(ServerTestCase):
+
+    def test_task_list_etag(self):
+        headers = self.register()
+        self.create_task(headers)
+        first = self.client.get('/v1/tasks', headers=headers)
+        etag = first.headers['ETag']
+        self.assertTrue(etag)
+
+        conditional = dict(headers, **{'If-None-Match': etag})
+        response = self.client.get('/v1/tasks', headers=conditional)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        other_query = self.client.get('/v1/tasks?completed=true', headers=conditional)
+        self.assertEqual(other_query.status_code, 200)
+
+        self.create_task(headers)
+        response = self.client.get('/v1/tasks', headers=conditional)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['tasks']), 2)
+
+    def test_profile_etag(self):
+        headers = self.register()
+        etag = self.client.get('/v1/users/me', headers=headers).headers['ETag']
+        conditional = dict(headers, **{'If-None-Match': etag})
+        self.assertEqual(self.client.get('/v1/users/me', headers=conditional).status_code, 304)
+
+        self.create_task(headers)
+        self.assertEqual(self.client.get('/v1/users/me', headers=conditional).status_code, 200)
+
+
+class TestEventStream(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.original_keepalive = server.EVENT_KEEPALIVE
+        server.EVENT_KEEPALIVE = 0.05
+
+    def tearDown(self):
+        server.EVENT_KEEPALIVE = self.original_keepalive
+        super().tearDown()
+
+    def open_stream(self, headers, **extra):
+        response = self.client.get('/v1/events', headers=dict(headers, **extra), buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        return response
+
+    def next_event(self, stream):
+        for _ in range(20):
+            chunk = next(stream).decode('utf-8')
+            if chunk.startswith('id:'):
+                return chunk
+        self.fail('没有收到事件')
+
+    def test_live_events(self):
+        headers = self.register()
+        response = self.open_stream(headers)
+        stream = iter(response.response)
+        self.assertEqual(next(stream), b'retry: 3000\n\n')
+
+        task = self.create_task(headers)
+        chunk = self.next_event(stream)
+        self.assertIn('event: task.created', chunk)
+        self.assertIn(task['id'], chunk)
+
+        self.client.delete(f"/v1/tasks/{task['id']}", headers=headers)
+        self.assertIn('event: task.deleted', self.next_event(stream))
+        response.close()
+        self.assertEqual(events.broker.connection_count(), 0)
+
+    def test_resume_from_last_event_id(self):
+        headers = self.register()
+        first = self.create_task(headers, text='first')
+        second = self.create_task(headers, text='second')
+        seq = self.client.get('/v1/tasks/changes?since=0', headers=headers).get_json()
+        first_seq = [c['seq'] for c in seq['changes'] if c['id'] == first['id']][0]
+
+        response = self.open_stream(headers, **{'Last-Event-ID': str(first_seq)})
+        stream = iter(response.response)
+        chunk = self.next_event(stream)
+        self.assertIn(second['id'], chunk)
+        self.assertNotIn(first['id'], chunk)
+        response.close()
+
+    def test_token_query_parameter(self):
+        headers = self.register()
+        token = headers['Authorization'].split(' ')[1]
+        response = self.client.get(f'/v1/events?access_token={token}', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(self.client.get('/v1/events').status_code, 401)
+
+    def test_stream_limit(self):
+        headers = self.register()
+        original = server.max_event_streams
+        server.max_event_streams = 1
+        try:
+            response = self.open_stream(headers)
+            busy = self.client.get('/v1/events', headers=headers)
+            self.assertEqual(busy.status_code, 503)
+            self.assertEqual(busy.headers['Retry-After'], '1')
+            response.close()
+            self.assertEqual(self.client.get('/v1/events', headers=headers,
+                                             buffered=False).status_code, 200)
+        finally:
+            server.max_event_streams = original
+
+    def test_finish_all_ends_streams(self):
+        headers = self.register()
+        original = server.broker
+        server.broker = events.EventBroker()
+        try:
+            response = self.open_stream(headers)
+            stream = iter(response.response)
+            self.assertEqual(next(stream), b'retry: 3000\n\n')
+            server.broker.finish_all()
+            self.assertEqual(list(stream), [])
+            self.assertEqual(server.broker.connection_count(), 0)
+            # 平滑退出期间新建的连接同样立即结束
+            self.assertEqual(list(self.open_stream(headers).response), [b'retry: 3000\n\n'])
+        finally:
+            server.broker = original
+
+    def test_poll_changes_written_by_other_processes(self):
+        headers = self.register()
+        task = self.create_task(headers)
+        original = server.event_poller
+        server.event_poller = events.EventPoller(server.broker, server.fetch_event_changes,
+                                                 interval=0.05)
+        try:
+            response = self.open_stream(headers)
+            stream = iter(response.response)
+            # 其他进程的写入不经过本进程的EventBroker
+            conn = ConnectionPool(server.DATABASE, on_connect=server.register_functions).connect()
+            conn.execute("UPDATE tasks SET text = '改写周报' WHERE id = ?", (task['id'],))
+            conn.commit()
+            conn.close()
+            chunk = self.next_event(stream)
+            self.assertIn('event: task.updated', chunk)
+            self.assertIn('改写周报', chunk)
+
+            # 本进程的写入唤醒轮询线程，不再直接发布
+            created = self.create_task(headers, text='second')
+            self.assertIn(created['id'], self.next_event(stream))
+            response.close()
+        finally:
+            server.event_poller = original
+
+
+class TestASGIApp(ServerTestCase):
+
+    async def call(self, app, method, path, body=None, headers=None, query=b''):
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        raw_headers = [(b'content-type', b'application/json')]
+        raw_headers += [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+                 'headers': raw_headers, 'http_version': '1.1', 'scheme': 'http',
+                 'server': ('testserver', 80)}
+        messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        status = sent[0]['status']
+        body = b''.join(m.get('body', b'') for m in sent[1:])
+        return status, json.loads(body) if body else None
+
+    def test_routes_and_contracts(self):
+        import asgi
+        app = asgi.ASGIApp(server.app, workers=2)
+
+        async def scenario():
+            status, body = await self.call(app, 'POST', '/v1/auth/register', {
+                'username': 'alice', 'email': 'alice@example.com', 'password': 'secret'})
+            self.assertEqual(status, 201)
+            headers = {'Authorization': f"Bearer {body['token']}"}
+
+            status, task = await self.call(app, 'POST', '/v1/tasks',
+                                           {'text': '写周报', 'category': '工作'}, headers)
+            self.assertEqual(status, 201)
+            status, body = await self.call(app, 'GET', '/v1/tasks', headers=headers,
+                                           query=b'sort=due_date')
+            self.assertEqual(status, 200)
+            self.assertEqual([t['id'] for t in body['tasks']], [task['id']])
+
+            status, body = await self.call(app, 'GET', '/v1/tasks')
+            self.assertEqual(status, 401)
+
+        asyncio.run(scenario())
+        app.executor.shutdown()
+
+    def test_event_stream(self):
+        import asgi
+        app = asgi.ASGIApp(server.app, workers=2)
+        headers = self.register()
+        chunks = []
+
+        async def scenario():
+            got_event = asyncio.Event()
+            disconnect = asyncio.Event()
+            scope = {'type': 'http', 'method': 'GET', 'path': '/v1/events', 'query_string': b'',
+                     'headers': [(b'authorization', headers['Authorization'].encode())]}
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                chunks.append(message)
+                if b'event: task.created' in message.get('body', b''):
+                    got_event.set()
+
+            stream = asyncio.ensure_future(app(scope, receive, send))
+            await asyncio.sleep(0.1)
+            self.assertEqual(events.broker.connection_count(), 1)
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, lambda: self.create_task(headers))
+            await asyncio.wait_for(got_event.wait(), 5)
+
+            disconnect.set()
+            await asyncio.wait_for(stream, 5)
+
+        asyncio.run(scenario())
+        app.executor.shutdown()
+        self.assertEqual(chunks[0]['status'], 200)
+        self.assertEqual(events.broker.connection_count(), 0)
+
+
+class TestCompression(ServerTestCase):
+
+    def test_json_compressed_above_threshold(self):
+        import gzip
+        headers = self.register()
+        for i in range(30):
+            self.create_task(headers, text=f'任务{i}')
+
+        plain = self.client.get('/v1/tasks', headers=headers)
+        self.assertNotIn('Content-Encoding', plain.headers)
+
+        response = self.client.get('/v1/tasks', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.data)), plain.get_json())
+
+        # 小响应不压缩
+        response = self.client.get('/v1/ping', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_static_files_precompressed(self):
+        import gzip
+        path = os.path.join(server.app.static_folder, 'js', 'dashboard.js')
+        with open(path, 'rb') as f:
+            original = f.read()
+
+        response = self.client.get('/static/js/dashboard.js', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data), original)
+
+        response = self.client.get('/static/js/dashboard.js',
+                                   headers={'Accept-Encoding': 'gzip',
+                                            'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/static/js/dashboard.js', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, original)
+
+    def test_negotiate(self):
+        from compression import negotiate
+        self.assertEqual(negotiate('gzip, br', ('br', 'gzip')), 'br')
+        self.assertEqual(negotiate('gzip;q=1, br;q=0.5', ('br', 'gzip')), 'gzip')
+        self.assertEqual(negotiate('*', ('gzip',)), 'gzip')
+        self.assertIsNone(negotiate('identity', ('br', 'gzip')))
+        self.assertIsNone(negotiate('', ('gzip',)))
+
+
+class TestStaticAssets(ServerTestCase):
+
+    def test_fingerprinted_references(self):
+        import re
+        response = self.client.get('/dashboard.html')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        html = response.get_data(as_text=True)
+        match = re.search(r'src="(static/js/dashboard\.[0-9a-f]{12}\.js)"', html)
+        self.assertIsNotNone(match)
+        # 不存在的文件保持原引用
+        self.assertIn('static/img/app-qr.png', html)
+
+        asset = self.client.get('/' + match.group(1))
+        self.assertEqual(asset.status_code, 200)
+        self.assertIn('immutable', asset.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', asset.headers['Cache-Control'])
+        self.assertEqual(asset.data, self.client.get('/static/js/dashboard.js').data)
+
+        response = self.client.get('/dashboard.html',
+                                   headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+ASGI_MAIN_SCRIPT = """
+import json, runpy, sys, types
+server_py = sys.argv[1]
+sys.path.insert(0, sys.argv[2])
+
+def run(app, host, port):
+    main = sys.modules['__main__']
+    print(json.dumps({
+        'same_module': sys.modules['server'] is main,
+        'same_app': app.wsgi_app is main.app,
+        'scheduler': main.maintenance_scheduler is not None,
+    }))
+
+sys.modules['uvicorn'] = types.SimpleNamespace(run=run)
+sys.argv = [server_py, '--server', 'asgi']
+runpy.run_path(server_py, run_name='__main__')
+"""
+
+
+class TestASGIMain(ServerTestCase):
+
+    def test_main_serves_the_running_module(self):
+        import subprocess
+        server_dir = os.path.join(os.path.dirname(__file__), '..', 'todolist', 'server')
+        runner = os.path.join(self.tmpdir.name, 'run_asgi.py')
+        with open(runner, 'w', encoding='utf-8') as f:
+            f.write(ASGI_MAIN_SCRIPT)
+        result = subprocess.run([sys.executable, runner, os.path.join(server_dir, 'server.py'),
+                                 server_dir],
+                                env=dict(os.environ, TODO_DATABASE=server.DATABASE),
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        state = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertEqual(state, {'same_module': True, 'same_app': True, 'scheduler': True})
+
+
+PREFORK_SCRIPT = """
+import os, sys
+sys.path.insert(0, sys.argv[1])
+from prefork import PreforkServer
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+
+PreforkServer(app, host='127.0.0.1', port=int(sys.argv[2]), workers=2, threads=2,
+              max_requests=3, graceful_timeout=5).run()
+"""
+
+
+class TestPreforkServer(unittest.TestCase):
+
+    def get(self, port):
+        import urllib.request
+        deadline = time.time() + 10
+        while True:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5) as response:
+                    return int(response.read())
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def test_workers_recycle_reload_and_stop(self):
+        import signal
+        import socket
+        import subprocess
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        server_dir = os.path.join(os.path.dirname(__file__), '..', 'todolist', 'server')
+        master = subprocess.Popen([sys.executable, '-c', PREFORK_SCRIPT, server_dir, str(port)],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            # 2个worker各处理3个请求后被回收，之后的请求由新worker处理
+            pids = [self.get(port) for _ in range(12)]
+            self.assertNotIn(master.pid, pids)
+            self.assertGreater(len(set(pids)), 2)
+
+            before = set(pids[-2:])
+            master.send_signal(signal.SIGHUP)
+            time.sleep(1.5)
+            after = {self.get(port) for _ in range(2)}
+            self.assertFalse(before & after)
+        finally:
+            master.send_signal(signal.SIGTERM)
+            self.assertEqual(master.wait(timeout=10), 0)
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_report(self):
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+        import load_test
+
+        report = load_test.run(load_test.parse_args([
+            '--users', '2', '--tasks', '20', '--clients', '2', '--requests', '15',
+            '--batch-size', '5', '--mix', 'list=1,create=1,toggle=1,batch=1'
+        ]))
+        self.assertEqual(report['total_errors'], 0)
+        # 每个客户端先登录并查询一次列表
+        self.assertEqual(report['total_requests'], 2 * (2 + 15))
+        self.assertEqual(set(report['endpoints']), {'login', 'list', 'create', 'toggle', 'batch'})
+        for endpoint in report['endpoints'].values():
+            self.assertLessEqual(endpoint['p50_ms'], endpoint['p95_ms'])
+            self.assertLessEqual(endpoint['p95_ms'], endpoint['p99_ms'])
+            self.assertLessEqual(endpoint['p99_ms'], endpoint['max_ms'])
+
+
+if __name__ == '__main__':
+    unittest.main()
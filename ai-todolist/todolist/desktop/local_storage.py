@@ -11,7 +11,11 @@ class LocalStorage:
         self.file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_path)
         self.pending_operations = []
         self.tasks = {}
+        self.sync_seq = 0  # 已同步到的服务器变更序列号
+        self.client_id = None  # 本设备的标识，服务器据此判断删除记录能否清理
         self.load_data()
+        if not self.client_id:
+            self.client_id = str(uuid.uuid4())
     
     def load_data(self):
         """加载本地数据"""
@@ -21,6 +25,8 @@ class LocalStorage:
                     data = json.load(f)
                     self.pending_operations = data.get('operations', [])  # 注意这里的键名应与save_data一致
                     self.tasks = data.get('tasks', {})
+                    self.sync_seq = data.get('sync_seq', 0)
+                    self.client_id = data.get('client_id')
                     
                     print(f"加载了 {len(self.tasks)} 个任务和 {len(self.pending_operations)} 个待处理操作")
                     
@@ -48,7 +54,9 @@ class LocalStorage:
             # 序列化任务数据
             serialized_data = {
                 "tasks": self.tasks,
-                "operations": self.pending_operations
+                "operations": self.pending_operations,
+                "sync_seq": self.sync_seq,
+                "client_id": self.client_id
             }
             
             # 使用临时文件确保写入完整性
@@ -115,6 +123,31 @@ class LocalStorage:
             del self.tasks[task_id]
             self.save_data()
     
+    def apply_changes(self, changes, seq):
+        """应用服务器返回的增量变更，并记录新的序列号，只写一次文件"""
+        for task in changes:
+            task = dict(task)
+            deleted = task.pop('deleted', False)
+            task.pop('seq', None)
+            if deleted:
+                self.tasks.pop(task['id'], None)
+            else:
+                self.tasks[task['id']] = task
+        self.sync_seq = seq
+        return self.save_data()
+    
+    def replace_tasks(self, tasks, seq):
+        """服务器要求重新同步时，用全量任务替换本地任务
+
+        有待同步操作的任务保留本地版本，避免丢失尚未提交的修改。
+        """
+        pending_ids = {op.get('task_id') for op in self.pending_operations}
+        kept = {task_id: task for task_id, task in self.tasks.items() if task_id in pending_ids}
+        self.tasks = {task['id']: task for task in tasks}
+        self.tasks.update(kept)
+        self.sync_seq = seq
+        return self.save_data()
+    
     def get_all_tasks(self):
         """获取所有本地存储的任务"""
         return list(self.tasks.values())
\ No newline at end of file
@@ -6,6 +6,7 @@ import threading
 from .local_storage import LocalStorage
 import logging
 import uuid
+import hashlib
 
 class NetworkManager:
     """负责与服务器通信的模块"""
@@ -30,6 +31,9 @@ class NetworkManager:
         # 添加本地存储
         self.local_storage = LocalStorage()
         
+        # 服务器按设备记录同步进度
+        self.headers["X-Client-Id"] = self.local_storage.client_id
+        
         # 连接状态
         self.is_online = True
         self.connection_check_interval = 30  # 多久检查一次连接 (秒)
@@ -76,23 +80,24 @@ class NetworkManager:
             self._check_connection()
             time.sleep(self.connection_check_interval)
     
-    def _make_request(self, method, endpoint, data=None, params=None):
+    def _make_request(self, method, endpoint, data=None, params=None, extra_headers=None):
         """执行HTTP请求并处理可能的错误"""
         if not self.is_online:
             return {"success": False, "error": "当前处于离线模式"}
         
         url = f"{self.base_url}/{endpoint}"
+        headers = {**self.headers, **extra_headers} if extra_headers else self.headers
         print(f"data: {data}")  # 调试信息
         try:
             # 将超时时间从10秒减少到5秒
             if method.lower() == "get":
-                response = requests.get(url, headers=self.headers, params=params, timeout=5)
+                response = requests.get(url, headers=headers, params=params, timeout=5)
             elif method.lower() == "post":
-                response = requests.post(url, headers=self.headers, json=data, timeout=5)
+                response = requests.post(url, headers=headers, json=data, timeout=5)
             elif method.lower() == "put":
-                response = requests.put(url, headers=self.headers, json=data, timeout=5)
+                response = requests.put(url, headers=headers, json=data, timeout=5)
             elif method.lower() == "delete":
-                response = requests.delete(url, headers=self.headers, timeout=5)
+                response = requests.delete(url, headers=headers, timeout=5)
             else:
                 return {"success": False, "error": "不支持的HTTP方法"}
             
@@ -108,6 +113,7 @@ class NetworkManager:
                 return {
                     "success": False,
                     "error": f"服务器错误 ({response.status_code})",
+                    "status": response.status_code,
                     "details": response.text
                 }
             
@@ -199,7 +205,8 @@ class NetworkManager:
                 "type": "update",
                 "task_id": task_id,
                 "data": update_data,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now().isoformat(),
+                "op_id": str(uuid.uuid4())
             }
             self.sync_queue.append(operation)
             self.local_storage.add_operation(operation)
@@ -213,12 +220,19 @@ class NetworkManager:
     def get_tasks(self, filters=None):
         """获取任务列表"""
         if self.is_online:
-            result = self._make_request("get", "tasks", params=filters)
-            if result["success"]:
-                # 同时更新本地缓存
-                for task in result["data"].get("tasks", []):
-                    self.local_storage.update_task(task["id"], task)
-                return result
+            if not filters:
+                # 没有过滤条件时只拉取增量变更
+                result = self._fetch_changes()
+                if result["success"]:
+                    return {"success": True, "data": {"tasks": self.local_storage.get_all_tasks()}}
+            else:
+                result = self._fetch_all_pages(filters)
+                if result["success"]:
+                    # 同时更新本地缓存
+                    for task in result["data"].get("tasks", []):
+                        self.local_storage.tasks[task["id"]] = task
+                    self.local_storage.save_data()
+                    return result
         
         # 如果在线请求失败或者处于离线模式，使用本地存储
         self.logger.info("使用本地数据获取任务")
@@ -236,6 +250,52 @@ class NetworkManager:
         
         return {"success": True, "data": {"tasks": tasks}}
     
+    def _fetch_changes(self, page_size=500):
+        """从上次同步的序列号开始拉取服务器变更并应用到本地存储"""
+        while True:
+            params = {"since": self.local_storage.sync_seq, "limit": page_size}
+            result = self._make_request("get", "tasks/changes", params=params)
+            if not result["success"]:
+                # 上次同步之后的删除记录已被服务器清理，需要重新全量同步
+                if result.get("status") == 410:
+                    return self._resync_all(json.loads(result["details"]).get("seq", 0))
+                return result
+            
+            data = result["data"]
+            self.local_storage.apply_changes(data.get("changes", []), data.get("seq", 0))
+            if not data.get("has_more"):
+                return {"success": True}
+    
+    def _resync_all(self, seq):
+        """全量拉取任务替换本地任务，之后从服务器返回的序列号继续增量同步
+
+        序列号在拉取列表之前取得，期间的变更会在下次增量同步时重新拉取。
+        """
+        result = self._fetch_all_pages()
+        if not result["success"]:
+            return result
+        self.local_storage.replace_tasks(result["data"]["tasks"], seq)
+        return {"success": True}
+    
+    def _fetch_all_pages(self, filters=None, page_size=500):
+        """按游标逐页获取任务，合并为一个结果"""
+        tasks = []
+        cursor = None
+        while True:
+            params = dict(filters or {})
+            params["limit"] = page_size
+            if cursor:
+                params["cursor"] = cursor
+            
+            result = self._make_request("get", "tasks", params=params)
+            if not result["success"]:
+                return result
+            
+            tasks.extend(result["data"].get("tasks", []))
+            cursor = result["data"].get("next_cursor")
+            if not cursor:
+                return {"success": True, "data": {"tasks": tasks}}
+    
     def create_task(self, task_data):
         """创建新任务"""
         print(f"创建任务数据: {task_data}")  # 调试信息
@@ -290,8 +350,10 @@ class NetworkManager:
                         operation = {
                             "type": "create",
                             "task_id": task_id,
-                            "data": task,
-                            "timestamp": datetime.now().isoformat()
+                            # 保存副本，避免重发前本地修改任务导致与op_id对应的内容不一致
+                            "data": dict(task),
+                            "timestamp": datetime.now().isoformat(),
+                            "op_id": str(uuid.uuid4())
                         }
                         self.sync_queue.append(operation)
                         self.local_storage.add_operation(operation)
@@ -329,7 +391,8 @@ class NetworkManager:
                     "type": "update",
                     "id": task_id,
                     "data": task_data,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": datetime.now().isoformat(),
+                    "op_id": str(uuid.uuid4())
                 }
                 self.sync_queue.append(operation)
                 self.local_storage.add_operation(operation)
@@ -349,7 +412,8 @@ class NetworkManager:
             operation = {
                 "type": "delete",
                 "id": task_id,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now().isoformat(),
+                "op_id": str(uuid.uuid4())
             }
             self.sync_queue.append(operation)
             self.local_storage.add_operation(operation)
@@ -394,9 +458,17 @@ class NetworkManager:
                 # 创建要发送的批量操作
                 operations = self.sync_queue.copy()
                 
+                # 旧版本保存的操作没有op_id，补齐后重试时保持不变
+                for op in operations:
+                    op.setdefault("op_id", str(uuid.uuid4()))
+                # 相同的一批操作使用相同的幂等键，响应丢失后重发时服务器直接返回之前的结果
+                idempotency_key = hashlib.sha256(
+                    "\n".join(op["op_id"] for op in operations).encode("utf-8")).hexdigest()
+                
                 # 发送批量操作到服务器
                 self.logger.info(f"正在同步 {len(operations)} 个操作到服务器")
-                result = self._make_request("post", "tasks/batch", data={"operations": operations})
+                result = self._make_request("post", "tasks/batch", data={"operations": operations},
+                                            extra_headers={"Idempotency-Key": idempotency_key})
                 
                 if result["success"]:
                     # 同步成功，从队列中移除已处理的操作
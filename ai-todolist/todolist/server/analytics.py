@@ -0,0 +1,93 @@
+# analytics.py
+import datetime
+
+# 未指定日期范围时默认统计的天数（包含今天）
+DEFAULT_RANGE_DAYS = 30
+# 单次查询允许的最大天数
+MAX_RANGE_DAYS = 366 * 5
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# 高效时段的划分，值为包含的小时
+DAY_PERIODS = {
+    'morning': range(5, 11),
+    'noon': range(11, 14),
+    'afternoon': range(14, 18),
+    'evening': list(range(18, 24)) + list(range(0, 5)),
+}
+
+
+class AnalyticsError(ValueError):
+    """统计参数无效"""
+
+
+def _parse_date(name, value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise AnalyticsError(f"{name}必须是YYYY-MM-DD格式的日期")
+
+
+def parse_range(args, today=None):
+    """解析from/to参数，默认为截至今天的DEFAULT_RANGE_DAYS天
+
+    Returns:
+        (date, date): 开始和结束日期（包含两端）
+    """
+    today = today or datetime.date.today()
+    end = _parse_date('to', args['to']) if args.get('to') else today
+    start = _parse_date('from', args['from']) if args.get('from') \
+        else end - datetime.timedelta(days=DEFAULT_RANGE_DAYS - 1)
+
+    if start > end:
+        raise AnalyticsError("from不能晚于to")
+    if (end - start).days + 1 > MAX_RANGE_DAYS:
+        raise AnalyticsError(f"日期范围不能超过{MAX_RANGE_DAYS}天")
+    return start, end
+
+
+def parse_day(value, today=None):
+    """解析date参数，默认为今天"""
+    return _parse_date('date', value) if value else (today or datetime.date.today())
+
+
+def parse_granularity(value):
+    granularity = value or 'day'
+    if granularity not in GRANULARITIES:
+        raise AnalyticsError(f"granularity必须是{'、'.join(GRANULARITIES)}之一")
+    return granularity
+
+
+def bucket_start(day, granularity):
+    """日期所在统计区间的第一天，周从周一开始"""
+    if granularity == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_starts(start, end, granularity):
+    """范围内全部统计区间的第一天，用于补齐没有数据的区间"""
+    buckets = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        if granularity == 'day':
+            current += datetime.timedelta(days=1)
+        elif granularity == 'week':
+            current += datetime.timedelta(days=7)
+        else:
+            current = (current.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return buckets
+
+
+def rate(part, total):
+    """百分比，total为0时返回None"""
+    return round(part * 100.0 / total, 1) if total else None
+
+
+def group_by_period(hours):
+    """将24小时的完成数合并为上午、中午、下午、晚上"""
+    return {period: sum(hours[hour] for hour in period_hours)
+            for period, period_hours in DAY_PERIODS.items()}
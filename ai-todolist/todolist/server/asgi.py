@@ -0,0 +1,236 @@
+# asgi.py
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from auth import decode_token
+from db import DB_POOL_SIZE
+from events import Subscription, broker, format_event, EVENT_KEEPALIVE
+import server
+
+# 执行WSGI处理函数（包括全部数据库访问）的线程数，默认与连接池大小一致
+ASGI_WORKERS = int(os.environ.get('TODO_ASGI_WORKERS', str(DB_POOL_SIZE)))
+# 请求体大小上限
+ASGI_MAX_BODY = int(os.environ.get('TODO_ASGI_MAX_BODY', str(16 * 1024 * 1024)))
+
+
+class AsyncSubscription(Subscription):
+    """在事件循环中等待的订阅，发布方线程通过call_soon_threadsafe唤醒"""
+
+    def __init__(self, broker, user_id):
+        super().__init__(broker, user_id)
+        self.loop = asyncio.get_running_loop()
+        self._async_ready = asyncio.Event()
+
+    def notify(self):
+        self.loop.call_soon_threadsafe(self._async_ready.set)
+
+    async def wait_async(self):
+        """等待直到队列中有事件或连接需要结束"""
+        while not self.events and not self.finished:
+            await self._async_ready.wait()
+            self._async_ready.clear()
+
+
+class ASGIApp:
+    """API的异步服务入口
+
+    /v1/events 在事件循环中直接处理，空闲连接只占用一个协程；其余路由交给
+    Flask应用在有界线程池中执行，路由和JSON格式与WSGI模式完全一致。
+    """
+
+    def __init__(self, wsgi_app, workers=ASGI_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-worker')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if scope['path'] == '/v1/events' and scope['method'] == 'GET':
+                await self._events(scope, receive, send)
+            else:
+                await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # 结束推送连接，否则服务器要等到连接全部断开才能退出
+                broker.finish_all()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body.extend(message.get('body', b''))
+            if len(body) > ASGI_MAX_BODY:
+                raise ValueError("请求体过大")
+            if not message.get('more_body'):
+                return bytes(body)
+
+    async def _wsgi(self, scope, receive, send):
+        try:
+            body = await self._read_body(receive)
+        except ValueError as e:
+            await self._send_json(send, 413, {"error": str(e)})
+            return
+        if body is None:
+            return
+
+        environ = build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        status, headers, chunks = await loop.run_in_executor(self.executor, run_wsgi,
+                                                             self.wsgi_app, environ)
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+    async def _events(self, scope, receive, send):
+        request_headers = {key.decode('latin-1').title(): value.decode('latin-1')
+                           for key, value in scope['headers']}
+        args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+
+        token = server.event_token(request_headers, args)
+        user_id = decode_token(token) if token else None
+        if not user_id:
+            await self._send_json(send, 401, {"error": "无效或过期的令牌"})
+            return
+
+        last_event_id = request_headers.get('Last-Event-Id') or args.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            await self._send_json(send, 400, {"error": "无效的Last-Event-ID"})
+            return
+
+        # 先订阅再补发，避免丢失补发期间提交的变更
+        subscription = broker.subscribe(user_id, AsyncSubscription)
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            loop = asyncio.get_running_loop()
+            backlog, last_sent = await loop.run_in_executor(self.executor, load_backlog,
+                                                            user_id, last_event_id)
+
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            await self._send_chunk(send, "retry: 3000\n\n")
+            for chunk in backlog:
+                await self._send_chunk(send, chunk)
+
+            sent = last_sent
+            while not subscription.finished:
+                waiter = asyncio.ensure_future(subscription.wait_async())
+                done, _ = await asyncio.wait({waiter, disconnected}, timeout=EVENT_KEEPALIVE,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if waiter not in done:
+                    waiter.cancel()
+                if disconnected in done:
+                    break
+                if waiter not in done:
+                    await self._send_chunk(send, ": keepalive\n\n")
+                    continue
+                for event in subscription.drain():
+                    # 跳过补发中或已经发送的事件
+                    if event['id'] > sent:
+                        await self._send_chunk(send, format_event(event))
+                        sent = event['id']
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            pass
+        finally:
+            subscription.close()
+            disconnected.cancel()
+
+    async def _wait_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def _send_chunk(self, send, text):
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+    async def _send_json(self, send, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def load_backlog(user_id, last_event_id):
+    with server.app.app_context():
+        return server.load_event_backlog(user_id, last_event_id)
+
+
+def build_environ(scope, body):
+    """根据ASGI scope构建WSGI environ"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            name = 'HTTP_' + name
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ):
+    """在工作线程中执行WSGI应用，返回 (状态码, 响应头, 响应体)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        chunks = list(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], chunks
+
+
+application = ASGIApp(server.app)
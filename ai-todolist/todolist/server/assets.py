@@ -0,0 +1,78 @@
+# assets.py
+import os
+import re
+
+from compression import PrecompressedFiles, StaticAsset
+
+# 文件名中内容哈希的长度
+FINGERPRINT_LENGTH = 12
+# 带哈希的文件内容不会变化，允许浏览器缓存一年
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# HTML页面每次使用前重新验证，页面更新后立即引用新的资源
+HTML_CACHE_CONTROL = 'no-cache'
+
+# HTML中对静态文件的引用，如 src="static/js/api.js" 或 href="/static/css/style.css"
+_STATIC_REFERENCE = re.compile(r'''((?:src|href)\s*=\s*["'])(/?static/)([^"'?#]+)''')
+
+
+def fingerprinted_name(path, digest):
+    """在扩展名前插入内容哈希，如 js/api.js -> js/api.1a2b3c4d5e6f.js"""
+    base, ext = os.path.splitext(path)
+    return f"{base}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+
+
+class AssetManifest:
+    """启动时为静态文件计算内容哈希，并改写HTML页面中的引用
+
+    静态文件同时可以通过原路径和带哈希的路径访问；HTML页面中的引用改写为带
+    哈希的路径，文件内容变化后页面自动引用新的URL。
+    """
+
+    def __init__(self, static_dir, pages_dir):
+        self.static_dir = static_dir
+        self.pages_dir = pages_dir
+        self.files = PrecompressedFiles(static_dir)
+        self.urls = {}
+        self.hashed = {}
+        self.pages = {}
+
+    def load(self):
+        self.files.load()
+        self.urls = {path: fingerprinted_name(path, asset.digest)
+                     for path, asset in self.files.assets.items()}
+        self.hashed = {hashed: self.files.assets[path] for path, hashed in self.urls.items()}
+
+        pages = {}
+        for filename in os.listdir(self.pages_dir):
+            if filename.endswith('.html'):
+                with open(os.path.join(self.pages_dir, filename), 'r', encoding='utf-8') as f:
+                    html = self.rewrite(f.read())
+                pages[filename] = StaticAsset(filename, html.encode('utf-8'), 'text/html')
+        self.pages = pages
+        return self
+
+    def rewrite(self, html):
+        """将HTML中的静态文件引用替换为带哈希的路径，找不到的文件保持不变"""
+        def replace(match):
+            hashed = self.urls.get(match.group(3))
+            if hashed is None:
+                return match.group(0)
+            return match.group(1) + match.group(2) + hashed
+        return _STATIC_REFERENCE.sub(replace, html)
+
+    def url(self, path):
+        """返回静态文件带哈希的路径"""
+        return self.urls.get(path, path)
+
+    def static(self, path):
+        """查找静态文件
+
+        Returns:
+            (StaticAsset, bool): 文件及是否通过带哈希的路径访问，找不到时为 (None, False)
+        """
+        if path in self.hashed:
+            return self.hashed[path], True
+        return self.files.get(path), False
+
+    def page(self, filename):
+        return self.pages.get(filename)
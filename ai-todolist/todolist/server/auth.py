@@ -7,24 +7,119 @@ import uuid
 import hashlib
 import jwt
 import functools
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # JWT密钥，实际应用请使用环境变量等安全方式存储
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-please-change-in-production')
 TOKEN_EXPIRY = 24 * 60 * 60  # 24小时
 
+# 密码哈希配置，迭代次数写入哈希值中，修改后用户下次登录时自动重新哈希
+PASSWORD_ITERATIONS = int(os.environ.get('TODO_PASSWORD_ITERATIONS', '100000'))
+LEGACY_ITERATIONS = 100000  # 旧格式 salt:key 使用的迭代次数
+HASH_WORKERS = int(os.environ.get('TODO_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_DEPTH = int(os.environ.get('TODO_HASH_QUEUE_DEPTH', str(max(HASH_WORKERS, 1) * 4)))
+HASH_TIMEOUT = float(os.environ.get('TODO_HASH_TIMEOUT', '10'))
+
+HASH_PREFIX = 'pbkdf2_sha256'
+
+# 已解码令牌缓存配置
+TOKEN_CACHE_SIZE = int(os.environ.get('TODO_TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = int(os.environ.get('TODO_TOKEN_CACHE_TTL', '300'))  # 秒
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(HASH_QUEUE_DEPTH)
+
+
+class HashingBusy(Exception):
+    """密码哈希队列已满"""
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+
+def _get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        return _hash_pool
+
+
+def shutdown_hash_pool(wait=False):
+    """关闭密码哈希进程池，wait为True时等待子进程退出"""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=wait, cancel_futures=True)
+            _hash_pool = None
+
+
+def _reset_after_fork():
+    """fork出的子进程不能使用父进程的进程池，首次哈希时重新创建"""
+    global _hash_pool, _hash_pool_lock, _hash_slots
+    _hash_pool = None
+    _hash_pool_lock = threading.Lock()
+    _hash_slots = threading.BoundedSemaphore(HASH_QUEUE_DEPTH)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _run_pbkdf2(password, salt, iterations):
+    """在进程池中计算PBKDF2，排队数超过上限时抛出HashingBusy"""
+    if HASH_WORKERS <= 0:
+        return _pbkdf2(password, salt, iterations)
+
+    slots = _hash_slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusy("密码哈希队列已满")
+    try:
+        future = _get_hash_pool().submit(_pbkdf2, password, salt, iterations)
+    except Exception:
+        slots.release()
+        raise
+    # 等待超时后任务仍在进程池中执行，计算结束时才释放排队名额
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FuturesTimeoutError:
+        raise HashingBusy("密码哈希超时")
+
+
+def _parse_hash(stored_password):
+    """解析哈希值，返回 (迭代次数, salt, key)"""
+    if stored_password.startswith(HASH_PREFIX + '$'):
+        _, iterations, salt_hex, key_hex = stored_password.split('$')
+        return int(iterations), bytes.fromhex(salt_hex), bytes.fromhex(key_hex)
+    salt_hex, key_hex = stored_password.split(':')
+    return LEGACY_ITERATIONS, bytes.fromhex(salt_hex), bytes.fromhex(key_hex)
+
+
 def hash_password(password):
     """对密码进行哈希处理"""
     salt = os.urandom(32)
-    key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100000)
-    return salt.hex() + ':' + key.hex()
+    key = _run_pbkdf2(password, salt, PASSWORD_ITERATIONS)
+    return f"{HASH_PREFIX}${PASSWORD_ITERATIONS}${salt.hex()}${key.hex()}"
 
 def verify_password(stored_password, provided_password):
     """验证密码"""
-    salt_hex, key_hex = stored_password.split(':')
-    salt = bytes.fromhex(salt_hex)
-    stored_key = bytes.fromhex(key_hex)
-    new_key = hashlib.pbkdf2_hmac('sha256', provided_password.encode('utf-8'), salt, 100000)
-    return stored_key == new_key
+    iterations, salt, stored_key = _parse_hash(stored_password)
+    new_key = _run_pbkdf2(provided_password, salt, iterations)
+    return hmac.compare_digest(stored_key, new_key)
+
+def needs_rehash(stored_password):
+    """哈希格式或迭代次数与当前配置不一致时需要重新哈希"""
+    if not stored_password.startswith(HASH_PREFIX + '$'):
+        return True
+    iterations, _, _ = _parse_hash(stored_password)
+    return iterations != PASSWORD_ITERATIONS
 
 def generate_token(user_id):
     """生成JWT令牌"""
@@ -34,15 +129,90 @@ def generate_token(user_id):
     }
     return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
 
+class TokenCache:
+    """已验证JWT的LRU缓存，以令牌摘要为键，保存用户ID和过期时间
+
+    缓存项在令牌过期或超过TTL后失效，只缓存验证成功的令牌。
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        """返回缓存的用户ID，未命中或已过期时返回None"""
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            user_id, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user_id
+
+    def put(self, token, user_id, exp):
+        """缓存令牌，失效时间取令牌过期时间和TTL中较早者"""
+        if self.max_size <= 0:
+            return
+        expires_at = min(exp, time.time() + self.ttl)
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (user_id, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+token_cache = TokenCache()
+
 def decode_token(token):
-    """解码JWT令牌"""
+    """解码JWT令牌，优先使用缓存"""
+    user_id = token_cache.get(token)
+    if user_id:
+        return user_id
+    
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return payload['user_id']
     except jwt.ExpiredSignatureError:
         return None  # 令牌过期
     except jwt.InvalidTokenError:
         return None  # 无效令牌
+    
+    token_cache.put(token, payload['user_id'], payload['exp'])
+    return payload['user_id']
 
 def login_required(f):
     """验证用户登录状态的装饰器"""
@@ -53,18 +223,20 @@ def login_required(f):
         if not auth_header:
             return jsonify({"error": "未提供认证令牌"}), 401
         
+        # 只有令牌解析失败才返回401；视图中的异常交给Flask的错误处理（500/503），
+        # 否则客户端会把服务器错误误认为令牌失效
         try:
             # 获取Bearer令牌
             token = auth_header.split(' ')[1]
             user_id = decode_token(token)
-            
-            if not user_id:
-                return jsonify({"error": "无效或过期的令牌"}), 401
-                
-            # 将用户ID存储在Flask的g对象中，供视图函数使用
-            g.user_id = user_id
-            return f(*args, **kwargs)
         except Exception as e:
             return jsonify({"error": f"认证错误: {str(e)}"}), 401
-            
+        
+        if not user_id:
+            return jsonify({"error": "无效或过期的令牌"}), 401
+        
+        # 将用户ID存储在Flask的g对象中，供视图函数使用
+        g.user_id = user_id
+        return f(*args, **kwargs)
+        
     return decorated_function
\ No newline at end of file
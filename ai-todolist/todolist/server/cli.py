@@ -0,0 +1,17 @@
+# cli.py
+import os
+import sys
+
+
+def main(argv=None):
+    """todolist-server 命令入口
+
+    服务端模块使用同目录的平铺导入，这里先把服务端目录加入sys.path再启动。
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+    server.main(argv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# compression.py
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只使用gzip
+    brotli = None
+
+# 小于该大小（字节）的响应不压缩，压缩收益抵不上开销
+COMPRESS_MIN_SIZE = int(os.environ.get('TODO_COMPRESS_MIN_SIZE', '1024'))
+# 动态响应的压缩级别，静态文件启动时用最高级别压缩一次
+GZIP_LEVEL = int(os.environ.get('TODO_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('TODO_BROTLI_QUALITY', '4'))
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/javascript',
+                      'text/css', 'text/html', 'text/plain', 'image/svg+xml')
+
+
+def available_encodings():
+    """服务器支持的压缩格式，按优先级排列"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding, encodings=None):
+    """根据Accept-Encoding选择压缩格式
+
+    Returns:
+        str: 'br'、'gzip'，不压缩时返回None
+    """
+    if not accept_encoding:
+        return None
+    encodings = available_encodings() if encodings is None else encodings
+
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding, level=None):
+    """按指定格式压缩数据"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    if encoding == 'gzip':
+        # mtime固定为0，相同内容的压缩结果相同
+        return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+    raise ValueError(f"不支持的压缩格式: {encoding}")
+
+
+def compress_response(response, accept_encoding, min_size=COMPRESS_MIN_SIZE):
+    """压缩JSON响应体，供after_request调用
+
+    只处理已经完整生成的响应，流式响应（如事件推送）原样返回。压缩结果直接替换
+    原响应体，不额外保留副本。
+    """
+    if response.mimetype != 'application/json' or response.is_streamed \
+            or response.direct_passthrough or 'Content-Encoding' in response.headers \
+            or response.status_code < 200 or response.status_code in (204, 206) \
+            or response.status_code >= 300:
+        return response
+
+    length = response.content_length
+    if length is None or length < min_size:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class StaticAsset:
+    """一个静态文件及其预压缩版本"""
+
+    def __init__(self, path, data, mimetype):
+        self.path = path
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.variants = {None: data}
+        if mimetype in COMPRESSIBLE_TYPES and len(data) >= COMPRESS_MIN_SIZE:
+            for encoding in available_encodings():
+                compressed = compress(data, encoding, level=11 if encoding == 'br' else 9)
+                # 压缩后没有变小的格式不保留
+                if len(compressed) < len(data):
+                    self.variants[encoding] = compressed
+
+    @property
+    def encodings(self):
+        return tuple(encoding for encoding in available_encodings() if encoding in self.variants)
+
+
+class PrecompressedFiles:
+    """启动时读取目录下的全部文件并预先压缩，请求时直接返回内存中的结果"""
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+
+    def load(self):
+        assets = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                relative = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                assets[relative] = StaticAsset(relative, data, mimetype)
+        self.assets = assets
+        return self
+
+    def get(self, path):
+        return self.assets.get(path)
@@ -0,0 +1,193 @@
+# db.py
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# 连接池配置，可通过环境变量调整
+DB_POOL_SIZE = int(os.environ.get('TODO_DB_POOL_SIZE', '8'))
+DB_BUSY_TIMEOUT = int(os.environ.get('TODO_DB_BUSY_TIMEOUT', '5000'))  # 毫秒
+DB_SYNCHRONOUS = os.environ.get('TODO_DB_SYNCHRONOUS', 'NORMAL').upper()
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# SQLite 3.35起支持 INSERT/UPDATE ... RETURNING，旧版本需要另外查询写入后的行
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+class DatabaseBusy(Exception):
+    """数据库暂时无法处理请求，客户端应稍后重试"""
+
+
+class PoolTimeout(DatabaseBusy):
+    """连接池已满，等待归还连接超时"""
+
+
+# 当前线程执行SQL的累计耗时和次数，请求开始时清零，用于区分数据库耗时和处理耗时
+_query_time = threading.local()
+
+
+def reset_query_time():
+    _query_time.seconds = 0.0
+    _query_time.count = 0
+
+
+def query_time():
+    """返回当前线程自上次清零以来的 (SQL耗时秒数, 执行次数)"""
+    return getattr(_query_time, 'seconds', 0.0), getattr(_query_time, 'count', 0)
+
+
+def _record(started, statements=1):
+    _query_time.seconds = getattr(_query_time, 'seconds', 0.0) + time.perf_counter() - started
+    _query_time.count = getattr(_query_time, 'count', 0) + statements
+
+
+class TimedCursor(sqlite3.Cursor):
+    """记录执行和读取结果耗时的游标，SQLite在fetch时才逐行执行查询"""
+
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _record(started)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _record(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record(started, 0)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record(started, 0)
+
+
+class TimedConnection(sqlite3.Connection):
+    """游标默认使用TimedCursor，提交耗时同样计入SQL耗时"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _record(started)
+
+
+class ConnectionPool:
+    """SQLite连接池，连接以WAL模式打开并在请求之间复用"""
+
+    def __init__(self, database, size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT,
+                 synchronous=DB_SYNCHRONOUS, on_connect=None):
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"无效的synchronous级别: {synchronous}")
+
+        self.database = database
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        # 新建连接后调用，用于注册自定义SQL函数等
+        self.on_connect = on_connect
+
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def connect(self):
+        """创建不属于连接池的新连接，设置与池中连接相同，由调用者关闭"""
+        return self._connect()
+
+    def _connect(self):
+        """创建新连接并设置PRAGMA"""
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout / 1000.0,
+                               check_same_thread=False, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        # 只对新建的数据库文件生效，需要在切换WAL之前设置；已有数据库用 --compact 转换
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if self.on_connect:
+            self.on_connect(conn)
+        return conn
+
+    def acquire(self):
+        """从池中取出一个连接，池空且未达上限时新建连接"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        # 已达上限，等待其他线程归还连接
+        try:
+            return self._idle.get(timeout=self.busy_timeout / 1000.0)
+        except queue.Empty:
+            raise PoolTimeout("等待数据库连接超时")
+
+    def release(self, conn):
+        """归还连接，未提交的事务会被回滚"""
+        if conn.in_transaction:
+            conn.rollback()
+
+        if self._closed:
+            self._discard(conn)
+            return
+
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._opened -= 1
+        conn.close()
+
+    def close(self):
+        """关闭池中所有空闲连接"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        """返回连接池状态"""
+        return {
+            "size": self.size,
+            "opened": self._opened,
+            "idle": self._idle.qsize()
+        }
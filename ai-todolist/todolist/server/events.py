@@ -0,0 +1,204 @@
+# events.py
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+# 断线续传时从数据库补发的最大事件数，超过时要求客户端重新同步
+EVENT_REPLAY_LIMIT = int(os.environ.get('TODO_EVENT_REPLAY_LIMIT', '500'))
+# 空闲连接发送心跳的间隔（秒）
+EVENT_KEEPALIVE = float(os.environ.get('TODO_EVENT_KEEPALIVE', '15'))
+# 每个进程同时保持的推送连接上限，0表示不限制（prefork模式下不超过每个worker的线程数减1）
+EVENT_MAX_STREAMS = int(os.environ.get('TODO_EVENT_MAX_STREAMS', '0'))
+# 是否从数据库轮询变更并推送，多个进程写同一数据库时需要启用（prefork模式自动启用）
+EVENT_POLL = os.environ.get('TODO_EVENT_POLL', '0').lower() in ('1', 'true', 'yes', 'on')
+# 轮询数据库变更的间隔（秒）
+EVENT_POLL_INTERVAL = float(os.environ.get('TODO_EVENT_POLL_INTERVAL', '1'))
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """一个客户端连接的事件订阅
+
+    事件先放入本地队列，再调用notify唤醒等待方。默认用threading.Event等待，
+    异步服务器可覆盖notify以唤醒事件循环，不需要为每个连接占用线程。
+    """
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.events = deque()
+        self.finished = False
+        self._ready = threading.Event()
+
+    def push(self, events):
+        self.events.extend(events)
+        self.notify()
+
+    def notify(self):
+        self._ready.set()
+
+    def finish(self):
+        """要求连接在发送完已有事件后结束，客户端会自动重连"""
+        self.finished = True
+        self.notify()
+
+    def wait(self, timeout=None):
+        """等待新事件，返回是否有事件"""
+        if not self.events and not self.finished:
+            self._ready.wait(timeout)
+        self._ready.clear()
+        return bool(self.events)
+
+    def drain(self):
+        """取出队列中的全部事件"""
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """进程内发布/订阅，按用户分发任务变更事件
+
+    不保留历史事件，断线续传由调用方根据变更序列号从数据库补发。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._finishing = False
+
+    def subscribe(self, user_id, subscription_class=Subscription, limit=None):
+        """订阅用户的事件，已有limit个连接时返回None"""
+        subscription = subscription_class(self, user_id)
+        with self._lock:
+            if limit is not None and self._count() >= limit:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            # finish_all之后才开始处理的连接同样立即结束
+            subscription.finished = self._finishing
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def has_subscribers(self, user_id):
+        with self._lock:
+            return user_id in self._subscribers
+
+    def publish(self, user_id, events):
+        """发布事件，事件为包含id（变更序列号）、type和data的字典"""
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscribers:
+            subscription.push(events)
+
+    def finish_all(self):
+        """结束全部连接，进程平滑退出前调用"""
+        with self._lock:
+            self._finishing = True
+            subscriptions = [s for subscribers in self._subscribers.values() for s in subscribers]
+        for subscription in subscriptions:
+            subscription.finish()
+
+    def connection_count(self):
+        with self._lock:
+            return self._count()
+
+    def _count(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class EventPoller:
+    """从数据库轮询有连接的用户的变更并发布
+
+    EventBroker只在进程内分发，多个进程写同一数据库时，其他进程提交的变更
+    只能通过变更序列号从数据库读取。启用后由轮询线程作为唯一的发布方，
+    本进程提交写操作后调用wake立即轮询，事件始终按序列号顺序发布。
+
+    fetch(cursors)接收 {用户ID: 已发布的序列号}，返回 {用户ID: 事件列表}。
+    轮询线程按进程启动，fork出的worker在第一个连接时启动自己的线程。
+    """
+
+    def __init__(self, broker, fetch, interval=EVENT_POLL_INTERVAL):
+        self.broker = broker
+        self.fetch = fetch
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._cursors = {}
+        self._pid = None
+
+    def watch(self, user_id, seq):
+        """开始推送用户在seq之后的变更，需在订阅之后、补发之前调用"""
+        self._ensure_started()
+        with self._lock:
+            self._cursors.setdefault(user_id, seq)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def poll(self):
+        """读取并发布一次变更"""
+        with self._lock:
+            # 用户的连接全部断开后不再轮询，重新连接时由watch重新设置起点
+            for user_id in [u for u in self._cursors if not self.broker.has_subscribers(u)]:
+                del self._cursors[user_id]
+            cursors = dict(self._cursors)
+        if not cursors:
+            return
+        for user_id, user_events in self.fetch(cursors).items():
+            if not user_events:
+                continue
+            with self._lock:
+                if user_id in self._cursors:
+                    self._cursors[user_id] = max(self._cursors[user_id], user_events[-1]['id'])
+            self.broker.publish(user_id, user_events)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # fork前的游标属于父进程的连接
+            self._cursors = {}
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='event-poller', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("轮询事件失败")
+
+
+def format_event(event):
+    """将事件编码为SSE文本"""
+    data = json.dumps(event['data'], ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+def reset_event(seq):
+    """需要补发的事件过多，通知客户端通过 /v1/tasks/changes 重新同步"""
+    return f"event: reset\ndata: {json.dumps({'seq': seq})}\n\n"
+
+
+broker = EventBroker()
@@ -0,0 +1,138 @@
+# group_commit.py
+import logging
+import os
+import queue
+import threading
+import time
+
+# 是否启用组提交：任务的创建、修改和删除交给写线程合并到同一事务中提交
+GROUP_COMMIT = os.environ.get('TODO_GROUP_COMMIT', '0').lower() in ('1', 'true', 'yes', 'on')
+# 写线程收到第一个写操作后继续等待的时间（毫秒），期间到达的写操作一起提交
+GROUP_COMMIT_WINDOW = float(os.environ.get('TODO_GROUP_COMMIT_WINDOW', '2'))
+# 每个事务最多包含的写操作数
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('TODO_GROUP_COMMIT_MAX_BATCH', '256'))
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    """一个等待写线程执行的写操作"""
+
+    __slots__ = ('operation', 'done', 'result', 'error')
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GroupCommitWriter:
+    """单写线程组提交
+
+    请求线程调用submit提交写操作后等待；写线程取出一个时间窗口内到达的全部写操作，
+    在同一个事务中依次执行后提交一次，再唤醒各请求线程。每个写操作在单独的
+    SAVEPOINT中执行，出错时只回滚该操作并将异常交给提交它的请求，同一事务中的
+    其他操作不受影响；提交失败时该事务中的全部请求都收到异常。
+
+    并发写入时每次提交的fsync由多个请求分摊。写线程按进程启动，fork出的worker在
+    第一次写入时启动自己的写线程。写线程使用不属于连接池的专用连接，请求线程
+    占满连接池时也不会阻塞写线程。
+    """
+
+    def __init__(self, get_pool, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.get_pool = get_pool
+        self.window = window / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+        self._conn = None
+        self.transactions = 0
+        self.operations = 0
+
+    def submit(self, operation):
+        """在写线程的事务中执行operation(conn)，提交后返回其结果或抛出其异常"""
+        self._ensure_started()
+        pending = _Pending(operation)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stats(self):
+        return {
+            "transactions": self.transactions,
+            "operations": self.operations,
+            "queued": self._queue.qsize()
+        }
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # fork前排队的写操作和专用连接属于父进程，子进程重新开始
+            self._queue = queue.Queue()
+            self._pool = None
+            self._conn = None
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='group-commit', daemon=True).start()
+
+    def _collect(self):
+        """取出第一个写操作，再收集时间窗口内到达的写操作"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._apply(batch)
+            except Exception as e:
+                logger.exception("组提交事务失败")
+                for pending in batch:
+                    pending.result = None
+                    pending.error = e
+            for pending in batch:
+                pending.done.set()
+
+    def _connection(self):
+        """连接池被替换（如切换数据库）时重新创建专用连接"""
+        pool = self.get_pool()
+        if pool is not self._pool:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = pool.connect()
+            self._pool = pool
+        return self._conn
+
+    def _apply(self, batch):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for pending in batch:
+                conn.execute("SAVEPOINT group_commit_op")
+                try:
+                    pending.result = pending.operation(conn)
+                except Exception as e:
+                    pending.error = e
+                    conn.execute("ROLLBACK TO group_commit_op")
+                conn.execute("RELEASE group_commit_op")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self.transactions += 1
+        self.operations += len(batch)
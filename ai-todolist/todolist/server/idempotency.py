@@ -0,0 +1,86 @@
+# idempotency.py
+import datetime
+import hashlib
+import json
+import os
+
+# 幂等键保留时间（秒）及每个用户保留的最大条数
+IDEMPOTENCY_TTL = int(os.environ.get('TODO_IDEMPOTENCY_TTL', str(24 * 3600)))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('TODO_IDEMPOTENCY_MAX_KEYS', '5000'))
+MAX_KEY_LENGTH = 255
+
+# 请求级幂等键（Idempotency-Key请求头）与操作级幂等键（op_id）使用不同前缀
+BATCH_PREFIX = 'batch:'
+OP_PREFIX = 'op:'
+
+
+class IdempotencyError(ValueError):
+    """幂等键无效"""
+
+
+def validate_key(key, name='Idempotency-Key'):
+    if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(f"{name}必须是1到{MAX_KEY_LENGTH}个字符的字符串")
+    return key
+
+
+def fingerprint(payload):
+    """请求内容的摘要，同一个幂等键只能用于内容相同的请求"""
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def load_responses(cursor, user_id, keys, now=None):
+    """读取未过期的幂等键
+
+    Returns:
+        dict: 幂等键 -> (请求摘要, 响应)
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(seconds=IDEMPOTENCY_TTL)).isoformat()
+
+    stored = {}
+    # 分批查询，避免超出SQLite参数个数上限
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        cursor.execute(
+            f"SELECT key, fingerprint, response FROM idempotency_keys "
+            f"WHERE user_id = ? AND created_at >= ? AND key IN ({placeholders})",
+            [user_id, cutoff] + chunk
+        )
+        for row in cursor.fetchall():
+            stored[row['key']] = (row['fingerprint'], json.loads(row['response']))
+    return stored
+
+
+def store_responses(cursor, user_id, entries, now=None):
+    """保存幂等键及响应，并清理该用户过期和超出上限的旧键
+
+    Args:
+        entries: (幂等键, 请求摘要, 响应) 列表
+    """
+    now = now or datetime.datetime.now()
+    created_at = now.isoformat()
+    cursor.executemany(
+        "INSERT OR REPLACE INTO idempotency_keys (user_id, key, fingerprint, response, created_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(user_id, key, digest, json.dumps(response, ensure_ascii=False), created_at)
+         for key, digest, response in entries]
+    )
+
+    cutoff = (now - datetime.timedelta(seconds=IDEMPOTENCY_TTL)).isoformat()
+    cursor.execute("DELETE FROM idempotency_keys WHERE user_id = ? AND created_at < ?",
+                   (user_id, cutoff))
+    cursor.execute(
+        """
+        DELETE FROM idempotency_keys WHERE user_id = ? AND created_at < (
+            SELECT created_at FROM idempotency_keys WHERE user_id = ?
+            ORDER BY created_at DESC LIMIT 1 OFFSET ?
+        )
+        """,
+        (user_id, user_id, IDEMPOTENCY_MAX_KEYS - 1)
+    )
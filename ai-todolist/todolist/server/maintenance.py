@@ -0,0 +1,245 @@
+# maintenance.py
+import datetime
+import logging
+import os
+import threading
+
+# 删除记录在所有活跃客户端同步之后至少保留的天数；超过该天数未同步的客户端不再等待，
+# 下次增量同步时需要重新全量同步
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TODO_TOMBSTONE_RETENTION_DAYS', '30'))
+# 完成超过该天数的任务移入归档表，0表示不归档
+ARCHIVE_AFTER_DAYS = int(os.environ.get('TODO_ARCHIVE_AFTER_DAYS', '180'))
+# 后台维护的执行间隔（秒），0表示不在后台执行
+MAINTENANCE_INTERVAL = float(os.environ.get('TODO_MAINTENANCE_INTERVAL', '3600'))
+# 每个事务处理的最大行数，避免长时间占用写锁
+MAINTENANCE_BATCH = int(os.environ.get('TODO_MAINTENANCE_BATCH', '500'))
+
+logger = logging.getLogger(__name__)
+
+
+def _now():
+    return datetime.datetime.now()
+
+
+def purge_tombstones(conn, retention_days=TOMBSTONE_RETENTION_DAYS, batch=MAINTENANCE_BATCH,
+                     now=None):
+    """物理删除超过保留期、且所有活跃客户端都已同步过的删除记录
+
+    活跃客户端指保留期内调用过增量同步的客户端。被清理记录的最大序列号写入
+    sync_horizon，此后从更早的序列号增量同步的客户端会收到重新同步的要求。
+
+    Returns:
+        int: 删除的记录数
+    """
+    cutoff = ((now or _now()) - datetime.timedelta(days=retention_days)).isoformat()
+    purged = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("""
+                SELECT t.rowid, t.user_id, t.seq FROM tasks t
+                WHERE t.deleted = 1 AND t.deleted_at < ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM sync_clients c
+                    WHERE c.user_id = t.user_id AND c.last_seen >= ? AND c.seq < t.seq
+                )
+                LIMIT ?
+            """, (cutoff, cutoff, batch)).fetchall()
+
+            horizons = {}
+            for rowid, user_id, seq in rows:
+                horizons[user_id] = max(horizons.get(user_id, 0), seq)
+            if rows:
+                placeholders = ','.join('?' * len(rows))
+                conn.execute(f"DELETE FROM tasks WHERE rowid IN ({placeholders})",
+                             [row[0] for row in rows])
+                conn.executemany("""
+                    INSERT INTO sync_horizon (user_id, purged_seq) VALUES (?, ?)
+                    ON CONFLICT(user_id) DO UPDATE
+                    SET purged_seq = MAX(purged_seq, excluded.purged_seq)
+                """, horizons.items())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        purged += len(rows)
+        if len(rows) < batch:
+            return purged
+
+
+def archive_completed_tasks(conn, archive_after_days=ARCHIVE_AFTER_DAYS,
+                            batch=MAINTENANCE_BATCH, now=None, on_archived=None):
+    """将完成超过指定天数的任务移入tasks_archive
+
+    移出期间archive_guard中有一行，统计分析汇总表保留这些任务的历史数据；
+    当前任务计数和全文索引不再包含它们。每个归档的任务占用所属用户的一个新序列号，
+    增量同步和事件推送中作为删除返回，任务列表的ETag随之失效。
+
+    Args:
+        on_archived: 每批提交后以归档的行（tasks_archive）列表调用，用于推送事件
+
+    Returns:
+        int: 归档的任务数
+    """
+    if archive_after_days <= 0:
+        return 0
+
+    now = now or _now()
+    cutoff = (now - datetime.timedelta(days=archive_after_days)).isoformat()
+    archived = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("""
+                SELECT rowid, user_id, id FROM tasks
+                WHERE completed = 1 AND deleted = 0 AND completed_at < ?
+                LIMIT ?
+            """, (cutoff, batch)).fetchall()
+
+            if rows:
+                rowids = [row[0] for row in rows]
+                placeholders = ','.join('?' * len(rowids))
+                conn.execute("INSERT INTO archive_guard (active) VALUES (1)")
+                conn.execute(f"""
+                    INSERT INTO tasks_archive (id, user_id, text, category, created_at,
+                                               completed_at, due_date, due_time, archived_at)
+                    SELECT id, user_id, text, category, created_at, completed_at, due_date,
+                           due_time, ?
+                    FROM tasks WHERE rowid IN ({placeholders})
+                """, [now.isoformat()] + rowids)
+                conn.execute(f"DELETE FROM tasks WHERE rowid IN ({placeholders})", rowids)
+                conn.execute("DELETE FROM archive_guard")
+                _assign_archive_seq(conn, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        if rows and on_archived is not None:
+            placeholders = ','.join('?' * len(rows))
+            on_archived(conn.execute(f"SELECT * FROM tasks_archive WHERE id IN ({placeholders}) "
+                                     "ORDER BY seq", [row[2] for row in rows]).fetchall())
+
+        archived += len(rows)
+        if len(rows) < batch:
+            return archived
+
+
+def _assign_archive_seq(conn, rows):
+    """为归档的任务分配所属用户的新序列号"""
+    by_user = {}
+    for _, user_id, task_id in rows:
+        by_user.setdefault(user_id, []).append(task_id)
+    for user_id, task_ids in by_user.items():
+        conn.execute("""
+            INSERT INTO user_seq (user_id, seq) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET seq = seq + excluded.seq
+        """, (user_id, len(task_ids)))
+        last = conn.execute("SELECT seq FROM user_seq WHERE user_id = ?", (user_id,)).fetchone()[0]
+        first = last - len(task_ids) + 1
+        conn.executemany("UPDATE tasks_archive SET seq = ? WHERE id = ?",
+                         [(first + i, task_id) for i, task_id in enumerate(task_ids)])
+
+
+def incremental_vacuum(conn):
+    """释放空闲页，只在数据库以auto_vacuum=INCREMENTAL创建时有效
+
+    不执行完整VACUUM：它可能重新编号tasks的rowid，导致全文索引失效。
+
+    Returns:
+        int: 释放的页数，数据库不支持增量VACUUM时返回None
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return None
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free_pages:
+        # sqlite3模块的execute只执行一步，每步只释放一页；executescript会执行到结束
+        conn.executescript("PRAGMA incremental_vacuum")
+    return free_pages
+
+
+def run_maintenance(conn, now=None, on_archived=None):
+    """执行一次全部维护操作
+
+    Returns:
+        dict: 各项操作处理的数量
+    """
+    report = {
+        "purged": purge_tombstones(conn, now=now),
+        "archived": archive_completed_tasks(conn, now=now, on_archived=on_archived),
+        "vacuumed_pages": incremental_vacuum(conn),
+    }
+    conn.execute("""
+        INSERT INTO maintenance_state (name, value) VALUES ('last_run', ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+    """, ((now or _now()).isoformat(),))
+    conn.commit()
+    return report
+
+
+def claim_run(conn, interval, now=None):
+    """多个进程各自运行维护线程时，保证每个间隔内只有一个进程执行维护
+
+    Returns:
+        bool: 是否由当前进程执行本次维护
+    """
+    now = now or _now()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT value FROM maintenance_state WHERE name = 'last_run'").fetchone()
+        # 留出一点余量，避免各进程的计时误差导致本轮被跳过
+        if row and row[0] > (now - datetime.timedelta(seconds=interval * 0.9)).isoformat():
+            conn.rollback()
+            return False
+        conn.execute("""
+            INSERT INTO maintenance_state (name, value) VALUES ('last_run', ?)
+            ON CONFLICT(name) DO UPDATE SET value = excluded.value
+        """, (now.isoformat(),))
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class MaintenanceScheduler:
+    """在后台线程中定期执行维护
+
+    在处理请求的进程中首次调用ensure_started时启动线程；fork出的worker进程中
+    线程不会被继承，会在worker的第一个请求时重新启动。
+    """
+
+    def __init__(self, get_pool, interval=MAINTENANCE_INTERVAL, on_archived=None):
+        self.get_pool = get_pool
+        self.interval = interval
+        self.on_archived = on_archived
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+
+    def ensure_started(self):
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            threading.Thread(target=self._run, name='maintenance', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            pool = self.get_pool()
+            conn = pool.acquire()
+            try:
+                if claim_run(conn, self.interval):
+                    report = run_maintenance(conn, on_archived=self.on_archived)
+                    logger.info("数据库维护完成: %s", report)
+            except Exception:
+                logger.exception("数据库维护失败")
+            finally:
+                pool.release(conn)
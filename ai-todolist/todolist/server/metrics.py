@@ -0,0 +1,201 @@
+# metrics.py
+import bisect
+import os
+import threading
+
+# 访问 /v1/metrics 需要的令牌，未设置时不校验
+METRICS_TOKEN = os.environ.get('TODO_METRICS_TOKEN')
+
+# 请求耗时直方图的上界（秒）
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 批量同步操作数直方图的上界
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# 已结束线程的分片超过该数量时合并，避免每个请求一个线程的服务器不断增加分片
+_MAX_IDLE_SHARDS = 64
+
+
+class _Histogram:
+    """非累计的分桶计数，输出时再累加；只由所属线程写入"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(list(other.counts)):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+
+class _Shard:
+    """一个线程的指标，写入时不加锁"""
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.durations = {}  # (路由, 方法, 状态码) -> _Histogram
+        self.timings = {}  # 路由 -> [SQL耗时, 其余处理耗时, SQL执行次数]
+        self.batch_sizes = _Histogram(BATCH_SIZE_BUCKETS)
+        self.in_flight = 0
+
+    def merge(self, other):
+        # other可能是其他线程正在写入的分片，遍历前复制，避免新增键导致字典大小变化
+        for key, histogram in list(other.durations.items()):
+            self.durations.setdefault(key, _Histogram(DURATION_BUCKETS)).merge(histogram)
+        for route, values in list(other.timings.items()):
+            totals = self.timings.setdefault(route, [0.0, 0.0, 0])
+            for i, value in enumerate(list(values)):
+                totals[i] += value
+        self.batch_sizes.merge(other.batch_sizes)
+        self.in_flight += other.in_flight
+
+
+class Metrics:
+    """请求指标，按线程分片记录，输出时汇总
+
+    每个线程只写自己的分片，记录一次请求只有几次字典查找和加法，不需要加锁；
+    只有线程第一次记录时注册分片需要加锁。读取时各分片可能正在写入，
+    结果可能略微滞后，不影响计数的准确性。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = _Shard(None)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._compact()
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _compact(self):
+        """将已结束线程的分片合并到_retired，需持有锁"""
+        if len(self._shards) < _MAX_IDLE_SHARDS:
+            return
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                self._retired.merge(shard)
+        self._shards = alive
+
+    def request_started(self):
+        self._shard().in_flight += 1
+
+    def request_finished(self, route, method, status, duration, db_seconds, queries):
+        shard = self._shard()
+        shard.in_flight -= 1
+        key = (route, method, status)
+        histogram = shard.durations.get(key)
+        if histogram is None:
+            histogram = shard.durations[key] = _Histogram(DURATION_BUCKETS)
+        histogram.observe(duration)
+
+        timings = shard.timings.get(route)
+        if timings is None:
+            timings = shard.timings[route] = [0.0, 0.0, 0]
+        timings[0] += db_seconds
+        timings[1] += max(duration - db_seconds, 0.0)
+        timings[2] += queries
+
+    def observe_batch(self, size):
+        self._shard().batch_sizes.observe(size)
+
+    def snapshot(self):
+        """汇总全部分片"""
+        total = _Shard(None)
+        with self._lock:
+            shards = [self._retired] + list(self._shards)
+        for shard in shards:
+            total.merge(shard)
+        return total
+
+    def reset(self):
+        with self._lock:
+            self._shards = []
+            self._retired = _Shard(None)
+        self._local = threading.local()
+
+    def render(self, extra=None):
+        """输出Prometheus文本格式
+
+        Args:
+            extra: {指标名: (类型, 说明, {标签元组: 值})} 形式的其他指标，如连接池状态
+        """
+        total = self.snapshot()
+        lines = []
+
+        _header(lines, 'todo_http_requests_in_flight', 'gauge', "正在处理的请求数")
+        lines.append(f"todo_http_requests_in_flight {total.in_flight}")
+
+        _header(lines, 'todo_http_request_duration_seconds', 'histogram',
+                "请求处理耗时，按路由、方法和状态码统计")
+        for (route, method, status), histogram in sorted(total.durations.items()):
+            _histogram_lines(lines, 'todo_http_request_duration_seconds',
+                             (('route', route), ('method', method), ('status', status)),
+                             histogram)
+
+        # 同一指标的样本必须连续输出
+        timings = sorted(total.timings.items())
+        for index, (name, help_text) in enumerate((
+                ('todo_http_db_seconds_total', "请求中执行SQL的累计耗时"),
+                ('todo_http_handler_seconds_total', "请求中SQL之外的累计处理耗时"),
+                ('todo_http_db_queries_total', "请求中执行的SQL语句数"))):
+            _header(lines, name, 'counter', help_text)
+            for route, values in timings:
+                lines.append(f"{name}{_labels((('route', route),))} {values[index]!r}")
+
+        _header(lines, 'todo_batch_operations', 'histogram', "每次批量同步请求包含的操作数")
+        _histogram_lines(lines, 'todo_batch_operations', (), total.batch_sizes)
+
+        for name, (kind, help_text, values) in (extra or {}).items():
+            _header(lines, name, kind, help_text)
+            for labels, value in values.items():
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _header(lines, name, kind, help_text):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _histogram_lines(lines, name, pairs, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(pairs + (('le', repr(float(bound))),))} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(pairs + (('le', '+Inf'),))} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(pairs)} {histogram.sum!r}")
+    lines.append(f"{name}_count{_labels(pairs)} {histogram.count}")
+
+
+metrics = Metrics()
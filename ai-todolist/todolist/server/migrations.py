@@ -0,0 +1,212 @@
+# migrations.py
+import datetime
+import sqlite3
+import uuid
+
+from auth import hash_password
+from schema import (CHANGE_TRACKING_SQL, USER_STATS_SQL, ANALYTICS_SQL, SEARCH_SQL,
+                    IDEMPOTENCY_SQL, MAINTENANCE_SQL, ARCHIVE_CHANGES_SQL, ensure_indexes, rebuild_user_stats,
+                    rebuild_analytics, rebuild_search_index)
+
+# 数据库结构版本保存在 PRAGMA user_version 中，每个迁移完成后更新为该迁移的版本号。
+# 新增表、列、索引或触发器时在MIGRATIONS末尾添加迁移，已发布的迁移不能修改。
+#
+# 版本0可能是任意旧版本服务器创建的数据库，前几个迁移需要兼容已经存在的表和列。
+
+BASE_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    last_login TEXT,
+    settings TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    category TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    completed_at TEXT,
+    due_date TEXT,
+    due_time TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+"""
+
+
+class MigrationError(RuntimeError):
+    """数据库版本无法由当前代码处理"""
+
+
+def execute_script(conn, script):
+    """在当前事务中逐条执行SQL脚本
+
+    sqlite3的executescript会先提交当前事务，迁移中不能使用。
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        conn.execute(statement)
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _create_base_tables(conn):
+    """创建users和tasks表；早期单用户版本的tasks表补上user_id列，已有任务归属默认管理员"""
+    execute_script(conn, BASE_TABLES_SQL)
+    if 'user_id' in table_columns(conn, 'tasks'):
+        return
+
+    row = conn.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()
+    if row:
+        default_user_id = row[0]
+    else:
+        default_user_id = str(uuid.uuid4())
+        conn.execute("""
+            INSERT INTO users (id, username, email, password_hash, created_at, settings)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (default_user_id, "admin", "admin@example.com", hash_password("admin123"),
+              datetime.datetime.now().isoformat(), '{}'))
+        print("已创建默认用户admin，密码为admin123，请登录后修改")
+
+    # ALTER TABLE的DEFAULT不支持参数绑定，只能写入字面量
+    default = default_user_id.replace("'", "''")
+    conn.execute(f"ALTER TABLE tasks ADD COLUMN user_id TEXT NOT NULL DEFAULT '{default}'")
+
+
+def _add_change_tracking(conn):
+    """添加tasks.seq列及维护变更序列号的触发器，已有任务按插入顺序补齐每个用户内递增的序列号"""
+    if 'seq' not in table_columns(conn, 'tasks'):
+        conn.execute("ALTER TABLE tasks ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        conn.execute("""
+            UPDATE tasks SET seq = (
+                SELECT COUNT(*) FROM tasks t2
+                WHERE t2.user_id = tasks.user_id AND t2.rowid <= tasks.rowid
+            )
+        """)
+    execute_script(conn, CHANGE_TRACKING_SQL)
+    conn.execute("""
+        INSERT OR IGNORE INTO user_seq (user_id, seq)
+        SELECT user_id, MAX(seq) FROM tasks GROUP BY user_id
+    """)
+
+
+def _add_user_stats(conn):
+    execute_script(conn, USER_STATS_SQL)
+    rebuild_user_stats(conn)
+
+
+def _add_analytics(conn):
+    # 旧版本的删除触发器没有归档条件
+    conn.execute("DROP TRIGGER IF EXISTS tasks_analytics_delete")
+    execute_script(conn, ANALYTICS_SQL)
+    rebuild_analytics(conn)
+
+
+def _add_search_index(conn):
+    execute_script(conn, SEARCH_SQL)
+    rebuild_search_index(conn)
+
+
+def _add_idempotency_keys(conn):
+    execute_script(conn, IDEMPOTENCY_SQL)
+
+
+def _add_maintenance(conn):
+    """添加tasks.deleted_at列及维护任务使用的表，已有的删除记录按当前时间计算保留期"""
+    if 'deleted_at' not in table_columns(conn, 'tasks'):
+        conn.execute("ALTER TABLE tasks ADD COLUMN deleted_at TEXT")
+        conn.execute("UPDATE tasks SET deleted_at = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') "
+                     "WHERE deleted = 1")
+    execute_script(conn, MAINTENANCE_SQL)
+
+
+def _add_archive_changes(conn):
+    """添加tasks_archive.seq列，归档的任务出现在增量同步中
+
+    此前归档的任务没有序列号，这些用户的客户端本地可能仍保留着它们：序列号加一并
+    写入sync_horizon，之前同步过的客户端下次增量同步时重新全量同步。
+    """
+    if 'seq' not in table_columns(conn, 'tasks_archive'):
+        conn.execute("ALTER TABLE tasks_archive ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+    execute_script(conn, ARCHIVE_CHANGES_SQL)
+    conn.execute("""
+        UPDATE user_seq SET seq = seq + 1
+        WHERE user_id IN (SELECT DISTINCT user_id FROM tasks_archive WHERE seq = 0)
+    """)
+    conn.execute("""
+        INSERT INTO sync_horizon (user_id, purged_seq)
+        SELECT user_id, seq FROM user_seq
+        WHERE user_id IN (SELECT DISTINCT user_id FROM tasks_archive WHERE seq = 0)
+        ON CONFLICT(user_id) DO UPDATE SET purged_seq = MAX(purged_seq, excluded.purged_seq)
+    """)
+
+
+# (版本号, 说明, 迁移函数)，版本号从1开始连续递增
+MIGRATIONS = [
+    (1, "创建users和tasks表", _create_base_tables),
+    (2, "任务变更序列号", _add_change_tracking),
+    (3, "用户任务统计", _add_user_stats),
+    (4, "统计分析汇总表", _add_analytics),
+    (5, "任务全文索引", _add_search_index),
+    (6, "批量同步幂等键", _add_idempotency_keys),
+    (7, "删除记录清理和任务归档", _add_maintenance),
+    (8, "tasks表复合索引（第5版）", ensure_indexes),
+    (9, "归档任务的变更序列号", _add_archive_changes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """执行尚未完成的迁移，数据库已是最新版本时只执行一次查询
+
+    每个迁移在单独的事务中执行，并在同一事务中更新user_version，失败时回滚
+    该迁移，已完成的迁移不受影响。多个进程同时启动时，后获得写锁的进程会
+    跳过已由其他进程完成的迁移。
+
+    Returns:
+        list: 本次执行的迁移版本号
+    """
+    latest = migrations[-1][0]
+    version = schema_version(conn)
+    if version == latest:
+        return []
+    if version > latest:
+        raise MigrationError(f"数据库版本{version}高于当前代码支持的版本{latest}，请升级服务器")
+
+    applied = []
+    for target, description, step in migrations:
+        if target <= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if target <= version:
+                conn.rollback()
+                continue
+            print(f"执行数据库迁移 {target}: {description}")
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {int(target)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(target)
+    return applied
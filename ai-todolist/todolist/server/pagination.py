@@ -0,0 +1,104 @@
+# pagination.py
+import base64
+import binascii
+import json
+
+# 每页默认和最大返回条数
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# 排序参数 -> (排序列, 是否降序)，排序列都有 (user_id, deleted, 列, id) 索引支持
+SORT_OPTIONS = {
+    'due_date': ('due_date', False),
+    '-due_date': ('due_date', True),
+    'created_at': ('created_at', False),
+    '-created_at': ('created_at', True),
+    'category': ('category', False),
+    '-category': ('category', True),
+}
+
+DEFAULT_SORT = 'created_at'
+
+# 归档任务的排序方式，tasks_archive有 (user_id, completed_at, id) 索引支持
+ARCHIVE_SORT_OPTIONS = {
+    'completed_at': ('completed_at', False),
+    '-completed_at': ('completed_at', True),
+}
+
+DEFAULT_ARCHIVE_SORT = '-completed_at'
+
+
+class PaginationError(ValueError):
+    """分页参数无效"""
+
+
+def parse_limit(value):
+    """解析limit参数，限制在 1..MAX_PAGE_SIZE 之间"""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError("limit必须是整数")
+    if limit < 1:
+        raise PaginationError("limit必须大于0")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_sort(value, options=SORT_OPTIONS, default=DEFAULT_SORT):
+    """解析sort参数"""
+    sort = value or default
+    if sort not in options:
+        raise PaginationError(f"不支持的排序方式: {sort}")
+    return sort
+
+
+def encode_cursor(sort, row, options=SORT_OPTIONS):
+    """根据排序键和任务ID生成不透明游标"""
+    column, _ = options[sort]
+    raw = json.dumps([sort, row[column], row['id']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    """解析游标，返回 (排序键值, 任务ID)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        cursor_sort, value, task_id = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise PaginationError("无效的游标")
+    if cursor_sort != sort:
+        raise PaginationError("游标与排序方式不匹配")
+    # 游标来自客户端，值会直接绑定到SQL参数
+    if not isinstance(task_id, str) or not (value is None or isinstance(value, (str, int, float))):
+        raise PaginationError("无效的游标")
+    return value, task_id
+
+
+def keyset_clause(sort, value, task_id, options=SORT_OPTIONS):
+    """生成游标之后的WHERE条件
+
+    SQLite升序时NULL排在最前，降序时排在最后，需要单独处理。
+
+    Returns:
+        (str, list): SQL条件片段及参数
+    """
+    column, descending = options[sort]
+    op = '<' if descending else '>'
+
+    if value is None:
+        if descending:
+            return f"({column} IS NULL AND id < ?)", [task_id]
+        return f"(({column} IS NULL AND id > ?) OR {column} IS NOT NULL)", [task_id]
+
+    clause = f"({column} {op} ? OR ({column} = ? AND id {op} ?)"
+    if descending:
+        clause += f" OR {column} IS NULL"
+    return clause + ")", [value, value, task_id]
+
+
+def order_clause(sort, options=SORT_OPTIONS):
+    """生成ORDER BY片段"""
+    column, descending = options[sort]
+    direction = 'DESC' if descending else 'ASC'
+    return f"ORDER BY {column} {direction}, id {direction}"
@@ -0,0 +1,205 @@
+# prefork.py
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+
+class PoolWSGIServer(BaseWSGIServer):
+    """使用固定大小线程池处理请求的WSGI服务器，线程全忙时不再accept新连接"""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, fd=fd)
+        # 多个worker共享监听套接字，非阻塞accept避免被其他worker抢走连接后卡住
+        self.socket.setblocking(False)
+        self.timeout = 1.0
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http-worker')
+        self.slots = threading.BoundedSemaphore(threads)
+        self.handled = 0
+
+    def get_request(self):
+        conn, addr = self.socket.accept()
+        conn.setblocking(True)
+        return conn, addr
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.handled += 1
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+
+class PreforkServer:
+    """预先fork多个worker进程的生产环境服务器
+
+    - 主进程创建监听套接字后fork出worker，各worker共享同一个套接字
+    - 应用在fork前加载完成，worker共享只读的代码页；数据库连接等资源由各worker
+      在fork后首次使用时自行创建
+    - worker处理max_requests个请求后退出，由主进程补充新的worker
+    - SIGHUP: 启动一组新worker后平滑关闭旧worker（不重新加载代码）
+    - SIGTERM/SIGINT: 平滑关闭全部worker后退出
+
+    worker_drain在worker停止接受新连接、等待处理中的请求之前调用，用于结束长连接
+    （如事件推送），否则平滑关闭要等到graceful_timeout后被强制结束。
+    worker_exit在worker退出前调用，用于释放worker自行创建的资源（如子进程池）。
+    """
+
+    def __init__(self, app, host='0.0.0.0', port=8080, workers=2, threads=4,
+                 max_requests=0, max_requests_jitter=0, graceful_timeout=30,
+                 worker_drain=None, worker_exit=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.worker_drain = worker_drain
+        self.worker_exit = worker_exit
+
+        self.children = {}  # pid -> 代数
+        self.generation = 0
+        self.running = True
+        self.reload_requested = False
+        self.socket = None
+
+    def _listen(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.port = sock.getsockname()[1]
+        return sock
+
+    def run(self):
+        self.socket = self._listen()
+        signal.signal(signal.SIGHUP, self._on_hup)
+        signal.signal(signal.SIGTERM, self._on_term)
+        signal.signal(signal.SIGINT, self._on_term)
+
+        print(f"主进程 {os.getpid()} 监听 {self.host}:{self.port}, "
+              f"{self.workers} 个worker, 每个 {self.threads} 个线程")
+        self._spawn_generation()
+
+        while self.running:
+            if self.reload_requested:
+                self.reload_requested = False
+                self._reload()
+            self._reap()
+            # 补齐当前代的worker（max_requests回收或异常退出）
+            current = sum(1 for gen in self.children.values() if gen == self.generation)
+            for _ in range(self.workers - current):
+                self._spawn(self.generation)
+            time.sleep(0.5)
+
+        self._stop_children(list(self.children))
+        self.socket.close()
+
+    def _on_hup(self, signum, frame):
+        self.reload_requested = True
+
+    def _on_term(self, signum, frame):
+        self.running = False
+
+    def _spawn_generation(self):
+        self.generation += 1
+        for _ in range(self.workers):
+            self._spawn(self.generation)
+
+    def _reload(self):
+        """平滑重启：先启动新一代worker，再关闭旧worker"""
+        print("收到SIGHUP，重新启动worker")
+        old = list(self.children)
+        self._spawn_generation()
+        self._stop_children(old)
+
+    def _spawn(self, generation):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = generation
+            return pid
+
+        # 子进程
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self._run_worker()
+            code = 0
+        except Exception as e:
+            print(f"worker {os.getpid()} 异常退出: {e}", file=sys.stderr)
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        os._exit(code)
+
+    def _run_worker(self):
+        limit = self.max_requests
+        if limit and self.max_requests_jitter:
+            limit += random.randint(0, self.max_requests_jitter)
+
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        master = os.getppid()
+        server = PoolWSGIServer(self.host, self.port, self.app, self.threads, self.socket.fileno())
+
+        # 主进程意外退出时worker也随之退出
+        while not stopping and os.getppid() == master and (not limit or server.handled < limit):
+            server.handle_request()
+
+        # 结束长连接后等待正在处理的请求完成
+        if self.worker_drain:
+            self.worker_drain()
+        server.executor.shutdown(wait=True)
+        server.socket.close()
+        if self.worker_exit:
+            self.worker_exit()
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.children.pop(pid, None)
+
+    def _stop_children(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+        deadline = time.time() + self.graceful_timeout
+        while any(pid in self.children for pid in pids) and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+
+        for pid in pids:
+            if pid in self.children:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        self._reap()
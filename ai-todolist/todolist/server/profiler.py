@@ -0,0 +1,176 @@
+# profiler.py
+import collections
+import datetime
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+
+from flask import g, request
+
+# 每N个请求采样一个，0表示不按比例采样
+PROFILE_SAMPLE_RATE = int(os.environ.get('TODO_PROFILE_SAMPLE_RATE', '0'))
+# 采样调用栈的间隔（秒）
+PROFILE_INTERVAL = float(os.environ.get('TODO_PROFILE_INTERVAL', '0.001'))
+# 内存中保留的最近剖析结果数
+PROFILE_HISTORY = int(os.environ.get('TODO_PROFILE_HISTORY', '50'))
+# 管理令牌，用于下载剖析结果；请求头PROFILE_HEADER等于该令牌时强制剖析该请求
+ADMIN_TOKEN = os.environ.get('TODO_ADMIN_TOKEN')
+
+PROFILE_HEADER = 'X-Debug-Profile'
+
+
+class Profile:
+    """一次请求的采样结果"""
+
+    def __init__(self, profile_id, thread_id, method, path, route):
+        self.id = profile_id
+        self.thread_id = thread_id
+        self.method = method
+        self.path = path
+        self.route = route
+        self.status = None
+        self.started_at = datetime.datetime.now().isoformat()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.stacks = collections.Counter()
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def collapsed(self):
+        """火焰图工具（如flamegraph.pl、speedscope）使用的折叠栈格式，每行为 栈;栈 次数"""
+        return ''.join(f"{';'.join(stack)} {count}\n"
+                       for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "samples": sum(self.stacks.values())
+        }
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+class SamplingProfiler:
+    """统计剖析器：后台线程定期读取被剖析请求所在线程的调用栈
+
+    只有存在正在剖析的请求时采样线程才会工作，其余请求不受影响。
+    """
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, interval=PROFILE_INTERVAL,
+                 history=PROFILE_HISTORY, admin_token=ADMIN_TOKEN):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.admin_token = admin_token
+        self.profiles = collections.deque(maxlen=history)
+        self._requests = itertools.count(1)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active = {}
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or bool(self.admin_token)
+
+    def is_admin(self, token):
+        return bool(self.admin_token) and token is not None \
+            and hmac.compare_digest(token, self.admin_token)
+
+    def should_profile(self, headers):
+        if self.is_admin(headers.get(PROFILE_HEADER)):
+            return True
+        return self.sample_rate > 0 and next(self._requests) % self.sample_rate == 0
+
+    def start(self, method, path, route):
+        self._ensure_sampler()
+        profile = Profile(next(self._ids), threading.get_ident(), method, path, route)
+        with self._lock:
+            self._active[profile.thread_id] = profile
+        self._wakeup.set()
+        return profile
+
+    def stop(self, profile):
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+        profile.finish()
+        self.profiles.append(profile)
+
+    def get(self, profile_id):
+        for profile in list(self.profiles):
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def _ensure_sampler(self):
+        """采样线程不会被fork出的worker继承，按进程启动"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='profiler', daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            frames = sys._current_frames()
+            for profile in active:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.stacks[_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def install(app, profiler):
+    """为应用注册剖析钩子，未启用剖析时不应调用，请求处理不增加任何开销"""
+
+    @app.before_request
+    def start_profile():
+        if profiler.should_profile(request.headers):
+            rule = request.url_rule.rule if request.url_rule else 'unmatched'
+            g.profile = profiler.start(request.method, request.path, rule)
+
+    @app.after_request
+    def tag_profile(response):
+        profile = g.get('profile')
+        if profile is not None:
+            profile.status = response.status_code
+            response.headers['X-Profile-Id'] = str(profile.id)
+        return response
+
+    @app.teardown_request
+    def stop_profile(exception):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.stop(profile)
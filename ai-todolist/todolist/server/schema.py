@@ -0,0 +1,463 @@
+# schema.py
+import re
+
+# 索引集版本，修改TASK_INDEXES时需同时递增，并在migrations.py中添加调用ensure_indexes的迁移
+INDEX_VERSION = 5
+
+# tasks表的复合索引，索引名带版本后缀，旧版本索引在迁移时被删除
+TASK_INDEXES = {
+    f'idx_tasks_user_deleted_completed_v{INDEX_VERSION}':
+        'tasks (user_id, deleted, completed)',
+    f'idx_tasks_user_deleted_category_v{INDEX_VERSION}':
+        'tasks (user_id, deleted, category, id)',
+    f'idx_tasks_user_deleted_due_date_v{INDEX_VERSION}':
+        'tasks (user_id, deleted, due_date, id)',
+    f'idx_tasks_user_deleted_created_at_v{INDEX_VERSION}':
+        'tasks (user_id, deleted, created_at, id)',
+    f'idx_tasks_user_due_date_time_v{INDEX_VERSION}':
+        'tasks (user_id, due_date, due_time)',
+    f'idx_tasks_user_seq_v{INDEX_VERSION}':
+        'tasks (user_id, seq)',
+    # 后台维护任务查找可清理的删除记录和可归档的已完成任务
+    f'idx_tasks_tombstone_deleted_at_v{INDEX_VERSION}':
+        'tasks (deleted_at) WHERE deleted = 1',
+    f'idx_tasks_done_completed_at_v{INDEX_VERSION}':
+        'tasks (completed_at) WHERE completed = 1 AND deleted = 0',
+}
+
+# 热点查询，启动时检查其查询计划不能退化为全表扫描
+HOT_QUERIES = {
+    'list_tasks': (
+        "SELECT * FROM tasks WHERE deleted = 0 AND user_id = ?", ('u',)),
+    'list_tasks_by_category': (
+        "SELECT * FROM tasks WHERE deleted = 0 AND user_id = ? AND category = ?", ('u', 'c')),
+    'list_tasks_by_completed': (
+        "SELECT * FROM tasks WHERE deleted = 0 AND user_id = ? AND completed = ?", ('u', 0)),
+    'count_tasks': (
+        "SELECT COUNT(*) FROM tasks WHERE user_id = ? AND deleted = 0", ('u',)),
+    'count_completed_tasks': (
+        "SELECT COUNT(*) FROM tasks WHERE user_id = ? AND completed = 1 AND deleted = 0", ('u',)),
+    'task_ownership': (
+        "SELECT * FROM tasks WHERE id = ? AND user_id = ? AND deleted = 0", ('t', 'u')),
+    'list_tasks_by_due_date': (
+        "SELECT * FROM tasks WHERE user_id = ? AND due_date = ?", ('u', '2025-01-01')),
+    'page_tasks_by_due_date': (
+        "SELECT * FROM tasks WHERE deleted = 0 AND user_id = ? "
+        "AND (due_date > ? OR (due_date = ? AND id > ?)) ORDER BY due_date ASC, id ASC LIMIT ?",
+        ('u', '2025-01-01', '2025-01-01', 't', 101)),
+    'page_tasks_by_created_at': (
+        "SELECT * FROM tasks WHERE deleted = 0 AND user_id = ? "
+        "ORDER BY created_at DESC, id DESC LIMIT ?", ('u', 101)),
+    'list_upcoming_tasks': (
+        "SELECT * FROM tasks WHERE deleted = 0 AND user_id = ? AND due_date BETWEEN ? AND ? "
+        "ORDER BY due_date ASC, id ASC LIMIT ?", ('u', '2025-01-01', '2025-01-08', 101)),
+    'list_overdue_tasks': (
+        "SELECT * FROM tasks WHERE deleted = 0 AND user_id = ? AND due_date < ? AND completed = 0",
+        ('u', '2025-01-01')),
+    'count_tasks_due_in_range': (
+        "SELECT COUNT(*), COALESCE(SUM(completed), 0) FROM tasks "
+        "WHERE user_id = ? AND due_date BETWEEN ? AND ? AND deleted = 0",
+        ('u', '2025-01-01', '2025-01-30')),
+    'list_task_changes': (
+        "SELECT * FROM tasks WHERE user_id = ? AND seq > ? ORDER BY seq ASC LIMIT ?",
+        ('u', 0, 501)),
+    'search_tasks': (
+        "SELECT tasks.* FROM tasks_fts JOIN tasks ON tasks.rowid = tasks_fts.rowid "
+        "WHERE tasks_fts MATCH ? ORDER BY search_rank(tasks_fts.tokens, ?), tasks.id LIMIT ?",
+        ('owner:u00 AND tokens:("a")', 'a', 101)),
+    'purge_tombstones': (
+        "SELECT rowid, user_id, seq FROM tasks WHERE deleted = 1 AND deleted_at < ? LIMIT ?",
+        ('2025-01-01', 500)),
+    'archive_completed_tasks': (
+        "SELECT rowid, user_id FROM tasks WHERE completed = 1 AND deleted = 0 "
+        "AND completed_at < ? LIMIT ?", ('2025-01-01', 500)),
+}
+
+_SCAN_PATTERN = re.compile(r'^SCAN (TABLE )?tasks\b')
+
+# 每个用户的变更序列号，任务的创建、修改和软删除都会递增序列号并写入tasks.seq
+CHANGE_TRACKING_SQL = """
+CREATE TABLE IF NOT EXISTS user_seq (
+    user_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS tasks_seq_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT INTO user_seq (user_id, seq) VALUES (NEW.user_id, 1)
+        ON CONFLICT(user_id) DO UPDATE SET seq = seq + 1;
+    UPDATE tasks SET seq = (SELECT seq FROM user_seq WHERE user_id = NEW.user_id)
+        WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tasks_seq_update
+AFTER UPDATE OF text, category, completed, completed_at, due_date, due_time, deleted ON tasks
+BEGIN
+    INSERT INTO user_seq (user_id, seq) VALUES (NEW.user_id, 1)
+        ON CONFLICT(user_id) DO UPDATE SET seq = seq + 1;
+    UPDATE tasks SET seq = (SELECT seq FROM user_seq WHERE user_id = NEW.user_id)
+        WHERE id = NEW.id;
+END;
+"""
+
+
+def index_sql():
+    """返回创建全部索引的SQL语句"""
+    return [f"CREATE INDEX IF NOT EXISTS {name} ON {columns};"
+            for name, columns in TASK_INDEXES.items()]
+
+
+# 用户任务统计计数器，由触发器在写入任务的同一事务中维护
+# user_due_stats 按截止日期记录未完成任务数，用于计算过期任务数
+USER_STATS_SQL = """
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS user_category_stats (
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category)
+);
+
+CREATE TABLE IF NOT EXISTS user_due_stats (
+    user_id TEXT NOT NULL,
+    due_date TEXT NOT NULL,
+    pending INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, due_date)
+);
+
+CREATE TRIGGER IF NOT EXISTS tasks_stats_insert AFTER INSERT ON tasks
+WHEN NEW.deleted = 0
+BEGIN
+    INSERT INTO user_stats (user_id, total, completed) VALUES (NEW.user_id, 1, NEW.completed)
+        ON CONFLICT(user_id) DO UPDATE SET total = total + 1, completed = completed + NEW.completed;
+    INSERT INTO user_category_stats (user_id, category, total, completed)
+        VALUES (NEW.user_id, NEW.category, 1, NEW.completed)
+        ON CONFLICT(user_id, category) DO UPDATE
+        SET total = total + 1, completed = completed + NEW.completed;
+    INSERT INTO user_due_stats (user_id, due_date, pending)
+        SELECT NEW.user_id, NEW.due_date, 1 WHERE NEW.due_date IS NOT NULL AND NEW.completed = 0
+        ON CONFLICT(user_id, due_date) DO UPDATE SET pending = pending + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tasks_stats_delete AFTER DELETE ON tasks
+WHEN OLD.deleted = 0
+BEGIN
+    UPDATE user_stats SET total = total - 1, completed = completed - OLD.completed
+        WHERE user_id = OLD.user_id;
+    UPDATE user_category_stats SET total = total - 1, completed = completed - OLD.completed
+        WHERE user_id = OLD.user_id AND category = OLD.category;
+    UPDATE user_due_stats SET pending = pending - 1
+        WHERE user_id = OLD.user_id AND due_date = OLD.due_date AND OLD.completed = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tasks_stats_update
+AFTER UPDATE OF user_id, category, completed, due_date, deleted ON tasks
+BEGIN
+    UPDATE user_stats SET total = total - 1, completed = completed - OLD.completed
+        WHERE user_id = OLD.user_id AND OLD.deleted = 0;
+    UPDATE user_category_stats SET total = total - 1, completed = completed - OLD.completed
+        WHERE user_id = OLD.user_id AND category = OLD.category AND OLD.deleted = 0;
+    UPDATE user_due_stats SET pending = pending - 1
+        WHERE user_id = OLD.user_id AND due_date = OLD.due_date
+        AND OLD.completed = 0 AND OLD.deleted = 0;
+
+    INSERT INTO user_stats (user_id, total, completed)
+        SELECT NEW.user_id, 1, NEW.completed WHERE NEW.deleted = 0
+        ON CONFLICT(user_id) DO UPDATE SET total = total + 1, completed = completed + NEW.completed;
+    INSERT INTO user_category_stats (user_id, category, total, completed)
+        SELECT NEW.user_id, NEW.category, 1, NEW.completed WHERE NEW.deleted = 0
+        ON CONFLICT(user_id, category) DO UPDATE
+        SET total = total + 1, completed = completed + NEW.completed;
+    INSERT INTO user_due_stats (user_id, due_date, pending)
+        SELECT NEW.user_id, NEW.due_date, 1
+        WHERE NEW.due_date IS NOT NULL AND NEW.completed = 0 AND NEW.deleted = 0
+        ON CONFLICT(user_id, due_date) DO UPDATE SET pending = pending + 1;
+END;
+"""
+
+# 统计分析使用的按天汇总表，由触发器在任务写入时增量维护
+# user_daily_stats按任务创建日期和分类汇总：created为当天创建且未删除的任务数，
+# completed为其中已完成的任务数，completion_days为这些任务从创建到完成的天数之和
+# user_completion_stats按完成时间（日期和小时）汇总已完成且未删除的任务数
+# 归档任务时在同一事务中向archive_guard插入一行，期间从tasks移出的任务仍计入汇总表
+ANALYTICS_SQL = """
+CREATE TABLE IF NOT EXISTS archive_guard (active INTEGER NOT NULL);
+
+CREATE TABLE IF NOT EXISTS user_daily_stats (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    created INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    completion_days REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_completion_stats (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, hour)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS tasks_analytics_insert AFTER INSERT ON tasks
+WHEN NEW.deleted = 0
+BEGIN
+    INSERT INTO user_daily_stats (user_id, day, category, created, completed, completion_days)
+        VALUES (NEW.user_id, substr(NEW.created_at, 1, 10), NEW.category, 1, NEW.completed,
+                CASE WHEN NEW.completed = 1 AND NEW.completed_at IS NOT NULL
+                     THEN julianday(NEW.completed_at) - julianday(NEW.created_at) ELSE 0 END)
+        ON CONFLICT(user_id, day, category) DO UPDATE
+        SET created = created + 1, completed = completed + excluded.completed,
+            completion_days = completion_days + excluded.completion_days;
+    INSERT INTO user_completion_stats (user_id, day, hour, completed)
+        SELECT NEW.user_id, substr(NEW.completed_at, 1, 10),
+               CAST(substr(NEW.completed_at, 12, 2) AS INTEGER), 1
+        WHERE NEW.completed = 1 AND NEW.completed_at IS NOT NULL
+        ON CONFLICT(user_id, day, hour) DO UPDATE SET completed = completed + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tasks_analytics_delete AFTER DELETE ON tasks
+WHEN OLD.deleted = 0 AND NOT EXISTS (SELECT 1 FROM archive_guard)
+BEGIN
+    UPDATE user_daily_stats
+        SET created = created - 1, completed = completed - OLD.completed,
+            completion_days = completion_days -
+                CASE WHEN OLD.completed = 1 AND OLD.completed_at IS NOT NULL
+                     THEN julianday(OLD.completed_at) - julianday(OLD.created_at) ELSE 0 END
+        WHERE user_id = OLD.user_id AND day = substr(OLD.created_at, 1, 10)
+        AND category = OLD.category;
+    UPDATE user_completion_stats SET completed = completed - 1
+        WHERE user_id = OLD.user_id AND day = substr(OLD.completed_at, 1, 10)
+        AND hour = CAST(substr(OLD.completed_at, 12, 2) AS INTEGER)
+        AND OLD.completed = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tasks_analytics_update
+AFTER UPDATE OF user_id, category, completed, completed_at, created_at, deleted ON tasks
+BEGIN
+    UPDATE user_daily_stats
+        SET created = created - 1, completed = completed - OLD.completed,
+            completion_days = completion_days -
+                CASE WHEN OLD.completed = 1 AND OLD.completed_at IS NOT NULL
+                     THEN julianday(OLD.completed_at) - julianday(OLD.created_at) ELSE 0 END
+        WHERE user_id = OLD.user_id AND day = substr(OLD.created_at, 1, 10)
+        AND category = OLD.category AND OLD.deleted = 0;
+    UPDATE user_completion_stats SET completed = completed - 1
+        WHERE user_id = OLD.user_id AND day = substr(OLD.completed_at, 1, 10)
+        AND hour = CAST(substr(OLD.completed_at, 12, 2) AS INTEGER)
+        AND OLD.completed = 1 AND OLD.deleted = 0;
+
+    INSERT INTO user_daily_stats (user_id, day, category, created, completed, completion_days)
+        SELECT NEW.user_id, substr(NEW.created_at, 1, 10), NEW.category, 1, NEW.completed,
+               CASE WHEN NEW.completed = 1 AND NEW.completed_at IS NOT NULL
+                    THEN julianday(NEW.completed_at) - julianday(NEW.created_at) ELSE 0 END
+        WHERE NEW.deleted = 0
+        ON CONFLICT(user_id, day, category) DO UPDATE
+        SET created = created + 1, completed = completed + excluded.completed,
+            completion_days = completion_days + excluded.completion_days;
+    INSERT INTO user_completion_stats (user_id, day, hour, completed)
+        SELECT NEW.user_id, substr(NEW.completed_at, 1, 10),
+               CAST(substr(NEW.completed_at, 12, 2) AS INTEGER), 1
+        WHERE NEW.completed = 1 AND NEW.completed_at IS NOT NULL AND NEW.deleted = 0
+        ON CONFLICT(user_id, day, hour) DO UPDATE SET completed = completed + 1;
+END;
+"""
+
+
+def rebuild_analytics(conn):
+    """根据tasks表和归档任务重新计算统计分析汇总表，在调用方的事务中执行，不提交"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'tasks_archive'")
+    source = "SELECT user_id, category, created_at, completed, completed_at FROM tasks WHERE deleted = 0"
+    if cursor.fetchone():
+        source += (" UNION ALL SELECT user_id, category, created_at, 1, completed_at "
+                   "FROM tasks_archive")
+
+    cursor.execute("DELETE FROM user_daily_stats")
+    cursor.execute("DELETE FROM user_completion_stats")
+    cursor.execute(f"""
+        INSERT INTO user_daily_stats (user_id, day, category, created, completed, completion_days)
+        SELECT user_id, substr(created_at, 1, 10), category, COUNT(*), SUM(completed),
+               TOTAL(CASE WHEN completed = 1 AND completed_at IS NOT NULL
+                          THEN julianday(completed_at) - julianday(created_at) ELSE 0 END)
+        FROM ({source})
+        GROUP BY user_id, substr(created_at, 1, 10), category
+    """)
+    cursor.execute(f"""
+        INSERT INTO user_completion_stats (user_id, day, hour, completed)
+        SELECT user_id, substr(completed_at, 1, 10), CAST(substr(completed_at, 12, 2) AS INTEGER),
+               COUNT(*)
+        FROM ({source}) WHERE completed = 1 AND completed_at IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)
+
+
+# 批量同步已处理的幂等键及其响应，重试时直接返回保存的响应
+IDEMPOTENCY_SQL = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_user_created
+    ON idempotency_keys (user_id, created_at);
+"""
+
+# 后台维护任务使用的表
+# sync_clients记录每个客户端确认已同步到的序列号，删除记录在所有活跃客户端同步之后才会清理
+# sync_horizon记录每个用户已清理的删除记录的最大序列号，早于它的增量同步需要重新全量同步
+# tasks_archive保存从tasks移出的已完成任务，供历史记录查询
+MAINTENANCE_SQL = """
+CREATE TABLE IF NOT EXISTS sync_clients (
+    user_id TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    last_seen TEXT NOT NULL,
+    PRIMARY KEY (user_id, client_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sync_horizon (
+    user_id TEXT PRIMARY KEY,
+    purged_seq INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tasks_archive (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    category TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    completed_at TEXT NOT NULL,
+    due_date TEXT,
+    due_time TEXT,
+    archived_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_archive_user_completed
+    ON tasks_archive (user_id, completed_at, id);
+
+CREATE TABLE IF NOT EXISTS maintenance_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS tasks_deleted_at AFTER UPDATE OF deleted ON tasks
+WHEN NEW.deleted != OLD.deleted
+BEGIN
+    UPDATE tasks SET deleted_at = CASE WHEN NEW.deleted = 1
+        THEN strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') END
+        WHERE rowid = NEW.rowid;
+END;
+"""
+
+# 归档任务的变更序列号，归档时与任务变更共用user_seq递增，增量同步和推送中作为删除返回
+ARCHIVE_CHANGES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_archive_user_seq ON tasks_archive (user_id, seq);
+"""
+
+# 任务文本的全文索引，rowid与tasks.rowid对应，只索引未删除的任务
+# tokens列保存jieba分词结果（jieba_tokens函数由search.register_functions注册），
+# owner列保存所属用户，搜索时与关键词一起匹配，只读取当前用户的倒排列表
+SEARCH_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(owner, tokens);
+
+CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks
+WHEN NEW.deleted = 0
+BEGIN
+    INSERT INTO tasks_fts (rowid, owner, tokens)
+    VALUES (NEW.rowid, 'u' || hex(NEW.user_id), jieba_tokens(NEW.text));
+END;
+
+CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks
+BEGIN
+    DELETE FROM tasks_fts WHERE rowid = OLD.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF text, deleted, user_id ON tasks
+BEGIN
+    DELETE FROM tasks_fts WHERE rowid = OLD.rowid;
+    INSERT INTO tasks_fts (rowid, owner, tokens)
+    SELECT NEW.rowid, 'u' || hex(NEW.user_id), jieba_tokens(NEW.text) WHERE NEW.deleted = 0;
+END;
+"""
+
+
+def rebuild_search_index(conn):
+    """根据tasks表重建全文索引，在调用方的事务中执行，不提交"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tasks_fts")
+    cursor.execute("""
+        INSERT INTO tasks_fts (rowid, owner, tokens)
+        SELECT rowid, 'u' || hex(user_id), jieba_tokens(text) FROM tasks WHERE deleted = 0
+    """)
+
+
+def rebuild_user_stats(conn):
+    """根据tasks表重新计算全部用户统计计数器，在调用方的事务中执行，不提交"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM user_stats")
+    cursor.execute("DELETE FROM user_category_stats")
+    cursor.execute("DELETE FROM user_due_stats")
+    cursor.execute("""
+        INSERT INTO user_stats (user_id, total, completed)
+        SELECT user_id, COUNT(*), SUM(completed) FROM tasks WHERE deleted = 0 GROUP BY user_id
+    """)
+    cursor.execute("""
+        INSERT INTO user_category_stats (user_id, category, total, completed)
+        SELECT user_id, category, COUNT(*), SUM(completed) FROM tasks
+        WHERE deleted = 0 GROUP BY user_id, category
+    """)
+    cursor.execute("""
+        INSERT INTO user_due_stats (user_id, due_date, pending)
+        SELECT user_id, due_date, COUNT(*) FROM tasks
+        WHERE deleted = 0 AND completed = 0 AND due_date IS NOT NULL GROUP BY user_id, due_date
+    """)
+
+
+def ensure_indexes(conn):
+    """创建当前版本的索引，并删除不再使用的旧版本索引，由迁移调用"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'tasks' "
+                   "AND name LIKE 'idx_tasks_%'")
+    existing = {row[0] for row in cursor.fetchall()}
+
+    for name in existing - set(TASK_INDEXES):
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+    for statement in index_sql():
+        cursor.execute(statement)
+
+
+def check_query_plans(conn):
+    """对热点查询执行EXPLAIN QUERY PLAN，返回退化为全表扫描的查询
+
+    Returns:
+        dict: 查询名称 -> 查询计划详情列表，没有问题时为空
+    """
+    problems = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        details = [row[3] for row in rows]
+        if any(_SCAN_PATTERN.match(detail) for detail in details):
+            problems[name] = details
+    return problems
+
+
+def assert_query_plans(conn):
+    """热点查询出现全表扫描时抛出RuntimeError"""
+    problems = check_query_plans(conn)
+    if problems:
+        lines = [f"{name}: {'; '.join(details)}" for name, details in problems.items()]
+        raise RuntimeError("以下查询未使用索引:\n" + "\n".join(lines))
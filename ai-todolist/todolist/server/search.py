@@ -0,0 +1,104 @@
+# search.py
+import base64
+import binascii
+import json
+
+import jieba
+
+from pagination import PaginationError
+
+# 搜索关键词的最大长度
+MAX_QUERY_LENGTH = 200
+# 相关度的词频饱和参数和长度归一化参数，含义与bm25相同
+RANK_K1 = 1.2
+RANK_B = 0.75
+# 长度归一化使用的固定平均词数，不随索引中的其他任务变化
+RANK_AVERAGE_LENGTH = 10.0
+
+
+class SearchError(ValueError):
+    """搜索参数无效"""
+
+
+def initialize():
+    """预先加载jieba词典，避免第一次搜索或写入任务时等待"""
+    jieba.initialize()
+
+
+def tokenize(text):
+    """使用jieba搜索引擎模式分词，结果以空格分隔，交给FTS5的unicode61分词器
+
+    搜索引擎模式在词语之外还会输出长词中的短词，如"项目周报"会同时索引
+    "项目"、"周报"和"项目周报"。
+    """
+    if not text:
+        return ''
+    return ' '.join(word.lower() for word in jieba.cut_for_search(text) if word.strip())
+
+
+def rank(tokens, words):
+    """任务与关键词的相关度，越小越相关
+
+    与bm25一样按词频和任务长度计算，但不使用索引中其他任务的统计（任务总数、
+    平均长度、包含关键词的任务数），其他用户写入任务时已有任务的相关度不变，
+    分页游标保持有效。words为空格分隔的关键词，最后一个词按前缀匹配。
+    """
+    if not tokens:
+        return 0.0
+    # 每个词前后各有一个空格，用字符串计数代替拆分，每行匹配结果都会调用
+    padded = ' ' + tokens.replace(' ', '  ') + ' '
+    terms = words.split(' ')
+    norm = RANK_K1 * (1 - RANK_B + RANK_B * (tokens.count(' ') + 1) / RANK_AVERAGE_LENGTH)
+    score = 0.0
+    for term in terms[:-1]:
+        tf = padded.count(f' {term} ')
+        score += tf * (RANK_K1 + 1) / (tf + norm)
+    tf = padded.count(' ' + terms[-1])
+    score += tf * (RANK_K1 + 1) / (tf + norm)
+    return -score
+
+
+def register_functions(conn):
+    """注册全文索引的触发器和搜索排序使用的SQL函数，每个连接都需要调用"""
+    conn.create_function('jieba_tokens', 1, tokenize, deterministic=True)
+    conn.create_function('search_rank', 2, rank, deterministic=True)
+
+
+def owner_token(user_id):
+    """索引中标识任务所属用户的词，与触发器中的 'u' || hex(user_id) 一致"""
+    return 'u' + user_id.encode('utf-8').hex()
+
+
+def query_words(query):
+    """将搜索关键词分词，返回空格分隔的词，作为search_rank的参数"""
+    if len(query) > MAX_QUERY_LENGTH:
+        raise SearchError(f"搜索关键词不能超过{MAX_QUERY_LENGTH}个字符")
+    words = [word for word in tokenize(query).split(' ') if any(c.isalnum() for c in word)]
+    if not words:
+        raise SearchError("缺少搜索关键词")
+    return ' '.join(words)
+
+
+def match_expression(user_id, words):
+    """将query_words的结果转换为FTS5查询，所有词都要出现，最后一个词按前缀匹配"""
+    terms = ['"' + word.replace('"', '""') + '"' for word in words.split(' ')]
+    terms[-1] += '*'
+    return f"owner:{owner_token(user_id)} AND tokens:({' AND '.join(terms)})"
+
+
+def encode_cursor(score, task_id):
+    """根据相关度和任务ID生成不透明游标"""
+    raw = json.dumps(['search', score, task_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (相关度, 任务ID)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        kind, score, task_id = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise PaginationError("无效的游标")
+    if kind != 'search' or not isinstance(score, (int, float)) or not isinstance(task_id, str):
+        raise PaginationError("无效的游标")
+    return score, task_id
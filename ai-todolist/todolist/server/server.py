@@ -1,10 +1,37 @@
 # main.py
-from flask import Flask, request, jsonify, g, send_from_directory
+from flask import Flask, Response, request, jsonify, g, send_from_directory
 import sqlite3
 import os
+import sys
+import argparse
 import datetime
+import hashlib
+import hmac
+import time
 import uuid
-from auth import hash_password, verify_password, generate_token, login_required
+from auth import (hash_password, verify_password, needs_rehash, generate_token, login_required,
+                  decode_token, shutdown_hash_pool, token_cache, HashingBusy)
+from db import ConnectionPool, DatabaseBusy, reset_query_time, query_time, SUPPORTS_RETURNING
+from metrics import metrics, METRICS_TOKEN
+from profiler import SamplingProfiler, install as install_profiler
+from schema import rebuild_user_stats, rebuild_analytics, rebuild_search_index, assert_query_plans
+from migrations import migrate
+from pagination import (PaginationError, parse_limit, parse_sort, decode_cursor,
+                        encode_cursor, keyset_clause, order_clause, ARCHIVE_SORT_OPTIONS,
+                        DEFAULT_ARCHIVE_SORT)
+from maintenance import MaintenanceScheduler, run_maintenance
+from group_commit import GroupCommitWriter, GROUP_COMMIT
+from task_filters import FilterError, date_filter_clauses
+from idempotency import (IdempotencyError, validate_key, fingerprint, load_responses,
+                         store_responses, BATCH_PREFIX, OP_PREFIX)
+from compression import negotiate, compress_response
+from assets import AssetManifest, HTML_CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL
+from analytics import (AnalyticsError, parse_range, parse_day, parse_granularity, bucket_start,
+                       bucket_starts, rate, group_by_period)
+from search import (SearchError, match_expression, query_words, register_functions,
+                    initialize as load_search, encode_cursor as encode_search_cursor, decode_cursor as decode_search_cursor)
+from events import (EventPoller, broker, format_event, reset_event, EVENT_KEEPALIVE,
+                    EVENT_MAX_STREAMS, EVENT_POLL, EVENT_REPLAY_LIMIT)
 # 在文件顶部添加需要的导入
 # from ..aitask.llm_factory import LLMFactory
 # from ..aitask.llm_parser import LLMTaskParser
@@ -18,49 +45,215 @@ app = Flask(__name__,
             static_folder=os.path.join(WEB_DIR, 'static'),
             static_url_path='/static')
 CORS(app)
+
+# 请求指标最先开始、最后结束，包含其他钩子（如响应压缩）的耗时
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    reset_query_time()
+    metrics.request_started()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        db_seconds, queries = query_time()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.request_finished(route, request.method, response.status_code,
+                                 time.perf_counter() - started, db_seconds, queries)
+    return response
+
+# 采样剖析，未设置TODO_PROFILE_SAMPLE_RATE和TODO_ADMIN_TOKEN时不注册任何钩子
+profiler = SamplingProfiler()
+if profiler.enabled:
+    install_profiler(app, profiler)
+
 # 数据库配置
-DATABASE = os.path.join(os.path.dirname(__file__), 'todo_server.db')
+DATABASE = os.environ.get('TODO_DATABASE', os.path.join(os.path.dirname(__file__), 'todo_server.db'))
+
+# 数据库连接池，首次使用时创建
+_pool = None
+
+# 后台数据库维护，由main()根据配置启用
+maintenance_scheduler = None
+
+# 增量同步请求中客户端标识的最大长度
+MAX_CLIENT_ID_LENGTH = 64
+
+# 静态文件在启动时计算内容哈希并预先压缩，HTML页面中的引用改写为带哈希的路径
+assets = AssetManifest(app.static_folder, WEB_DIR).load()
+
+def asset_response(asset, cache_control):
+    """返回内存中的文件，按Accept-Encoding选择预压缩的版本"""
+    encoding = negotiate(request.headers.get('Accept-Encoding'), asset.encodings)
+    response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if asset.encodings:
+        response.vary.add('Accept-Encoding')
+    # 不同压缩格式的内容不同，使用不同的ETag
+    response.set_etag(asset.digest[:32] + (f'-{encoding}' if encoding else ''))
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+def serve_page(filename):
+    """返回HTML页面，启动后新增的页面交给send_from_directory处理"""
+    page = assets.page(filename)
+    if page is None:
+        return send_from_directory(WEB_DIR, filename)
+    return asset_response(page, HTML_CACHE_CONTROL)
 
 # 首页
 @app.route('/')
 def index():
-    return send_from_directory(WEB_DIR, 'index.html')
+    return serve_page('index.html')
 
 # 登录页面
 @app.route('/login.html')
 def login_page():
-    return send_from_directory(WEB_DIR, 'login.html')
+    return serve_page('login.html')
 
 # 注册页面
 @app.route('/register.html')
 def register_page():
-    return send_from_directory(WEB_DIR, 'register.html')
+    return serve_page('register.html')
 
 # 应用主页面
 @app.route('/dashboard.html')
 def dashboard_page():
-    return send_from_directory(WEB_DIR, 'dashboard.html')
+    return serve_page('dashboard.html')
 
 # 其他HTML页面
 @app.route('/<path:path>')
 def serve_html(path):
     if path.endswith('.html'):
-        return send_from_directory(WEB_DIR, path)
-    return send_from_directory(WEB_DIR, 'index.html')  # 默认返回首页
+        return serve_page(path)
+    return serve_page('index.html')  # 默认返回首页
+
+def serve_static(filename):
+    """返回静态文件，带哈希的路径允许长期缓存，原路径每次重新验证"""
+    asset, immutable = assets.static(filename)
+    if asset is None:
+        return app.send_static_file(filename)
+    return asset_response(asset, IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache')
+
+app.view_functions['static'] = serve_static
+
+@app.before_request
+def start_background_jobs():
+    """在处理请求的进程中启动后台维护线程，fork出的worker在第一个请求时启动"""
+    if maintenance_scheduler is not None:
+        maintenance_scheduler.ensure_started()
+
+@app.after_request
+def compress_json(response):
+    """较大的JSON响应按客户端支持的格式压缩"""
+    return compress_response(response, request.headers.get('Accept-Encoding'))
+
+def get_pool():
+    """获取数据库连接池"""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(DATABASE, on_connect=register_functions)
+    return _pool
+
+def close_pool():
+    """关闭数据库连接池"""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+def _reset_pool_after_fork():
+    """子进程不能复用父进程的SQLite连接，首次访问数据库时重新创建连接池
+
+    预先fork的主进程在fork前已关闭连接池，这里只丢弃残留的引用。
+    """
+    global _pool
+    _pool = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
 
 def get_db():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """获取当前应用上下文绑定的数据库连接"""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
 
-def init_db():
-    """初始化数据库"""
-    with app.app_context():
+@app.teardown_appcontext
+def release_db(exception):
+    """请求结束时将连接归还连接池"""
+    db = g.pop('db', None)
+    if db is not None:
+        get_pool().release(db)
+
+# 组提交写线程，设置TODO_GROUP_COMMIT后启用
+group_writer = GroupCommitWriter(get_pool) if GROUP_COMMIT else None
+
+def run_write(operation):
+    """执行写操作operation(conn)并提交，返回其结果
+
+    启用组提交时交给写线程与其他请求的写操作合并提交，否则使用当前请求的连接。
+    operation只能通过传入的连接访问数据库。写锁等待超时等数据库错误转换为
+    DatabaseBusy，返回503。
+    """
+    try:
+        if group_writer is not None:
+            return group_writer.submit(operation)
         db = get_db()
-        with app.open_resource('schema.sql', mode='r') as f:
-            db.cursor().executescript(f.read())
-        db.commit()
+        try:
+            result = operation(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return result
+    except sqlite3.OperationalError as e:
+        app.logger.error(f"写入任务失败: {e}")
+        raise DatabaseBusy(str(e)) from e
+
+def busy_response():
+    """密码哈希队列或数据库连接池已满时返回503"""
+    response = jsonify({"error": "服务器繁忙，请稍后重试"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.errorhandler(DatabaseBusy)
+def database_busy(error):
+    """连接池等待超时或写锁等待超时"""
+    return busy_response()
+
+def get_purged_seq(cursor, user_id):
+    """读取用户已清理的删除记录的最大序列号"""
+    cursor.execute("SELECT purged_seq FROM sync_horizon WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    return row['purged_seq'] if row else 0
+
+def get_user_seq(cursor):
+    """读取当前用户的任务变更序列号"""
+    cursor.execute("SELECT seq FROM user_seq WHERE user_id = ?", (g.user_id,))
+    row = cursor.fetchone()
+    return row['seq'] if row else 0
+
+def make_etag(*parts):
+    """根据版本信息生成ETag"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:20]
+
+def not_modified(etag):
+    """客户端缓存的ETag仍然有效时返回304响应，否则返回None"""
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+def with_etag(response, etag):
+    """为响应设置ETag，要求客户端每次重新验证"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # 用户注册
 @app.route('/v1/auth/register', methods=['POST'])
@@ -84,7 +277,10 @@ def register():
     # 创建新用户
     user_id = str(uuid.uuid4())
     now = datetime.datetime.now().isoformat()
-    password_hash = hash_password(data['password'])
+    try:
+        password_hash = hash_password(data['password'])
+    except HashingBusy:
+        return busy_response()
     
     cursor.execute(
         """
@@ -119,13 +315,24 @@ def login():
     # 查找用户
     cursor.execute("SELECT * FROM users WHERE username = ?", (data['username'],))
     user = cursor.fetchone()
-    print(user)
-    if not user or not verify_password(user['password_hash'], data['password']):
-        return jsonify({"error": "用户名或密码错误"}), 401
+    try:
+        if not user or not verify_password(user['password_hash'], data['password']):
+            return jsonify({"error": "用户名或密码错误"}), 401
+    except HashingBusy:
+        return busy_response()
+    
+    # 迭代次数变化后使用新的配置重新哈希，哈希队列繁忙时保留旧哈希，下次登录再处理
+    password_hash = user['password_hash']
+    if needs_rehash(password_hash):
+        try:
+            password_hash = hash_password(data['password'])
+        except HashingBusy:
+            pass
     
     # 更新最后登录时间
     now = datetime.datetime.now().isoformat()
-    cursor.execute("UPDATE users SET last_login = ? WHERE id = ?", (now, user['id']))
+    cursor.execute("UPDATE users SET last_login = ?, password_hash = ? WHERE id = ?",
+                   (now, password_hash, user['id']))
     db.commit()
     
     # 生成并返回JWT令牌
@@ -152,15 +359,28 @@ def get_current_user():
     if not user:
         return jsonify({"error": "用户不存在"}), 404
     
-    # 统计用户任务信息
-    cursor.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ? AND deleted = 0", (g.user_id,))
-    total_tasks = cursor.fetchone()[0]
+    # 用户信息、任务序列号和日期（过期任务数依赖日期）都未变化时直接返回304
+    etag = make_etag('me', tuple(user), get_user_seq(cursor), datetime.date.today())
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    cursor.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ? AND completed = 1 AND deleted = 0", 
-                  (g.user_id,))
-    completed_tasks = cursor.fetchone()[0]
+    # 读取触发器维护的任务统计计数器
+    cursor.execute("SELECT total, completed FROM user_stats WHERE user_id = ?", (g.user_id,))
+    stats = cursor.fetchone()
+    total_tasks = stats['total'] if stats else 0
+    completed_tasks = stats['completed'] if stats else 0
     
-    return jsonify({
+    cursor.execute("SELECT COALESCE(SUM(pending), 0) FROM user_due_stats WHERE user_id = ? AND due_date < ?",
+                   (g.user_id, datetime.date.today().isoformat()))
+    overdue_tasks = cursor.fetchone()[0]
+    
+    cursor.execute("SELECT category, total, completed FROM user_category_stats WHERE user_id = ? AND total > 0",
+                   (g.user_id,))
+    categories = {row['category']: {"total": row['total'], "completed": row['completed']}
+                  for row in cursor.fetchall()}
+    
+    return with_etag(jsonify({
         "id": user['id'],
         "username": user['username'],
         "email": user['email'],
@@ -169,9 +389,11 @@ def get_current_user():
         "settings": user['settings'],
         "stats": {
             "total_tasks": total_tasks,
-            "completed_tasks": completed_tasks
+            "completed_tasks": completed_tasks,
+            "overdue_tasks": overdue_tasks,
+            "categories": categories
         }
-    })
+    }), etag)
 
 # 修改用户设置
 @app.route('/v1/users/me/settings', methods=['PUT'])
@@ -210,9 +432,25 @@ def get_tasks():
     category = request.args.get('category')
     completed = request.args.get('completed')
     
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        sort = parse_sort(request.args.get('sort'))
+        cursor_arg = request.args.get('cursor')
+        after = decode_cursor(cursor_arg, sort) if cursor_arg else None
+        date_clauses, date_params = date_filter_clauses(request.args)
+    except (PaginationError, FilterError) as e:
+        return jsonify({"error": str(e)}), 400
+    
     db = get_db()
     cursor = db.cursor()
     
+    # 任务未变化时不查询任务数据，直接返回304
+    etag = make_etag('tasks', g.user_id, get_user_seq(cursor), request.query_string.decode('utf-8'),
+                     datetime.date.today())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
     # 构建查询，添加用户ID过滤
     query = "SELECT * FROM tasks WHERE deleted = 0 AND user_id = ?"
     params = [g.user_id]
@@ -225,24 +463,239 @@ def get_tasks():
         query += " AND completed = ?"
         params.append(1 if completed.lower() == 'true' else 0)
     
+    # 截止日期过滤
+    for clause in date_clauses:
+        query += " AND " + clause
+    params.extend(date_params)
+    
+    # 游标分页：只取游标之后的记录
+    if after:
+        clause, clause_params = keyset_clause(sort, *after)
+        query += " AND " + clause
+        params.extend(clause_params)
+    
+    # 多取一条用于判断是否还有下一页
+    query += f" {order_clause(sort)} LIMIT ?"
+    params.append(limit + 1)
+    
     cursor.execute(query, params)
     tasks = cursor.fetchall()
     
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(sort, tasks[-1])
+    
     # 转换为JSON友好的格式
-    result = []
-    for task in tasks:
-        result.append({
-            'id': task['id'],
-            'text': task['text'],
-            'category': task['category'],
-            'completed': task['completed'] == 1,
-            'created_at': task['created_at'],
-            'completed_at': task['completed_at'],
-            'due_date': task['due_date'],
-            'due_time': task['due_time']
-        })
+    result = [task_dict(task) for task in tasks]
+    
+    return with_etag(jsonify({"tasks": result, "next_cursor": next_cursor}), etag)
+
+# 写操作返回的列，即task_dict需要的列
+TASK_RETURNING = "id, text, category, completed, created_at, completed_at, due_date, due_time"
+
+def task_dict(task):
+    """将任务行转换为列表接口返回的格式"""
+    return {
+        'id': task['id'],
+        'text': task['text'],
+        'category': task['category'],
+        'completed': task['completed'] == 1,
+        'created_at': task['created_at'],
+        'completed_at': task['completed_at'],
+        'due_date': task['due_date'],
+        'due_time': task['due_time']
+    }
+
+# 全文搜索 - 按相关度排序，分页方式与任务列表相同
+@app.route('/v1/tasks/search', methods=['GET'])
+@login_required
+def search_tasks():
+    try:
+        words = query_words(request.args.get('q', '').strip())
+        limit = parse_limit(request.args.get('limit'))
+        cursor_arg = request.args.get('cursor')
+        after = decode_search_cursor(cursor_arg) if cursor_arg else None
+    except (SearchError, PaginationError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    db = get_db()
+    cursor = db.cursor()
+    
+    etag = make_etag('search', g.user_id, get_user_seq(cursor), request.query_string.decode('utf-8'))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # search_rank越小越相关；不使用bm25，它依赖全部用户任务的统计，翻页期间
+    # 其他用户写入任务会改变已返回任务的相关度，游标前后的结果会重复或遗漏
+    query = """
+        SELECT tasks.*, search_rank(tasks_fts.tokens, ?) AS score
+        FROM tasks_fts JOIN tasks ON tasks.rowid = tasks_fts.rowid
+        WHERE tasks_fts MATCH ?
+    """
+    params = [words, match_expression(g.user_id, words)]
+    if after:
+        query += " AND (score > ? OR (score = ? AND tasks.id > ?))"
+        params.extend([after[0], after[0], after[1]])
+    query += " ORDER BY score, tasks.id LIMIT ?"
+    params.append(limit + 1)
+    
+    try:
+        cursor.execute(query, params)
+    except sqlite3.OperationalError as e:
+        # 关键词无法解析为FTS5查询
+        return jsonify({"error": f"无效的搜索关键词: {str(e)}"}), 400
+    tasks = cursor.fetchall()
+    
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_search_cursor(tasks[-1]['score'], tasks[-1]['id'])
+    
+    return with_etag(jsonify({"tasks": [task_dict(task) for task in tasks],
+                              "next_cursor": next_cursor}), etag)
+
+def task_change_dict(task):
+    """将任务行转换为增量同步和推送事件使用的格式"""
+    return {
+        'id': task['id'],
+        'text': task['text'],
+        'category': task['category'],
+        'completed': task['completed'] == 1,
+        'created_at': task['created_at'],
+        'completed_at': task['completed_at'],
+        'due_date': task['due_date'],
+        'due_time': task['due_time'],
+        'deleted': task['deleted'] == 1,
+        'seq': task['seq']
+    }
+
+def archived_change_dict(task):
+    """归档的任务在增量同步和推送事件中作为删除返回"""
+    return dict(task_change_dict(dict(task, completed=1, deleted=1)), archived=True)
+
+def change_dict(row):
+    """CHANGES_QUERY返回的行转换为变更格式"""
+    return archived_change_dict(row) if row['archived'] else task_change_dict(row)
+
+# 指定序列号之后的任务变更，包括归档时移出tasks的任务，参数为 (用户ID, 序列号, 条数)
+CHANGES_QUERY = """
+    SELECT id, text, category, completed, created_at, completed_at, due_date, due_time,
+           deleted, seq, 0 AS archived
+    FROM tasks WHERE user_id = :user_id AND seq > :since
+    UNION ALL
+    SELECT id, text, category, 1, created_at, completed_at, due_date, due_time, 1, seq, 1
+    FROM tasks_archive WHERE user_id = :user_id AND seq > :since
+    ORDER BY seq ASC LIMIT :limit
+"""
+
+def publish_archived(rows):
+    """后台维护归档任务后向在线客户端推送删除事件，不需要应用上下文"""
+    if event_poller is not None:
+        event_poller.wake()
+        return
+    events = {}
+    for row in rows:
+        events.setdefault(row['user_id'], []).append(
+            {"id": row['seq'], "type": "task.deleted", "data": archived_change_dict(row)})
+    for user_id, user_events in events.items():
+        if broker.has_subscribers(user_id):
+            broker.publish(user_id, user_events)
+
+# 增量同步 - 返回指定序列号之后创建、修改或删除的任务
+@app.route('/v1/tasks/changes', methods=['GET'])
+@login_required
+def get_task_changes():
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({"error": "since必须是整数"}), 400
+    
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    client_id = request.headers.get('X-Client-Id')
+    if client_id is not None and not 0 < len(client_id) <= MAX_CLIENT_ID_LENGTH:
+        return jsonify({"error": f"X-Client-Id长度必须在1到{MAX_CLIENT_ID_LENGTH}之间"}), 400
+    
+    db = get_db()
+    cursor = db.cursor()
+    
+    # since之后的删除记录已被清理，客户端无法得知哪些任务被删除，需要重新全量同步
+    if since > 0 and since < get_purged_seq(cursor, g.user_id):
+        return jsonify({"error": "同步记录已过期，请重新同步", "reset": True,
+                        "seq": get_user_seq(cursor)}), 410
+    
+    # 客户端确认已同步到since，维护任务据此判断删除记录能否清理
+    if client_id:
+        cursor.execute("""
+            INSERT INTO sync_clients (user_id, client_id, seq, last_seen) VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id, client_id) DO UPDATE
+            SET seq = excluded.seq, last_seen = excluded.last_seen
+        """, (g.user_id, client_id, since, datetime.datetime.now().isoformat()))
+        db.commit()
+    
+    cursor.execute(CHANGES_QUERY, {"user_id": g.user_id, "since": since, "limit": limit + 1})
+    tasks = cursor.fetchall()
+    
+    has_more = len(tasks) > limit
+    tasks = tasks[:limit]
+    
+    if tasks:
+        seq = tasks[-1]['seq']
+    else:
+        cursor.execute("SELECT seq FROM user_seq WHERE user_id = ?", (g.user_id,))
+        row = cursor.fetchone()
+        seq = max(since, row['seq']) if row else since
+    
+    changes = [change_dict(task) for task in tasks]
     
-    return jsonify({"tasks": result})
+    return jsonify({"changes": changes, "seq": seq, "has_more": has_more})
+
+# 归档任务 - 完成时间较早、已由后台维护移入归档表的任务，供历史记录查看
+@app.route('/v1/tasks/archive', methods=['GET'])
+@login_required
+def get_archived_tasks():
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        sort = parse_sort(request.args.get('sort'), ARCHIVE_SORT_OPTIONS, DEFAULT_ARCHIVE_SORT)
+        cursor_arg = request.args.get('cursor')
+        after = decode_cursor(cursor_arg, sort) if cursor_arg else None
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    db = get_db()
+    cursor = db.cursor()
+    
+    # 归档时会递增用户的变更序列号
+    etag = make_etag('archive', g.user_id, get_user_seq(cursor), request.query_string.decode('utf-8'))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    query = "SELECT * FROM tasks_archive WHERE user_id = ?"
+    params = [g.user_id]
+    if after:
+        clause, clause_params = keyset_clause(sort, *after, options=ARCHIVE_SORT_OPTIONS)
+        query += " AND " + clause
+        params.extend(clause_params)
+    query += f" {order_clause(sort, ARCHIVE_SORT_OPTIONS)} LIMIT ?"
+    params.append(limit + 1)
+    
+    cursor.execute(query, params)
+    tasks = cursor.fetchall()
+    
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(sort, tasks[-1], ARCHIVE_SORT_OPTIONS)
+    
+    result = [dict(task_dict(dict(task, completed=1)), archived_at=task['archived_at'])
+              for task in tasks]
+    return with_etag(jsonify({"tasks": result, "next_cursor": next_cursor}), etag)
 
 # 创建新任务 - 添加用户关联
 @app.route('/v1/tasks', methods=['POST'])
@@ -253,10 +706,8 @@ def create_task():
     if not data or 'text' not in data or 'category' not in data:
         return jsonify({"error": "缺少必要字段"}), 400
     
-    db = get_db()
-    cursor = db.cursor()
-    
     task_id = str(uuid.uuid4())
+    user_id = g.user_id
     now = datetime.datetime.now().isoformat()
     completed = data.get('completed', False)
     completed_at = now if completed else None
@@ -264,48 +715,41 @@ def create_task():
     due_date = data.get('due_date')
     due_time = data.get('due_time')
     
-    cursor.execute(
-        """
-        INSERT INTO tasks (id, user_id, text, category, completed, created_at, completed_at, due_date, due_time, deleted)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
-        """,
-        (task_id, g.user_id, data['text'], data['category'], 1 if completed else 0, 
-         now, completed_at, due_date, due_time)
-    )
-    db.commit()
-    
-    return jsonify({
+    values = {
         "id": task_id,
         "text": data['text'],
         "category": data['category'],
-        "completed": completed,
+        "completed": 1 if completed else 0,
         "created_at": now,
         "completed_at": completed_at,
         "due_date": due_date,
         "due_time": due_time
-    }), 201
-
-# 其余API端点也需要修改，添加用户权限验证
-@app.route('/v1/tasks/<task_id>', methods=['PUT'])
-@login_required
-def update_task(task_id):
-    data = request.json
+    }
     
-    if not data:
-        return jsonify({"error": "缺少更新数据"}), 400
-    
-    db = get_db()
-    cursor = db.cursor()
-    
-    # 检查任务是否存在且属于当前用户
-    cursor.execute("SELECT * FROM tasks WHERE id = ? AND user_id = ? AND deleted = 0", 
-                  (task_id, g.user_id))
-    task = cursor.fetchone()
-    
-    if not task:
-        return jsonify({"error": "任务不存在或无权访问"}), 404
-    
-    # 构建更新查询
+    def insert(conn):
+        query = """
+            INSERT INTO tasks (id, user_id, text, category, completed, created_at, completed_at, due_date, due_time, deleted)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+        """
+        params = (task_id, user_id, data['text'], data['category'], values['completed'],
+                  now, completed_at, due_date, due_time)
+        if not SUPPORTS_RETURNING:
+            conn.execute(query, params)
+            return values
+        # 返回实际写入的值，读取全部结果使语句执行完毕
+        return conn.execute(query + f" RETURNING {TASK_RETURNING}", params).fetchall()[0]
+    
+    task = run_write(insert)
+    publish_task_events([('task.created', task_id)])
+    
+    return jsonify(task_dict(task)), 201
+
+def build_task_update(data):
+    """根据更新数据构建SET子句字段和参数
+
+    Returns:
+        (list, list): 形如 "text = ?" 的字段列表及对应参数
+    """
     update_fields = []
     params = []
     
@@ -320,12 +764,8 @@ def update_task(task_id):
     if 'completed' in data:
         update_fields.append("completed = ?")
         params.append(1 if data['completed'] else 0)
-        
-        if data['completed']:
-            update_fields.append("completed_at = ?")
-            params.append(datetime.datetime.now().isoformat())
-        else:
-            update_fields.append("completed_at = NULL")
+        update_fields.append("completed_at = ?")
+        params.append(datetime.datetime.now().isoformat() if data['completed'] else None)
     
     if 'due_date' in data:
         update_fields.append("due_date = ?")
@@ -335,53 +775,123 @@ def update_task(task_id):
         update_fields.append("due_time = ?")
         params.append(data['due_time'])
     
+    return update_fields, params
+
+# 其余API端点也需要修改，添加用户权限验证
+@app.route('/v1/tasks/<task_id>', methods=['PUT'])
+@login_required
+def update_task(task_id):
+    data = request.json
+    
+    if not data:
+        return jsonify({"error": "缺少更新数据"}), 400
+    
+    user_id = g.user_id
+    update_fields, params = build_task_update(data)
+    
     if not update_fields:
+        cursor = get_db().cursor()
+        cursor.execute("SELECT 1 FROM tasks WHERE id = ? AND user_id = ? AND deleted = 0",
+                      (task_id, user_id))
+        if not cursor.fetchone():
+            return jsonify({"error": "任务不存在或无权访问"}), 404
         return jsonify({"error": "没有提供有效的更新字段"}), 400
     
-    # 执行更新
-    update_query = f"UPDATE tasks SET {', '.join(update_fields)} WHERE id = ? AND user_id = ?"
-    params.append(task_id)
-    params.append(g.user_id)
+    # 只更新属于当前用户且未删除的任务，没有更新任何行即任务不存在或无权访问
+    update_query = (f"UPDATE tasks SET {', '.join(update_fields)} "
+                    "WHERE id = ? AND user_id = ? AND deleted = 0")
+    params += [task_id, user_id]
     
-    cursor.execute(update_query, params)
-    db.commit()
+    def update(conn):
+        if SUPPORTS_RETURNING:
+            rows = conn.execute(update_query + f" RETURNING {TASK_RETURNING}", params).fetchall()
+            return rows[0] if rows else None
+        
+        if conn.execute(update_query, params).rowcount == 0:
+            return None
+        return conn.execute(f"SELECT {TASK_RETURNING} FROM tasks WHERE id = ?",
+                            (task_id,)).fetchone()
     
-    # 返回更新后的任务
-    cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
-    updated_task = cursor.fetchone()
+    updated_task = run_write(update)
+    if updated_task is None:
+        return jsonify({"error": "任务不存在或无权访问"}), 404
+    publish_task_events([('task.updated', task_id)])
     
-    return jsonify({
-        "id": updated_task['id'],
-        "text": updated_task['text'],
-        "category": updated_task['category'],
-        "completed": updated_task['completed'] == 1,
-        "created_at": updated_task['created_at'],
-        "completed_at": updated_task['completed_at'],
-        "due_date": updated_task['due_date'],
-        "due_time": updated_task['due_time']
-    })
+    return jsonify(task_dict(updated_task))
 
 @app.route('/v1/tasks/<task_id>', methods=['DELETE'])
 @login_required
 def delete_task(task_id):
-    db = get_db()
-    cursor = db.cursor()
+    user_id = g.user_id
     
-    # 检查任务是否存在且属于当前用户
-    cursor.execute("SELECT * FROM tasks WHERE id = ? AND user_id = ? AND deleted = 0", 
-                  (task_id, g.user_id))
-    task = cursor.fetchone()
+    def delete(conn):
+        # 执行软删除，没有更新任何行即任务不存在、已删除或无权访问
+        cursor = conn.execute("UPDATE tasks SET deleted = 1 WHERE id = ? AND user_id = ? AND deleted = 0",
+                              (task_id, user_id))
+        return cursor.rowcount > 0
     
-    if not task:
+    if not run_write(delete):
         return jsonify({"error": "任务不存在或无权访问"}), 404
-    
-    # 执行软删除
-    cursor.execute("UPDATE tasks SET deleted = 1 WHERE id = ? AND user_id = ?", 
-                  (task_id, g.user_id))
-    db.commit()
+    publish_task_events([('task.deleted', task_id)])
     
     return jsonify({"message": "任务已删除"})
 
+# 批量操作中每次IN查询的最大ID数，避免超出SQLite参数上限
+BATCH_ID_CHUNK = 500
+
+def fetch_task_states(cursor, task_ids):
+    """一次性查询当前用户拥有的任务及其删除状态
+
+    Returns:
+        dict: 任务ID -> deleted 标记
+    """
+    states = {}
+    task_ids = list(task_ids)
+    for i in range(0, len(task_ids), BATCH_ID_CHUNK):
+        chunk = task_ids[i:i + BATCH_ID_CHUNK]
+        placeholders = ', '.join('?' * len(chunk))
+        cursor.execute(f"SELECT id, deleted FROM tasks WHERE user_id = ? AND id IN ({placeholders})",
+                       [g.user_id] + chunk)
+        for row in cursor.fetchall():
+            states[row['id']] = row['deleted']
+    return states
+
+def publish_task_events(actions):
+    """事务提交后向当前用户的订阅连接推送任务事件
+
+    Args:
+        actions: (事件类型, 任务ID) 列表，同一任务以最后一个事件类型为准
+    """
+    if not actions or not broker.has_subscribers(g.user_id):
+        return
+    if event_poller is not None:
+        event_poller.wake()
+        return
+    
+    types = dict((task_id, event_type) for event_type, task_id in actions)
+    task_ids = list(types)
+    cursor = get_db().cursor()
+    events = []
+    for i in range(0, len(task_ids), BATCH_ID_CHUNK):
+        chunk = task_ids[i:i + BATCH_ID_CHUNK]
+        placeholders = ', '.join('?' * len(chunk))
+        cursor.execute(f"SELECT * FROM tasks WHERE user_id = ? AND id IN ({placeholders})",
+                       [g.user_id] + chunk)
+        for task in cursor.fetchall():
+            events.append({"id": task['seq'], "type": types[task['id']], "data": task_change_dict(task)})
+    
+    events.sort(key=lambda event: event['id'])
+    broker.publish(g.user_id, events)
+
+# 批量操作中会写入数据库或作为映射键使用的字段
+BATCH_TASK_FIELDS = ('text', 'category', 'completed', 'due_date', 'due_time', 'temp_id')
+
+def valid_task_data(task_data):
+    """批量操作的任务数据必须是对象，且各字段为标量，嵌套的对象或数组不能绑定为SQL参数"""
+    return isinstance(task_data, dict) and all(
+        task_data.get(field) is None or isinstance(task_data[field], (str, int, float))
+        for field in BATCH_TASK_FIELDS)
+
 @app.route('/v1/tasks/batch', methods=['POST'])
 @login_required
 def batch_operations():
@@ -391,266 +901,713 @@ def batch_operations():
         return jsonify({"error": "缺少操作数据"}), 400
     
     operations = data['operations']
+    if not isinstance(operations, list):
+        return jsonify({"error": "operations必须是数组"}), 400
     id_mapping = {}
-    
-    db = get_db()
-    
-    for op in operations:
-        try:
-            if op['type'] == 'create':
-                task_data = op['data']
-                task_id = str(uuid.uuid4())
-                now = datetime.datetime.now().isoformat()
-                completed = task_data.get('completed', False)
-                completed_at = now if completed else None
-                
-                due_date = task_data.get('due_date')
-                due_time = task_data.get('due_time')
-                
-                cursor = db.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO tasks (id, user_id, text, category, completed, created_at, completed_at, due_date, due_time, deleted)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
-                    """,
-                    (task_id, g.user_id, task_data['text'], task_data['category'], 
-                     1 if completed else 0, now, completed_at, due_date, due_time)
-                )
-                
-                # 保存临时ID到永久ID的映射
-                if 'temp_id' in task_data:
-                    id_mapping[task_data['temp_id']] = task_id
-            
-            elif op['type'] == 'update':
-                task_id = op['id']
-                task_data = op['data']
-                
-                # 验证任务归属权
-                cursor = db.cursor()
-                cursor.execute("SELECT * FROM tasks WHERE id = ? AND user_id = ?", 
-                              (task_id, g.user_id))
-                if not cursor.fetchone():
-                    continue  # 跳过不属于用户的任务
-                
-                # 构建更新查询
-                update_fields = []
-                params = []
-                
-                if 'text' in task_data:
-                    update_fields.append("text = ?")
-                    params.append(task_data['text'])
-                
-                if 'category' in task_data:
-                    update_fields.append("category = ?")
-                    params.append(task_data['category'])
-                
-                if 'completed' in task_data:
-                    update_fields.append("completed = ?")
-                    params.append(1 if task_data['completed'] else 0)
-                    
-                    if task_data['completed']:
-                        update_fields.append("completed_at = ?")
-                        params.append(datetime.datetime.now().isoformat())
-                    else:
-                        update_fields.append("completed_at = NULL")
-                
-                if 'due_date' in task_data:
-                    update_fields.append("due_date = ?")
-                    params.append(task_data['due_date'])
-                
-                if 'due_time' in task_data:
-                    update_fields.append("due_time = ?")
-                    params.append(task_data['due_time'])
-                
-                if update_fields:
-                    update_query = f"UPDATE tasks SET {', '.join(update_fields)} WHERE id = ? AND user_id = ?"
-                    params.append(task_id)
-                    params.append(g.user_id)
-                    
-                    cursor.execute(update_query, params)
-            
-            elif op['type'] == 'delete':
-                task_id = op['id']
-                
-                # 验证任务归属权
-                cursor = db.cursor()
-                cursor.execute("SELECT * FROM tasks WHERE id = ? AND user_id = ?", 
-                              (task_id, g.user_id))
-                if cursor.fetchone():
-                    cursor.execute("UPDATE tasks SET deleted = 1 WHERE id = ? AND user_id = ?", 
-                                  (task_id, g.user_id))
+    results = [None] * len(operations)
+    metrics.observe_batch(len(operations))
+    
+    # 请求级幂等键覆盖整个批次，操作级op_id使重发时已处理的操作不再执行
+    idempotency_key = request.headers.get('Idempotency-Key')
+    op_ids = {}
+    try:
+        if idempotency_key is not None:
+            validate_key(idempotency_key)
+        for index, op in enumerate(operations):
+            if isinstance(op, dict) and op.get('op_id') is not None:
+                op_ids[index] = validate_key(op['op_id'], 'op_id')
+    except IdempotencyError as e:
+        return jsonify({"error": str(e)}), 400
+    request_digest = fingerprint(operations)
+    
+    # 按操作类型分组，并校验操作格式
+    creates, updates, deletes = [], [], []
+    for index, op in enumerate(operations):
+        op_type = op.get('type') if isinstance(op, dict) else None
+        task_id = (op.get('id') or op.get('task_id')) if op_type in ('update', 'delete') else None
+        task_data = op.get('data') if op_type in ('create', 'update') else None
         
-        except Exception as e:
-            app.logger.error(f"批量操作错误: {str(e)}")
-            print(f"批量操作错误: {str(e)}")
-    
-    # 提交事务
-    db.commit()
+        if task_id is not None and not isinstance(task_id, str) \
+                or task_data is not None and not valid_task_data(task_data):
+            results[index] = {"status": "invalid", "error": "无效的操作"}
+        elif op_type == 'create' and task_data is not None \
+                and 'text' in task_data and 'category' in task_data:
+            creates.append((index, task_data))
+        elif op_type == 'update' and task_id and task_data is not None:
+            updates.append((index, task_id, task_data))
+        elif op_type == 'delete' and task_id:
+            deletes.append((index, task_id))
+        else:
+            results[index] = {"status": "invalid", "error": "无效的操作"}
     
-    return jsonify({
-        "success": True,
-        "id_mapping": id_mapping
-    })
-
-# 迁移现有数据库
-def migrate_database():
-    """升级数据库结构以支持多用户"""
     db = get_db()
     cursor = db.cursor()
     
-    # 检查users表是否存在
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-    if not cursor.fetchone():
-        print("创建users表...")
-        cursor.execute("""
-        CREATE TABLE users (
-            id TEXT PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            last_login TEXT,
-            settings TEXT
-        )
-        """)
-    
-    # 检查tasks表是否有user_id列
-    cursor.execute("PRAGMA table_info(tasks)")
-    columns = [column['name'] for column in cursor.fetchall()]
-    
-    if 'user_id' not in columns:
-        print("添加user_id列到tasks表...")
+    try:
+        # 获取写锁后在同一个事务中完成全部操作
+        cursor.execute("BEGIN IMMEDIATE")
         
-        # 创建一个默认用户用于现有任务
-        default_user_id = str(uuid.uuid4())
+        # 在写锁内检查幂等键，并发的重试请求会在这里排队
+        if idempotency_key is not None:
+            stored = load_responses(cursor, g.user_id, [BATCH_PREFIX + idempotency_key])
+            if stored:
+                db.rollback()
+                stored_digest, stored_response = stored[BATCH_PREFIX + idempotency_key]
+                if stored_digest != request_digest:
+                    return jsonify({"error": "Idempotency-Key已用于内容不同的请求"}), 422
+                response = jsonify(stored_response)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+        
+        # 已处理过的操作直接使用保存的结果
+        op_digests = {index: fingerprint(operations[index]) for index in op_ids}
+        stored = load_responses(cursor, g.user_id, {OP_PREFIX + op_id for op_id in op_ids.values()})
+        replayed = set()
+        for index, op_id in op_ids.items():
+            if OP_PREFIX + op_id not in stored:
+                continue
+            stored_digest, stored_result = stored[OP_PREFIX + op_id]
+            if stored_digest == op_digests[index]:
+                results[index] = stored_result
+            else:
+                results[index] = {"status": "conflict", "error": "op_id已用于内容不同的操作"}
+            replayed.add(index)
+        for index, task_data in creates:
+            if index in replayed and results[index]['status'] == 'ok' and 'temp_id' in task_data:
+                id_mapping[task_data['temp_id']] = results[index]['id']
+        creates = [op for op in creates if op[0] not in replayed]
+        updates = [op for op in updates if op[0] not in replayed]
+        deletes = [op for op in deletes if op[0] not in replayed]
+        
+        # 一次查询完成所有更新和删除的归属权校验
+        states = fetch_task_states(cursor, {op[1] for op in updates} | {op[1] for op in deletes})
+        
+        # 批量创建
         now = datetime.datetime.now().isoformat()
-        default_password = hash_password("admin123")  # 默认密码，请在迁移后更改
+        rows = []
+        for index, task_data in creates:
+            task_id = str(uuid.uuid4())
+            completed = task_data.get('completed', False)
+            rows.append((task_id, g.user_id, task_data['text'], task_data['category'],
+                         1 if completed else 0, now, now if completed else None,
+                         task_data.get('due_date'), task_data.get('due_time')))
+            
+            # 保存临时ID到永久ID的映射
+            if 'temp_id' in task_data:
+                id_mapping[task_data['temp_id']] = task_id
+            results[index] = {"status": "ok", "id": task_id}
         
-        cursor.execute("""
-        INSERT INTO users (id, username, email, password_hash, created_at, settings)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, (default_user_id, "admin", "admin@example.com", default_password, now, '{}'))
+        cursor.executemany(
+            """
+            INSERT INTO tasks (id, user_id, text, category, completed, created_at, completed_at, due_date, due_time, deleted)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+            """,
+            rows
+        )
         
-        # 添加user_id列
-        cursor.execute("ALTER TABLE tasks ADD COLUMN user_id TEXT NOT NULL DEFAULT ?", (default_user_id,))
+        # 按原始顺序处理更新和删除：同一任务的多次更新依次合并为一次更新，
+        # 删除之后的更新与单独请求时一样视为冲突
+        merged_updates = {}  # 任务ID -> 合并后的更新数据
+        delete_rows = []
+        ordered = sorted([(index, task_id, task_data) for index, task_id, task_data in updates] +
+                         [(index, task_id, None) for index, task_id in deletes])
+        for index, task_id, task_data in ordered:
+            if task_id not in states:
+                results[index] = {"status": "not_found", "id": task_id}
+                continue
+            if task_data is None:
+                if not states[task_id]:
+                    states[task_id] = 1
+                    delete_rows.append((task_id, g.user_id))
+            elif states[task_id]:
+                results[index] = {"status": "conflict", "id": task_id, "error": "任务已被删除"}
+                continue
+            else:
+                merged_updates.setdefault(task_id, {}).update(task_data)
+            results[index] = {"status": "ok", "id": task_id}
         
-    db.commit()
-    print("数据库迁移完成!")
+        # 批量更新，每个任务一行，字段相同的更新合并为一次executemany
+        update_groups = {}
+        for task_id, task_data in merged_updates.items():
+            update_fields, params = build_task_update(task_data)
+            if update_fields:
+                update_groups.setdefault(tuple(update_fields), []).append(params + [task_id, g.user_id])
+        
+        for update_fields, param_rows in update_groups.items():
+            cursor.executemany(
+                f"UPDATE tasks SET {', '.join(update_fields)} WHERE id = ? AND user_id = ?",
+                param_rows
+            )
+        
+        # 批量软删除，在更新之后执行，删除之前的更新已经合并
+        cursor.executemany("UPDATE tasks SET deleted = 1 WHERE id = ? AND user_id = ?", delete_rows)
+        
+        response_data = {
+            "success": all(result["status"] == "ok" for result in results),
+            "id_mapping": id_mapping,
+            "results": results
+        }
+        # 与任务修改在同一事务中保存幂等键
+        entries = [(OP_PREFIX + op_id, op_digests[index], results[index])
+                   for index, op_id in op_ids.items()
+                   if index not in replayed and results[index]['status'] != 'invalid']
+        if idempotency_key is not None:
+            entries.append((BATCH_PREFIX + idempotency_key, request_digest, response_data))
+        if entries:
+            store_responses(cursor, g.user_id, entries)
+        
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        app.logger.error(f"批量操作错误: {str(e)}")
+        return jsonify({"error": f"批量操作失败: {str(e)}"}), 500
+    
+    # 向在线客户端推送变更
+    actions = [('task.created', results[index]['id']) for index, _ in creates]
+    actions += [('task.updated', task_id) for index, task_id, _ in updates
+                if results[index]['status'] == 'ok']
+    actions += [('task.deleted', task_id) for index, task_id in deletes
+                if results[index]['status'] == 'ok']
+    publish_task_events(actions)
+    
+    return jsonify(response_data)
 
+def analytics_etag(cursor):
+    """统计结果只随任务变更和日期变化"""
+    return make_etag('analytics', g.user_id, get_user_seq(cursor),
+                     request.query_string.decode('utf-8'), datetime.date.today())
 
-def ensure_db_structure():
-    """确保数据库结构与当前应用需求一致"""
-    db = get_db()
-    cursor = db.cursor()
+# 按时间区间统计新增和完成的任务数
+@app.route('/v1/analytics/activity', methods=['GET'])
+@login_required
+def analytics_activity():
+    try:
+        start, end = parse_range(request.args)
+        granularity = parse_granularity(request.args.get('granularity'))
+    except AnalyticsError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cursor = get_db().cursor()
+    etag = analytics_etag(cursor)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    buckets = {day: {"created": 0, "completed": 0, "created_completed": 0}
+               for day in bucket_starts(start, end, granularity)}
+    
+    def add(day, field, value):
+        try:
+            bucket = buckets[bucket_start(datetime.date.fromisoformat(day), granularity)]
+        except (ValueError, KeyError):
+            return
+        bucket[field] += value
     
-    # 检查users表
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-    if not cursor.fetchone():
-        print("创建users表...")
-        cursor.execute("""
-        CREATE TABLE users (
-            id TEXT PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            last_login TEXT,
-            settings TEXT
-        )
-        """)
+    # 按创建日期汇总的新增数及其中已完成的数量
+    cursor.execute(
+        """
+        SELECT day, SUM(created) AS created, SUM(completed) AS completed FROM user_daily_stats
+        WHERE user_id = ? AND day BETWEEN ? AND ? GROUP BY day
+        """,
+        (g.user_id, start.isoformat(), end.isoformat())
+    )
+    for row in cursor.fetchall():
+        add(row['day'], 'created', row['created'])
+        add(row['day'], 'created_completed', row['completed'])
     
-    # 检查tasks表
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='tasks'")
-    if not cursor.fetchone():
-        print("创建tasks表...")
-        cursor.execute("""
-        CREATE TABLE tasks (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            text TEXT NOT NULL,
-            category TEXT NOT NULL,
-            completed INTEGER NOT NULL DEFAULT 0,
-            created_at TEXT NOT NULL,
-            completed_at TEXT,
-            due_date TEXT,
-            due_time TEXT,
-            deleted INTEGER NOT NULL DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users (id)
+    # 按完成日期汇总的完成数
+    cursor.execute(
+        """
+        SELECT day, SUM(completed) AS completed FROM user_completion_stats
+        WHERE user_id = ? AND day BETWEEN ? AND ? GROUP BY day
+        """,
+        (g.user_id, start.isoformat(), end.isoformat())
+    )
+    for row in cursor.fetchall():
+        add(row['day'], 'completed', row['completed'])
+    
+    result = [{
+        "start": day.isoformat(),
+        "created": bucket['created'],
+        "completed": bucket['completed'],
+        # 区间内创建的任务中已完成的比例
+        "completion_rate": rate(bucket['created_completed'], bucket['created'])
+    } for day, bucket in buckets.items()]
+    
+    return with_etag(jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "granularity": granularity,
+        "buckets": result
+    }), etag)
+
+# 按分类统计任务数，指定日期范围时只统计范围内创建的任务
+@app.route('/v1/analytics/categories', methods=['GET'])
+@login_required
+def analytics_categories():
+    ranged = bool(request.args.get('from') or request.args.get('to'))
+    try:
+        start, end = parse_range(request.args)
+    except AnalyticsError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cursor = get_db().cursor()
+    etag = analytics_etag(cursor)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    if ranged:
+        cursor.execute(
+            """
+            SELECT category, SUM(created) AS total, SUM(completed) AS completed,
+                   TOTAL(completion_days) AS completion_days
+            FROM user_daily_stats WHERE user_id = ? AND day BETWEEN ? AND ?
+            GROUP BY category HAVING SUM(created) > 0 ORDER BY total DESC, category
+            """,
+            (g.user_id, start.isoformat(), end.isoformat())
         )
-        """)
     else:
-        # 检查tasks表是否有user_id列
-        cursor.execute("PRAGMA table_info(tasks)")
-        columns = [column[1] for column in cursor.fetchall()]  # SQLite返回的列信息中名称在索引1
+        cursor.execute(
+            """
+            SELECT category, total, completed, NULL AS completion_days FROM user_category_stats
+            WHERE user_id = ? AND total > 0 ORDER BY total DESC, category
+            """,
+            (g.user_id,)
+        )
+    
+    categories = []
+    for row in cursor.fetchall():
+        completion_days = row['completion_days']
+        categories.append({
+            "category": row['category'],
+            "total": row['total'],
+            "completed": row['completed'],
+            "pending": row['total'] - row['completed'],
+            "completion_rate": rate(row['completed'], row['total']),
+            "avg_completion_days": round(completion_days / row['completed'], 1)
+                                   if completion_days is not None and row['completed'] else None
+        })
+    
+    response = {"categories": categories}
+    if ranged:
+        response.update({"from": start.isoformat(), "to": end.isoformat()})
+    return with_etag(jsonify(response), etag)
+
+# 按完成时间的小时统计完成数
+@app.route('/v1/analytics/productivity', methods=['GET'])
+@login_required
+def analytics_productivity():
+    try:
+        start, end = parse_range(request.args)
+    except AnalyticsError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cursor = get_db().cursor()
+    etag = analytics_etag(cursor)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    cursor.execute(
+        """
+        SELECT hour, SUM(completed) AS completed FROM user_completion_stats
+        WHERE user_id = ? AND day BETWEEN ? AND ? GROUP BY hour
+        """,
+        (g.user_id, start.isoformat(), end.isoformat())
+    )
+    hours = [0] * 24
+    for row in cursor.fetchall():
+        if 0 <= row['hour'] < 24:
+            hours[row['hour']] = row['completed']
+    
+    return with_etag(jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "hours": hours,
+        "periods": group_by_period(hours)
+    }), etag)
+
+# 仪表盘计数 - 由触发器维护的计数器和汇总表计算，不读取任务列表
+@app.route('/v1/stats', methods=['GET'])
+@login_required
+def get_stats():
+    try:
+        # 客户端所在时区的今天，默认为服务器日期；本周从周一开始
+        day = parse_day(request.args.get('date'))
+    except AnalyticsError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cursor = get_db().cursor()
+    etag = analytics_etag(cursor)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    cursor.execute("SELECT total, completed FROM user_stats WHERE user_id = ?", (g.user_id,))
+    stats = cursor.fetchone()
+    
+    week_start = bucket_start(day, 'week')
+    cursor.execute(
+        """
+        SELECT COALESCE(SUM(CASE WHEN due_date < :day THEN pending END), 0) AS overdue,
+               COALESCE(SUM(CASE WHEN due_date = :day THEN pending END), 0) AS today,
+               COALESCE(SUM(CASE WHEN due_date BETWEEN :week_start AND :week_end
+                                 THEN pending END), 0) AS week
+        FROM user_due_stats WHERE user_id = :user_id
+        """,
+        {"user_id": g.user_id, "day": day.isoformat(), "week_start": week_start.isoformat(),
+         "week_end": (week_start + datetime.timedelta(days=6)).isoformat()}
+    )
+    pending = cursor.fetchone()
+    
+    # 近7天（包含今天）完成的任务数
+    cursor.execute(
+        "SELECT COALESCE(SUM(completed), 0) FROM user_completion_stats "
+        "WHERE user_id = ? AND day BETWEEN ? AND ?",
+        (g.user_id, (day - datetime.timedelta(days=6)).isoformat(), day.isoformat())
+    )
+    completed_recent = cursor.fetchone()[0]
+    
+    # 近30天到期的任务中已完成的比例，按(user_id, due_date)索引只读取范围内的任务
+    cursor.execute(
+        "SELECT COUNT(*), COALESCE(SUM(completed), 0) FROM tasks "
+        "WHERE user_id = ? AND due_date BETWEEN ? AND ? AND deleted = 0",
+        (g.user_id, (day - datetime.timedelta(days=29)).isoformat(), day.isoformat())
+    )
+    due_recent, due_recent_completed = cursor.fetchone()
+    
+    return with_etag(jsonify({
+        "date": day.isoformat(),
+        "total_tasks": stats['total'] if stats else 0,
+        "completed_tasks": stats['completed'] if stats else 0,
+        "overdue_tasks": pending['overdue'],
+        "due_today": pending['today'],
+        "due_this_week": pending['week'],
+        "completed_last_7_days": completed_recent,
+        "completion_rate_last_30_days": rate(due_recent_completed, due_recent)
+    }), etag)
+
+def event_token(headers, args):
+    """取得事件流的令牌，浏览器EventSource无法设置请求头，允许通过access_token参数传递"""
+    auth_header = headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header.split(' ')[1]
+    return args.get('access_token')
+
+# 推送连接上限，None表示不限制；prefork模式由main()按每个worker的线程数设置
+max_event_streams = EVENT_MAX_STREAMS or None
+
+def fetch_event_changes(cursors):
+    """EventPoller的读取函数：返回各用户在已发布序列号之后的变更事件，不需要应用上下文"""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        cursor = conn.cursor()
+        user_ids = list(cursors)
+        changed = []
+        for i in range(0, len(user_ids), BATCH_ID_CHUNK):
+            chunk = user_ids[i:i + BATCH_ID_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f"SELECT user_id, seq FROM user_seq WHERE user_id IN ({placeholders})",
+                           chunk)
+            changed.extend(row['user_id'] for row in cursor.fetchall()
+                           if row['seq'] > cursors[row['user_id']])
         
-        if 'user_id' not in columns:
-            print("添加user_id列到tasks表...")
-            # 创建一个默认用户
-            default_user_id = str(uuid.uuid4())
-            now = datetime.datetime.now().isoformat()
-            default_password = hash_password("admin123")
-            
-            # 添加默认管理员
-            try:
-                cursor.execute("""
-                INSERT INTO users (id, username, email, password_hash, created_at, settings)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """, (default_user_id, "admin", "admin@example.com", default_password, now, '{}'))
-            except sqlite3.IntegrityError:
-                # 如果用户已存在，获取现有用户ID
-                cursor.execute("SELECT id FROM users WHERE username = 'admin'")
-                default_user_id = cursor.fetchone()[0]
-            
-            # 修改这一行 - 直接在SQL中使用字符串值
-            cursor.execute(f"ALTER TABLE tasks ADD COLUMN user_id TEXT NOT NULL DEFAULT '{default_user_id}'")
+        events = {}
+        for user_id in changed:
+            cursor.execute(CHANGES_QUERY, {"user_id": user_id, "since": cursors[user_id],
+                                           "limit": -1})
+            events[user_id] = [{"id": task['seq'],
+                                "type": 'task.deleted' if task['deleted'] else 'task.updated',
+                                "data": change_dict(task)} for task in cursor.fetchall()]
+        return events
+    finally:
+        pool.release(conn)
+
+# 从数据库轮询变更并推送，设置TODO_EVENT_POLL或使用prefork模式时启用
+event_poller = EventPoller(broker, fetch_event_changes) if EVENT_POLL else None
+
+def load_event_backlog(user_id, last_event_id):
+    """从数据库读取断线期间的变更，需要在订阅之后、应用上下文中调用
+
+    Returns:
+        (list, int): SSE文本列表及已补发的最大序列号
+    """
+    backlog = []
+    last_sent = last_event_id or 0
+    cursor = get_db().cursor()
+    if event_poller is not None:
+        # 之后提交的变更由轮询线程推送，之前的由下面的补发覆盖
+        cursor.execute("SELECT seq FROM user_seq WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        event_poller.watch(user_id, row['seq'] if row else 0)
+    if last_event_id is None:
+        return backlog, last_sent
+    
+    cursor.execute(CHANGES_QUERY, {"user_id": user_id, "since": last_event_id,
+                                   "limit": EVENT_REPLAY_LIMIT + 1})
+    rows = cursor.fetchall()
+    # 断线期间的删除记录已被清理时同样要求重新同步
+    if len(rows) > EVENT_REPLAY_LIMIT or 0 < last_event_id < get_purged_seq(cursor, user_id):
+        return [reset_event(last_event_id)], last_sent
+    
+    for task in rows:
+        event_type = 'task.deleted' if task['deleted'] else 'task.updated'
+        backlog.append(format_event({"id": task['seq'], "type": event_type,
+                                     "data": change_dict(task)}))
+        last_sent = task['seq']
+    return backlog, last_sent
+
+# Prometheus指标，设置TODO_METRICS_TOKEN后需要以Bearer令牌访问
+@app.route('/v1/metrics', methods=['GET'])
+def get_metrics():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                 f"Bearer {METRICS_TOKEN}"):
+        return jsonify({"error": "无效的令牌"}), 401
+    
+    pool = get_pool().stats()
+    cache = token_cache.stats()
+    extra = {
+        'todo_db_pool_connections': ('gauge', "数据库连接池的连接数", {
+            (('state', 'opened'),): pool['opened'],
+            (('state', 'idle'),): pool['idle'],
+            (('state', 'max'),): pool['size'],
+        }),
+        'todo_token_cache_entries': ('gauge', "令牌缓存条数", {(): cache['size']}),
+        'todo_token_cache_requests_total': ('counter', "令牌缓存查询次数", {
+            (('result', 'hit'),): cache['hits'],
+            (('result', 'miss'),): cache['misses'],
+        }),
+        'todo_token_cache_evictions_total': ('counter', "令牌缓存淘汰条数",
+                                             {(): cache['evictions']}),
+        'todo_event_connections': ('gauge', "事件推送连接数", {(): broker.connection_count()}),
+    }
+    if group_writer is not None:
+        writes = group_writer.stats()
+        extra.update({
+            'todo_group_commit_transactions_total': ('counter', "组提交的事务数",
+                                                     {(): writes['transactions']}),
+            'todo_group_commit_operations_total': ('counter', "组提交的写操作数",
+                                                   {(): writes['operations']}),
+            'todo_group_commit_queued': ('gauge', "等待写线程执行的写操作数",
+                                         {(): writes['queued']}),
+        })
+    return Response(metrics.render(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def admin_denied():
+    """校验管理令牌，未配置TODO_ADMIN_TOKEN时管理接口不存在"""
+    if not profiler.admin_token:
+        return jsonify({"error": "Not Found"}), 404
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.split(' ', 1)[1] if auth_header.startswith('Bearer ') else None
+    if not profiler.is_admin(token):
+        return jsonify({"error": "无效的管理令牌"}), 401
+    return None
+
+# 最近的剖析结果，按时间倒序
+@app.route('/v1/admin/profiles', methods=['GET'])
+def list_profiles():
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify({"profiles": [profile.summary() for profile in reversed(profiler.profiles)]})
+
+# 下载折叠栈格式的剖析结果，可直接用于生成火焰图
+@app.route('/v1/admin/profiles/<int:profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    denied = admin_denied()
+    if denied:
+        return denied
+    profile = profiler.get(profile_id)
+    if profile is None or profile.duration is None:
+        return jsonify({"error": "剖析结果不存在或已被覆盖"}), 404
+    return Response(profile.collapsed(), mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{profile_id}.folded'
+    })
+
+# 任务变更推送（Server-Sent Events）
+@app.route('/v1/events', methods=['GET'])
+def task_events():
+    token = event_token(request.headers, request.args)
+    user_id = decode_token(token) if token else None
+    if not user_id:
+        return jsonify({"error": "无效或过期的令牌"}), 401
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "无效的Last-Event-ID"}), 400
+    
+    # 先订阅再补发，避免丢失补发期间提交的变更
+    subscription = broker.subscribe(user_id, limit=max_event_streams)
+    if subscription is None:
+        # 每个推送连接占用一个处理线程，达到上限时让客户端稍后重连
+        return busy_response()
+    try:
+        backlog, last_sent = load_event_backlog(user_id, last_event_id)
+    except Exception:
+        subscription.close()
+        raise
+    
+    def stream():
+        sent = last_sent
+        try:
+            yield "retry: 3000\n\n"
+            for chunk in backlog:
+                yield chunk
+            # 进程平滑退出时结束连接，客户端带Last-Event-ID重连到其他进程
+            while not subscription.finished:
+                if not subscription.wait(EVENT_KEEPALIVE):
+                    if not subscription.finished:
+                        yield ": keepalive\n\n"
+                    continue
+                for event in subscription.drain():
+                    # 跳过补发中或已经发送的事件
+                    if event['id'] > sent:
+                        yield format_event(event)
+                        sent = event['id']
+        finally:
+            subscription.close()
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 连接在开始输出前断开时也要取消订阅
+    response.call_on_close(subscription.close)
+    return response
+
+def ensure_db_structure():
+    """按PRAGMA user_version执行尚未完成的数据库迁移，新数据库从头创建全部结构"""
+    applied = migrate(get_db())
+    if applied:
+        print(f"数据库已迁移到版本{applied[-1]}")
+    return applied
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="AI-TodoList API Server")
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help="根据tasks表重新计算用户统计计数器和统计分析汇总表后退出")
+    parser.add_argument('--rebuild-search', action='store_true',
+                        help="根据tasks表重建全文索引后退出（执行过VACUUM后需要重建）")
+    parser.add_argument('--maintenance', action='store_true',
+                        help="执行一次数据库维护（清理删除记录、归档已完成任务、增量VACUUM）后退出")
+    parser.add_argument('--compact', action='store_true',
+                        help="为旧数据库启用增量VACUUM并执行完整VACUUM后退出，"
+                             "执行期间数据库不可写，完成后自动重建全文索引")
+    parser.add_argument('--server', choices=['wsgi', 'asgi', 'prefork'], default='wsgi',
+                        help="wsgi使用Flask开发服务器，asgi使用uvicorn运行异步服务，"
+                             "prefork使用多进程生产服务器")
+    parser.add_argument('--host', default='0.0.0.0', help="监听地址")
+    parser.add_argument('--port', type=int, default=8080, help="监听端口")
+    parser.add_argument('--bind', help="监听地址，格式为HOST:PORT，优先于--host/--port")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="prefork模式的worker进程数，默认为CPU核数")
+    parser.add_argument('--threads', type=int, default=4,
+                        help="prefork模式每个worker的处理线程数")
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help="worker处理该数量的请求后重启，0表示不限制")
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        help="在max-requests上增加的随机量，避免worker同时重启")
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help="关闭worker时等待请求完成的秒数")
+    args = parser.parse_args(argv)
+    if args.bind:
+        host, _, port = args.bind.rpartition(':')
+        if not host or not port.isdigit():
+            parser.error("--bind必须是HOST:PORT格式")
+        args.host, args.port = host.strip('[]'), int(port)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
     
-    db.commit()
-    print("数据库结构检查完成")
-
-
-
-def main():
-    # 创建schema.sql文件
-    with open(os.path.join(os.path.dirname(__file__), 'schema.sql'), 'w') as f:
-        f.write("""
-        -- 用户表
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            last_login TEXT,
-            settings TEXT
-        );
-
-        -- 任务表
-        CREATE TABLE IF NOT EXISTS tasks (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            text TEXT NOT NULL,
-            category TEXT NOT NULL,
-            completed INTEGER NOT NULL DEFAULT 0,
-            created_at TEXT NOT NULL,
-            completed_at TEXT,
-            due_date TEXT,
-            due_time TEXT,
-            deleted INTEGER NOT NULL DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        );
-        """)
-
-    # 初始化或迁移数据库
-    if not os.path.exists(DATABASE):
-        init_db()
-    else:
-        # 确保数据库结构是最新的
+    # 创建或升级数据库，结构已是最新时只读取一次user_version
+    with app.app_context():
         ensure_db_structure()
-        # 迁移数据库以支持多用户
-        migrate_database()
 
+    if args.rebuild_stats:
+        with app.app_context():
+            db = get_db()
+            rebuild_user_stats(db)
+            rebuild_analytics(db)
+            db.commit()
+        print("用户统计已重建")
+        return
+    
+    if args.rebuild_search:
+        with app.app_context():
+            db = get_db()
+            rebuild_search_index(db)
+            db.commit()
+        print("全文索引已重建")
+        return
+    
+    if args.maintenance:
+        with app.app_context():
+            report = run_maintenance(get_db())
+        print(f"数据库维护完成: 清理删除记录{report['purged']}条，归档任务{report['archived']}条，"
+              f"释放空闲页{report['vacuumed_pages'] or 0}页")
+        return
+    
+    if args.compact:
+        with app.app_context():
+            db = get_db()
+            db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            db.execute("VACUUM")
+            # VACUUM可能重新编号tasks的rowid
+            rebuild_search_index(db)
+            db.commit()
+        print("数据库已压缩，全文索引已重建")
+        return
+    
+    # 在fork worker之前加载分词词典
+    load_search()
+    
+    # 检查热点查询是否使用索引，退化为全表扫描时拒绝启动
+    with app.app_context():
+        assert_query_plans(get_db())
+    
+    global maintenance_scheduler, event_poller, max_event_streams
+    maintenance_scheduler = MaintenanceScheduler(get_pool, on_archived=publish_archived)
+
+    if args.server == 'asgi':
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit("ASGI模式需要安装uvicorn: pip install uvicorn")
+        from asgi import ASGIApp
+        uvicorn.run(ASGIApp(app), host=args.host, port=args.port)
+        return
+
+    if args.server == 'prefork':
+        from prefork import PreforkServer
+        # 推送连接各占一个处理线程，至少留一个线程处理其他请求；其他worker写入的变更
+        # 只能从数据库轮询
+        max_event_streams = max(args.threads - 1, 0)
+        if EVENT_MAX_STREAMS:
+            max_event_streams = min(EVENT_MAX_STREAMS, max_event_streams)
+        if event_poller is None:
+            event_poller = EventPoller(broker, fetch_event_changes)
+        # 连接池和哈希进程池不能跨fork共享，由各worker自行创建
+        close_pool()
+        shutdown_hash_pool()
+        PreforkServer(app, host=args.host, port=args.port, workers=args.workers,
+                      threads=args.threads, max_requests=args.max_requests,
+                      max_requests_jitter=args.max_requests_jitter,
+                      graceful_timeout=args.graceful_timeout,
+                      worker_drain=broker.finish_all,
+                      worker_exit=lambda: shutdown_hash_pool(wait=True)).run()
+        return
+    
     # 使用非特权端口8083
-    app.run(debug=True, host='0.0.0.0', port=8080)
+    app.run(debug=True, host=args.host, port=args.port)
 
 if __name__ == '__main__':
+    # 直接运行本文件时模块名为__main__，asgi等模块再import server会加载第二份应用，
+    # 其中没有main()设置的后台维护等状态
+    sys.modules.setdefault('server', sys.modules[__name__])
     main()
\ No newline at end of file
@@ -0,0 +1,74 @@
+# task_filters.py
+import datetime
+
+# upcoming=true 时默认查询的天数
+DEFAULT_UPCOMING_DAYS = 7
+MAX_UPCOMING_DAYS = 366
+
+
+class FilterError(ValueError):
+    """过滤参数无效"""
+
+
+def _parse_date(name, value):
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise FilterError(f"{name}必须是YYYY-MM-DD格式的日期")
+
+
+def _parse_upcoming(value):
+    if value.lower() == 'true':
+        return DEFAULT_UPCOMING_DAYS
+    try:
+        days = int(value)
+    except ValueError:
+        raise FilterError("upcoming必须是天数或true")
+    if days < 0 or days > MAX_UPCOMING_DAYS:
+        raise FilterError(f"upcoming必须在0到{MAX_UPCOMING_DAYS}之间")
+    return days
+
+
+def date_filter_clauses(args, today=None):
+    """根据请求参数生成截止日期相关的WHERE条件
+
+    支持的参数:
+        due_date: 指定日期
+        due_from / due_to: 日期范围（包含两端）
+        upcoming: 从今天起N天内到期，true表示默认天数
+        overdue: true时只返回已过期且未完成的任务
+
+    Returns:
+        (list, list): SQL条件片段列表及参数
+    """
+    today = today or datetime.date.today()
+    clauses = []
+    params = []
+
+    due_date = args.get('due_date')
+    if due_date:
+        clauses.append("due_date = ?")
+        params.append(_parse_date('due_date', due_date))
+
+    due_from = args.get('due_from')
+    if due_from:
+        clauses.append("due_date >= ?")
+        params.append(_parse_date('due_from', due_from))
+
+    due_to = args.get('due_to')
+    if due_to:
+        clauses.append("due_date <= ?")
+        params.append(_parse_date('due_to', due_to))
+
+    upcoming = args.get('upcoming')
+    if upcoming:
+        days = _parse_upcoming(upcoming)
+        clauses.append("due_date BETWEEN ? AND ?")
+        params.extend([today.isoformat(), (today + datetime.timedelta(days=days)).isoformat()])
+
+    overdue = args.get('overdue')
+    if overdue and overdue.lower() == 'true':
+        clauses.append("due_date < ? AND completed = 0")
+        params.append(today.isoformat())
+
+    return clauses, params
@@ -92,6 +92,22 @@ const API = {
             return API.request(`/tasks${queryParams}`);
         },
         
+        // 按游标逐页获取全部任务
+        async getAllPages(filters = {}) {
+            const tasks = [];
+            let cursor = null;
+            do {
+                const pageFilters = { ...filters, limit: 500 };
+                if (cursor) {
+                    pageFilters.cursor = cursor;
+                }
+                const response = await API.tasks.getAll(pageFilters);
+                tasks.push(...(response.tasks || []));
+                cursor = response.next_cursor;
+            } while (cursor);
+            return { tasks };
+        },
+        
         // 创建任务
         create(taskData) {
             return API.request('/tasks', 'POST', taskData);
@@ -110,7 +126,71 @@ const API = {
         // 批量操作
         batch(operations) {
             return API.request('/tasks/batch', 'POST', { operations });
+        },
+        
+        // 获取已归档的历史任务，params可包含limit、cursor和sort
+        archive(params = {}) {
+            return API.request(`/tasks/archive?${new URLSearchParams(params).toString()}`);
         }
+    },
+    
+    // 仪表盘计数: { date }，date为本地的今天
+    stats(params = {}) {
+        return API.request(`/stats?${new URLSearchParams(params).toString()}`);
+    },
+    
+    // 统计分析API，结果由服务器按天汇总表计算
+    analytics: {
+        // 按时间区间统计新增和完成数: { from, to, granularity: day|week|month }
+        activity(params = {}) {
+            return API.request(`/analytics/activity?${new URLSearchParams(params).toString()}`);
+        },
+        
+        // 按分类统计，指定from/to时只统计范围内创建的任务
+        categories(params = {}) {
+            return API.request(`/analytics/categories?${new URLSearchParams(params).toString()}`);
+        },
+        
+        // 按完成时间的小时和时段统计完成数
+        productivity(params = {}) {
+            return API.request(`/analytics/productivity?${new URLSearchParams(params).toString()}`);
+        }
+    },
+    
+    // 订阅任务变更推送，EventSource断线后会自动携带Last-Event-ID重连；
+    // 服务器推送连接已满（503）时EventSource不再重连，稍后带上最后的事件ID重新订阅
+    subscribeEvents(onChange, onReset) {
+        const subscription = {
+            source: null,
+            lastEventId: null,
+            closed: false,
+            close() {
+                this.closed = true;
+                this.source && this.source.close();
+            }
+        };
+        const connect = () => {
+            let url = `${this.baseUrl}/events?access_token=${encodeURIComponent(this.token)}`;
+            if (subscription.lastEventId) {
+                url += `&last_event_id=${encodeURIComponent(subscription.lastEventId)}`;
+            }
+            const source = new EventSource(url);
+            ['task.created', 'task.updated', 'task.deleted'].forEach(type => {
+                source.addEventListener(type, event => {
+                    subscription.lastEventId = event.lastEventId;
+                    onChange(type, JSON.parse(event.data));
+                });
+            });
+            source.addEventListener('reset', () => onReset && onReset());
+            source.addEventListener('error', () => {
+                if (source.readyState === EventSource.CLOSED && !subscription.closed) {
+                    setTimeout(connect, 5000);
+                }
+            });
+            subscription.source = source;
+        };
+        connect();
+        return subscription;
     }
 };
 
@@ -3,10 +3,30 @@
  * 负责处理任务数据展示、图表生成和页面交互
  */
 
-// 全局变量存储任务数据
-let allTasks = [];
+// 全局变量存储图表实例
 let chartInstances = {};
 
+// 各视图从服务器按过滤条件分页加载的任务，推送的变更按视图的条件合并
+const todayView = { date: null, tasks: [] };
+const upcomingView = { range: 'week', from: null, to: null, tasks: [], nextCursor: null, last: null };
+const allTasksView = { status: 'all', sort: 'due_date', category: null, tasks: [], nextCursor: null, last: null };
+// 概览中的逾期任务
+const overdueView = { date: null, tasks: [], nextCursor: null, last: null };
+
+// 未来任务和所有任务视图每页加载的任务数
+const UPCOMING_PAGE_SIZE = 100;
+const ALL_TASKS_PAGE_SIZE = 100;
+// 概览中每个列表最多显示的任务数
+const OVERVIEW_LIST_SIZE = 5;
+
+// 排序选项对应的服务器排序参数，任务没有优先级字段，按优先级排序时使用默认的创建时间
+const ALL_TASKS_SORTS = {
+    'date-asc': 'due_date',
+    'date-desc': '-due_date',
+    'priority': 'created_at',
+    'category': 'category'
+};
+
 // 在DOM加载完成后执行
 document.addEventListener('DOMContentLoaded', function() {
     // 检查用户是否已登录
@@ -41,7 +61,7 @@ document.addEventListener('DOMContentLoaded', function() {
         button.addEventListener('click', function() {
             timeRangeButtons.forEach(btn => btn.classList.remove('active'));
             this.classList.add('active');
-            updateUpcomingTasks(this.dataset.range);
+            loadUpcomingTasks(this.dataset.range).catch(showLoadError);
         });
     });
     
@@ -52,8 +72,128 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // 设置今日日期
     updateTodayDate();
+    
+    // 订阅服务器推送的任务变更
+    initTaskEvents();
 });
 
+/**
+ * 订阅任务变更推送，按事件内容更新本地任务数据，不重新下载任务列表
+ */
+function initTaskEvents() {
+    if (typeof EventSource === 'undefined') return;
+    
+    let renderTimer = null;
+    const scheduleRender = () => {
+        clearTimeout(renderTimer);
+        renderTimer = setTimeout(renderTaskViews, 300);
+    };
+    
+    API.init();
+    API.subscribeEvents((type, change) => {
+        applyTaskChange(change);
+        scheduleRender();
+    }, () => loadTaskData());  // 断线期间的变更过多时服务器要求重新同步
+}
+
+/**
+ * 将推送事件中的任务变更合并到各视图已加载的任务
+ */
+function applyTaskChange(change) {
+    mergeTodayTask(change);
+    mergeUpcomingTask(change);
+    mergeAllTask(change);
+    mergeOverdueTask(change);
+}
+
+/**
+ * 按服务器的排序比较两个任务：先按排序列，再按ID；升序时空值在前，降序时在后
+ */
+function compareTasks(a, b, sort) {
+    const descending = sort.startsWith('-');
+    const column = descending ? sort.slice(1) : sort;
+    const keyA = [a[column] == null ? 0 : 1, a[column] || '', a.id];
+    const keyB = [b[column] == null ? 0 : 1, b[column] || '', b.id];
+    let result = 0;
+    for (let i = 0; i < keyA.length && result === 0; i++) {
+        result = keyA[i] < keyB[i] ? -1 : (keyA[i] > keyB[i] ? 1 : 0);
+    }
+    return descending ? -result : result;
+}
+
+/**
+ * 还有未加载的页时，排在已加载的最后一个任务之后的变更由后续的页返回
+ */
+function beyondLoadedPages(view, change, sort) {
+    return !!view.nextCursor && !!view.last && compareTasks(change, view.last, sort) > 0;
+}
+
+/**
+ * 将变更合并到视图的任务列表，matches为false时从列表中移除
+ */
+function mergeViewTask(tasks, change, matches) {
+    const index = tasks.findIndex(task => task.id === change.id);
+    if (index !== -1) {
+        tasks.splice(index, 1);
+    }
+    if (matches) {
+        tasks.push(change);
+    }
+}
+
+function mergeTodayTask(change) {
+    mergeViewTask(todayView.tasks, change, !change.deleted && change.due_date === todayView.date);
+}
+
+function mergeUpcomingTask(change) {
+    const view = upcomingView;
+    const matches = !change.deleted && !change.completed && !!change.due_date &&
+        change.due_date >= view.from && (!view.to || change.due_date <= view.to);
+    mergeViewTask(view.tasks, change, matches && !beyondLoadedPages(view, change, 'due_date'));
+}
+
+function mergeAllTask(change) {
+    const view = allTasksView;
+    const matches = !change.deleted &&
+        (view.status === 'all' || change.completed === (view.status === 'completed')) &&
+        (!view.category || change.category === view.category);
+    mergeViewTask(view.tasks, change, matches && !beyondLoadedPages(view, change, view.sort));
+    view.tasks.sort((a, b) => compareTasks(a, b, view.sort));
+}
+
+function mergeOverdueTask(change) {
+    const view = overdueView;
+    const matches = !change.deleted && !change.completed && !!change.due_date &&
+        change.due_date < view.date;
+    mergeViewTask(view.tasks, change, matches && !beyondLoadedPages(view, change, 'due_date'));
+    view.tasks.sort((a, b) => compareTasks(a, b, 'due_date'));
+    // 显示的任务不足且服务器还有更多逾期任务时重新加载这一页
+    if (view.tasks.length < OVERVIEW_LIST_SIZE && view.nextCursor) {
+        loadOverdueTasks().then(updateOverviewData).catch(showLoadError);
+    }
+}
+
+/**
+ * 在各视图已加载的任务中查找
+ */
+function findLoadedTask(taskId) {
+    for (const view of [todayView, upcomingView, allTasksView, overdueView]) {
+        const task = view.tasks.find(t => t.id === taskId);
+        if (task) return task;
+    }
+    return null;
+}
+
+/**
+ * 根据本地任务数据重新渲染各视图
+ */
+function renderTaskViews() {
+    updateOverviewData();
+    renderAllTasks();
+    renderTodayTasks();
+    renderUpcomingTasks();
+}
+
 /**
  * 初始化侧边栏交互
  */
@@ -73,8 +213,10 @@ function initSidebar() {
             navLinks.forEach(l => l.parentElement.classList.remove('active'));
             this.parentElement.classList.add('active');
             
-            // 获取视图ID
-            if (this.dataset.view) {
+            // 获取视图ID，从导航进入所有任务视图时清除分类过滤
+            if (this.dataset.view === 'all-tasks') {
+                filterTasksByCategory(null);
+            } else if (this.dataset.view) {
                 showView(this.dataset.view);
             } else if (this.dataset.category) {
                 filterTasksByCategory(this.dataset.category);
@@ -119,11 +261,11 @@ function showView(viewId) {
         if (viewId === 'overview') {
             updateOverviewData();
         } else if (viewId === 'all-tasks') {
-            renderAllTasks();
+            loadAllTasks().catch(showLoadError);
         } else if (viewId === 'today') {
-            renderTodayTasks();
+            loadTodayTasks().catch(showLoadError);
         } else if (viewId === 'upcoming') {
-            updateUpcomingTasks('week'); // 默认显示本周
+            loadUpcomingTasks(upcomingView.range).catch(showLoadError);
         } else if (viewId === 'analytics') {
             updateAnalyticsCharts(30); // 默认显示30天
         }
@@ -149,17 +291,15 @@ function loadTaskData(showRefresh = false) {
     document.getElementById('last-sync').textContent = `上次同步: ${timeString}`;
     document.getElementById('last-sync-time').textContent = timeString;
     
-    // 加载任务数据
-    API.tasks.getAll()
-        .then(response => {
-            allTasks = response.tasks || [];
-            console.log('加载了', allTasks.length, '个任务');
-            
-            // 更新所有视图
+    // 各视图只加载当前过滤条件下的第一页
+    Promise.all([
+        loadTodayTasks(),
+        loadUpcomingTasks(upcomingView.range),
+        loadAllTasks(),
+        loadOverdueTasks()
+    ])
+        .then(() => {
             updateOverviewData();
-            renderAllTasks();
-            renderTodayTasks();
-            updateUpcomingTasks('week');
             
             // 延迟一点移除加载指示器，提供更好的视觉反馈
             if (showRefresh) {
@@ -178,6 +318,31 @@ function loadTaskData(showRefresh = false) {
         });
 }
 
+/**
+ * 单个视图加载失败时提示
+ */
+function showLoadError(error) {
+    console.error('加载任务失败:', error);
+    showNotification('加载任务失败，请重试', 'error');
+}
+
+/**
+ * 将日期格式化为本地时间的 YYYY-MM-DD
+ */
+function toISODate(date) {
+    return date.getFullYear() + '-' +
+           (date.getMonth() + 1).toString().padStart(2, '0') + '-' +
+           date.getDate().toString().padStart(2, '0');
+}
+
+/**
+ * 按本地时间解析 YYYY-MM-DD，new Date(string) 会按UTC解析
+ */
+function parseISODate(value) {
+    const [year, month, day] = value.split('-').map(Number);
+    return new Date(year, month - 1, day);
+}
+
 /**
  * 更新今日日期显示
  */
@@ -196,55 +361,15 @@ function updateOverviewData() {
     const today = new Date();
     today.setHours(0, 0, 0, 0);
     
-    const weekStart = new Date(today);
-    weekStart.setDate(today.getDate() - today.getDay());
-    
-    const weekEnd = new Date(weekStart);
-    weekEnd.setDate(weekStart.getDate() + 6);
-    
-    const last7Days = new Date(today);
-    last7Days.setDate(today.getDate() - 7);
+    // 统计卡片由服务器根据计数器计算
+    updateStatCards();
     
-    const last30Days = new Date(today);
-    last30Days.setDate(today.getDate() - 30);
+    // 今日视图已加载的未完成任务
+    const todayTasks = todayView.tasks.filter(task => !task.completed)
+        .sort((a, b) => (a.due_time || '99:99').localeCompare(b.due_time || '99:99'));
     
-    // 过滤任务
-    const todayTasks = allTasks.filter(task => {
-        const dueDate = task.due_date ? new Date(task.due_date) : null;
-        return dueDate && dueDate.toDateString() === today.toDateString() && !task.completed;
-    });
-    
-    const weekTasks = allTasks.filter(task => {
-        const dueDate = task.due_date ? new Date(task.due_date) : null;
-        return dueDate && dueDate >= weekStart && dueDate <= weekEnd && !task.completed;
-    });
-    
-    const completedRecent = allTasks.filter(task => {
-        const completedDate = task.completed_at ? new Date(task.completed_at) : null;
-        return task.completed && completedDate && completedDate >= last7Days;
-    });
-    
-    // 计算完成率
-    const last30DaysTasks = allTasks.filter(task => {
-        const dueDate = task.due_date ? new Date(task.due_date) : null;
-        return dueDate && dueDate >= last30Days && dueDate <= today;
-    });
-    
-    const last30DaysCompleted = last30DaysTasks.filter(task => task.completed);
-    const completionRate = last30DaysTasks.length > 0 
-        ? Math.round((last30DaysCompleted.length / last30DaysTasks.length) * 100) 
-        : 0;
-    
-    // 更新统计卡片
-    document.querySelector('#today-count .stat-number').textContent = todayTasks.length;
-    document.querySelector('#week-count .stat-number').textContent = weekTasks.length;
-    document.querySelector('#completed-count .stat-number').textContent = completedRecent.length;
-    document.querySelector('#completion-rate .stat-number').textContent = `${completionRate}%`;
-    
-    // 更新紧急任务列表
-    const urgentTasks = allTasks.filter(task => {
-        return task.priority === '高' && !task.completed;
-    }).slice(0, 5); // 最多显示5个
+    // 更新紧急任务列表，显示最早逾期的未完成任务
+    const urgentTasks = overdueView.tasks.slice(0, OVERVIEW_LIST_SIZE);
     
     const urgentTaskList = document.getElementById('urgent-task-list');
     urgentTaskList.innerHTML = '';
@@ -288,7 +413,7 @@ function updateOverviewData() {
     if (todayTasks.length === 0) {
         todayTaskList.innerHTML = '<li class="empty-message">今天没有任务安排</li>';
     } else {
-        const tasksToShow = todayTasks.slice(0, 5); // 最多显示5个
+        const tasksToShow = todayTasks.slice(0, OVERVIEW_LIST_SIZE);
         tasksToShow.forEach(task => {
             const li = document.createElement('li');
             li.className = 'task-preview-item';
@@ -323,47 +448,53 @@ function updateOverviewData() {
     updateCategoryChart();
 }
 
+/**
+ * 更新统计卡片
+ */
+async function updateStatCards() {
+    try {
+        const stats = await API.stats({ date: toISODate(new Date()) });
+        const completionRate = stats.completion_rate_last_30_days === null
+            ? 0 : Math.round(stats.completion_rate_last_30_days);
+        
+        document.querySelector('#today-count .stat-number').textContent = stats.due_today;
+        document.querySelector('#week-count .stat-number').textContent = stats.due_this_week;
+        document.querySelector('#completed-count .stat-number').textContent = stats.completed_last_7_days;
+        document.querySelector('#completion-rate .stat-number').textContent = `${completionRate}%`;
+    } catch (error) {
+        console.error('加载统计数据失败:', error);
+    }
+}
+
 /**
  * 更新每周任务完成图表
  */
-function updateWeeklyChart() {
+async function updateWeeklyChart() {
     const ctx = document.getElementById('weekly-chart').getContext('2d');
     
-    // 准备图表数据
+    // 过去7天每天的新增和完成数由服务器汇总
     const today = new Date();
-    today.setHours(0, 0, 0, 0);
-    
-    // 获取过去7天的日期标签
-    const dateLabels = [];
-    const completedData = [];
-    const addedData = [];
-    
-    for (let i = 6; i >= 0; i--) {
-        const date = new Date(today);
-        date.setDate(today.getDate() - i);
-        
-        // 添加日期标签 (周一, 周二 等)
-        const weekdayNames = ['周日', '周一', '周二', '周三', '周四', '周五', '周六'];
-        dateLabels.push(weekdayNames[date.getDay()]);
-        
-        // 计算当天完成的任务
-        const completedCount = allTasks.filter(task => {
-            if (!task.completed || !task.completed_at) return false;
-            const completedDate = new Date(task.completed_at);
-            return completedDate.toDateString() === date.toDateString();
-        }).length;
-        
-        // 计算当天添加的任务
-        const addedCount = allTasks.filter(task => {
-            if (!task.created_at) return false;
-            const createdDate = new Date(task.created_at);
-            return createdDate.toDateString() === date.toDateString();
-        }).length;
-        
-        completedData.push(completedCount);
-        addedData.push(addedCount);
+    const weekAgo = new Date(today);
+    weekAgo.setDate(today.getDate() - 6);
+    
+    let buckets;
+    try {
+        ({ buckets } = await API.analytics.activity({
+            from: toISODate(weekAgo),
+            to: toISODate(today),
+            granularity: 'day'
+        }));
+    } catch (error) {
+        console.error('加载每周统计失败:', error);
+        return;
     }
     
+    // 日期标签 (周一, 周二 等)
+    const weekdayNames = ['周日', '周一', '周二', '周三', '周四', '周五', '周六'];
+    const dateLabels = buckets.map(bucket => weekdayNames[parseISODate(bucket.start).getDay()]);
+    const completedData = buckets.map(bucket => bucket.completed);
+    const addedData = buckets.map(bucket => bucket.created);
+    
     // 销毁旧图表
     if (chartInstances.weekly) {
         chartInstances.weekly.destroy();
@@ -418,23 +549,21 @@ function updateWeeklyChart() {
 /**
  * 更新分类饼图
  */
-function updateCategoryChart() {
+async function updateCategoryChart() {
     const ctx = document.getElementById('category-chart').getContext('2d');
     
-    // 统计各分类的任务数量
-    const categories = {};
-    
-    allTasks.forEach(task => {
-        const category = task.category || '其他';
-        if (!categories[category]) {
-            categories[category] = 0;
-        }
-        categories[category]++;
-    });
+    // 各分类的任务数量
+    let categories;
+    try {
+        ({ categories } = await API.analytics.categories());
+    } catch (error) {
+        console.error('加载分类统计失败:', error);
+        return;
+    }
     
     // 准备饼图数据
-    const labels = Object.keys(categories);
-    const data = Object.values(categories);
+    const labels = categories.map(item => item.category);
+    const data = categories.map(item => item.total);
     const backgroundColors = [
         'rgba(255, 99, 132, 0.7)',
         'rgba(54, 162, 235, 0.7)',
@@ -486,36 +615,57 @@ function updateCategoryChart() {
 }
 
 /**
- * 渲染所有任务列表
+ * 按状态、分类和排序方式从服务器分页加载所有任务视图，append为true时加载下一页
  */
-function renderAllTasks() {
-    const taskList = document.getElementById('complete-task-list');
-    const statusFilter = document.getElementById('status-filter').value;
-    const sortBy = document.getElementById('sort-by').value;
-    
-    // 过滤任务
-    let filteredTasks = [...allTasks];
-    
-    if (statusFilter === 'pending') {
-        filteredTasks = filteredTasks.filter(task => !task.completed);
-    } else if (statusFilter === 'completed') {
-        filteredTasks = filteredTasks.filter(task => task.completed);
+async function loadAllTasks(append = false) {
+    const view = allTasksView;
+    view.status = document.getElementById('status-filter').value;
+    view.sort = ALL_TASKS_SORTS[document.getElementById('sort-by').value] || 'due_date';
+    
+    const filters = { sort: view.sort, limit: ALL_TASKS_PAGE_SIZE };
+    if (view.status !== 'all') {
+        filters.completed = view.status === 'completed' ? 'true' : 'false';
+    }
+    if (view.category) {
+        filters.category = view.category;
+    }
+    if (append && view.nextCursor) {
+        filters.cursor = view.nextCursor;
     }
     
-    // 排序任务
-    filteredTasks.sort((a, b) => {
-        if (sortBy === 'date-asc') {
-            return new Date(a.due_date || '9999-12-31') - new Date(b.due_date || '9999-12-31');
-        } else if (sortBy === 'date-desc') {
-            return new Date(b.due_date || '1970-01-01') - new Date(a.due_date || '1970-01-01');
-        } else if (sortBy === 'priority') {
-            const priorityOrder = { '高': 1, '正常': 2, '低': 3 };
-            return (priorityOrder[a.priority] || 99) - (priorityOrder[b.priority] || 99);
-        } else if (sortBy === 'category') {
-            return (a.category || '其他').localeCompare(b.category || '其他');
-        }
-        return 0;
+    const response = await API.tasks.getAll(filters);
+    view.tasks = append ? view.tasks.concat(response.tasks) : response.tasks;
+    view.nextCursor = response.next_cursor || null;
+    view.last = response.tasks[response.tasks.length - 1] || null;
+    renderAllTasks();
+}
+
+/**
+ * 加载概览中最早逾期的未完成任务，按本地日期判断是否逾期
+ */
+async function loadOverdueTasks() {
+    const today = new Date();
+    const yesterday = new Date(today);
+    yesterday.setDate(today.getDate() - 1);
+    
+    const response = await API.tasks.getAll({
+        due_to: toISODate(yesterday),
+        completed: 'false',
+        sort: 'due_date',
+        limit: OVERVIEW_LIST_SIZE
     });
+    overdueView.date = toISODate(today);
+    overdueView.tasks = response.tasks;
+    overdueView.nextCursor = response.next_cursor || null;
+    overdueView.last = response.tasks[response.tasks.length - 1] || null;
+}
+
+/**
+ * 渲染所有任务列表
+ */
+function renderAllTasks() {
+    const taskList = document.getElementById('complete-task-list');
+    const filteredTasks = allTasksView.tasks;
     
     // 渲染任务列表
     taskList.innerHTML = '';
@@ -534,6 +684,25 @@ function renderAllTasks() {
         const taskItem = createTaskElement(task);
         taskList.appendChild(taskItem);
     });
+    
+    if (allTasksView.nextCursor) {
+        const loadMore = document.createElement('button');
+        loadMore.className = 'btn btn-sm load-more';
+        loadMore.textContent = '加载更多';
+        loadMore.addEventListener('click', () => loadAllTasks(true).catch(showLoadError));
+        taskList.appendChild(loadMore);
+    }
+}
+
+/**
+ * 按截止日期从服务器加载今日任务
+ */
+async function loadTodayTasks() {
+    const date = toISODate(new Date());
+    const response = await API.tasks.getAllPages({ due_date: date, sort: 'due_date' });
+    todayView.date = date;
+    todayView.tasks = response.tasks;
+    renderTodayTasks();
 }
 
 /**
@@ -542,15 +711,9 @@ function renderAllTasks() {
 function renderTodayTasks() {
     const taskList = document.getElementById('today-tasks-list');
     
-    // 过滤今日任务
-    const today = new Date();
-    today.setHours(0, 0, 0, 0);
-    
-    const todayTasks = allTasks.filter(task => {
-        if (!task.due_date) return false;
-        const dueDate = new Date(task.due_date);
-        return dueDate.toDateString() === today.toDateString();
-    });
+    // 同一天的任务按截止时间排序，没有时间的排在最后
+    const todayTasks = [...todayView.tasks].sort((a, b) =>
+        (a.due_time || '99:99').localeCompare(b.due_time || '99:99'));
     
     // 渲染任务列表
     taskList.innerHTML = '';
@@ -634,34 +797,57 @@ function createTaskElement(task) {
 }
 
 /**
- * 更新未来任务视图
+ * 按截止日期范围从服务器加载未完成的未来任务，append为true时加载下一页
  */
-function updateUpcomingTasks(range) {
-    const container = document.getElementById('upcoming-tasks-container');
-    container.innerHTML = '';
-    
-    // 获取日期范围
+async function loadUpcomingTasks(range, append = false) {
     const today = new Date();
     today.setHours(0, 0, 0, 0);
     
-    let endDate;
+    // 按本地日期计算范围，服务器的日期可能与浏览器不同
+    let endDate = null;
     if (range === 'week') {
         endDate = new Date(today);
         endDate.setDate(today.getDate() + 7);
     } else if (range === 'month') {
         endDate = new Date(today);
         endDate.setMonth(today.getMonth() + 1);
-    } else {
-        // 所有未来任务
-        endDate = new Date('9999-12-31');
     }
     
-    // 过滤未来任务
-    const upcomingTasks = allTasks.filter(task => {
-        if (!task.due_date) return false;
-        const dueDate = new Date(task.due_date);
-        return dueDate >= today && dueDate <= endDate && !task.completed;
-    });
+    const filters = {
+        due_from: toISODate(today),
+        completed: 'false',
+        sort: 'due_date',
+        limit: UPCOMING_PAGE_SIZE
+    };
+    if (endDate) {
+        filters.due_to = toISODate(endDate);
+    }
+    if (append && upcomingView.nextCursor) {
+        filters.cursor = upcomingView.nextCursor;
+    }
+    
+    const response = await API.tasks.getAll(filters);
+    upcomingView.range = range;
+    upcomingView.from = filters.due_from;
+    upcomingView.to = filters.due_to || null;
+    upcomingView.tasks = append ? upcomingView.tasks.concat(response.tasks) : response.tasks;
+    upcomingView.nextCursor = response.next_cursor || null;
+    upcomingView.last = response.tasks[response.tasks.length - 1] || null;
+    renderUpcomingTasks();
+}
+
+/**
+ * 渲染未来任务视图
+ */
+function renderUpcomingTasks() {
+    const container = document.getElementById('upcoming-tasks-container');
+    container.innerHTML = '';
+    
+    const range = upcomingView.range;
+    const upcomingTasks = upcomingView.tasks;
+    
+    const today = new Date();
+    today.setHours(0, 0, 0, 0);
     
     if (upcomingTasks.length === 0) {
         container.innerHTML = `
@@ -718,6 +904,14 @@ function updateUpcomingTasks(range) {
         container.appendChild(dateGroup);
     });
     
+    if (upcomingView.nextCursor) {
+        const loadMore = document.createElement('button');
+        loadMore.className = 'btn btn-sm load-more';
+        loadMore.textContent = '加载更多';
+        loadMore.addEventListener('click', () => loadUpcomingTasks(range, true).catch(showLoadError));
+        container.appendChild(loadMore);
+    }
+    
     // 生成简单日历视图
     generateCalendarView(sortedDates);
 }
@@ -823,19 +1017,19 @@ function updateAnalyticsCharts(days) {
     // 准备数据
     const endDate = new Date();
     const startDate = new Date();
-    startDate.setDate(endDate.getDate() - parseInt(days));
+    startDate.setDate(endDate.getDate() - parseInt(days) + 1);
     
     // 更新完成率趋势图
     updateCompletionTrendChart(startDate, endDate);
     
     // 更新分类饼图
-    updateCategoryPieChart();
+    updateCategoryPieChart(startDate, endDate);
     
     // 更新每日高效时段图
-    updateProductivityChart();
+    updateProductivityChart(startDate, endDate);
     
     // 更新任务统计表格
-    updateTaskStatsTable();
+    updateTaskStatsTable(startDate, endDate);
     
     // 更新生产力洞察
     updateProductivityInsights();
@@ -845,7 +1039,7 @@ function updateAnalyticsCharts(days) {
  * 显示任务详情
  */
 function showTaskDetails(taskId) {
-    const task = allTasks.find(t => t.id === taskId);
+    const task = findLoadedTask(taskId);
     if (!task) return;
     
     const detailsPanel = document.getElementById('task-details');
@@ -942,28 +1136,18 @@ function initFiltersAndSorting() {
     const statusFilter = document.getElementById('status-filter');
     const sortBy = document.getElementById('sort-by');
     
-    statusFilter.addEventListener('change', renderAllTasks);
-    sortBy.addEventListener('change', renderAllTasks);
+    statusFilter.addEventListener('change', () => loadAllTasks().catch(showLoadError));
+    sortBy.addEventListener('change', () => loadAllTasks().catch(showLoadError));
 }
 
 /**
  * 根据分类过滤任务
  */
 function filterTasksByCategory(category) {
-    // 切换到所有任务视图
+    // 切换到所有任务视图，由服务器按分类过滤
+    allTasksView.category = category;
     showView('all-tasks');
     
-    // 手动过滤DOM元素
-    const taskItems = document.querySelectorAll('.task-item');
-    taskItems.forEach(item => {
-        const taskCategory = item.querySelector('.task-category').textContent;
-        if (category && taskCategory !== category) {
-            item.style.display = 'none';
-        } else {
-            item.style.display = '';
-        }
-    });
-    
     // 更新标题
     document.querySelector('#all-tasks-view .content-header h2').textContent = 
         category ? `${category}类任务` : '所有任务';
@@ -1010,30 +1194,34 @@ function getNotificationIcon(type) {
     }
 }
 
-// 分析图表相关函数 - 简化版本
-function updateCompletionTrendChart(startDate, endDate) {
-    // 简单模拟数据
+// 分析图表相关函数，统计数据由服务器的 /v1/analytics 接口计算
+async function updateCompletionTrendChart(startDate, endDate) {
     const ctx = document.getElementById('completion-trend-chart').getContext('2d');
     
-    // 销毁旧图表
-    if (chartInstances.completionTrend) {
-        chartInstances.completionTrend.destroy();
+    // 范围较长时按周或按月汇总，数据点数量保持在合理范围内
+    const days = Math.round((endDate - startDate) / (1000 * 60 * 60 * 24)) + 1;
+    const granularity = days <= 31 ? 'day' : (days <= 180 ? 'week' : 'month');
+    
+    let buckets;
+    try {
+        ({ buckets } = await API.analytics.activity({
+            from: toISODate(startDate),
+            to: toISODate(endDate),
+            granularity
+        }));
+    } catch (error) {
+        console.error('加载完成率趋势失败:', error);
+        return;
     }
     
-    // 生成日期标签
-    const labels = [];
-    const data = [];
+    // 每个区间内创建的任务中已完成的比例，没有新任务的区间留空
+    const labels = buckets.map(bucket => parseISODate(bucket.start)
+        .toLocaleDateString('zh-CN', { month: 'numeric', day: 'numeric' }));
+    const data = buckets.map(bucket => bucket.completion_rate);
     
-    // 每7天一个数据点
-    const daySpan = Math.ceil((endDate - startDate) / (1000 * 60 * 60 * 24 * 7));
-    
-    for (let i = 0; i < 7; i++) {
-        const date = new Date(startDate);
-        date.setDate(startDate.getDate() + i * daySpan);
-        labels.push(date.toLocaleDateString('zh-CN', { month: 'numeric', day: 'numeric' }));
-        
-        // 模拟完成率数据
-        data.push(Math.floor(Math.random() * 30) + 70); // 70-100%范围的随机值
+    // 销毁旧图表
+    if (chartInstances.completionTrend) {
+        chartInstances.completionTrend.destroy();
     }
     
     // 创建图表
@@ -1048,7 +1236,8 @@ function updateCompletionTrendChart(startDate, endDate) {
                 backgroundColor: 'rgba(75, 192, 192, 0.2)',
                 borderColor: 'rgba(75, 192, 192, 1)',
                 borderWidth: 2,
-                tension: 0.4
+                tension: 0.4,
+                spanGaps: true
             }]
         },
         options: {
@@ -1056,8 +1245,8 @@ function updateCompletionTrendChart(startDate, endDate) {
             maintainAspectRatio: false,
             scales: {
                 y: {
-                    beginAtZero: false,
-                    min: 50,
+                    beginAtZero: true,
+                    min: 0,
                     max: 100,
                     ticks: {
                         callback: function(value) {
@@ -1079,24 +1268,24 @@ function updateCompletionTrendChart(startDate, endDate) {
     });
 }
 
-function updateCategoryPieChart() {
-    // 使用与概览页面相同的分类饼图逻辑
+async function updateCategoryPieChart(startDate, endDate) {
     const ctx = document.getElementById('category-pie-chart').getContext('2d');
     
-    // 统计各分类的任务数量
-    const categories = {};
-    
-    allTasks.forEach(task => {
-        const category = task.category || '其他';
-        if (!categories[category]) {
-            categories[category] = 0;
-        }
-        categories[category]++;
-    });
+    // 范围内创建的任务按分类统计
+    let categories;
+    try {
+        ({ categories } = await API.analytics.categories({
+            from: toISODate(startDate),
+            to: toISODate(endDate)
+        }));
+    } catch (error) {
+        console.error('加载分类统计失败:', error);
+        return;
+    }
     
     // 准备饼图数据
-    const labels = Object.keys(categories);
-    const data = Object.values(categories);
+    const labels = categories.map(item => item.category);
+    const data = categories.map(item => item.total);
     const backgroundColors = [
         'rgba(255, 99, 132, 0.7)',
         'rgba(54, 162, 235, 0.7)',
@@ -1136,10 +1325,21 @@ function updateCategoryPieChart() {
     });
 }
 
-function updateProductivityChart() {
-    // 模拟生产力时段数据
+async function updateProductivityChart(startDate, endDate) {
     const ctx = document.getElementById('productivity-chart').getContext('2d');
     
+    // 按完成时间所在时段统计完成数
+    let periods;
+    try {
+        ({ periods } = await API.analytics.productivity({
+            from: toISODate(startDate),
+            to: toISODate(endDate)
+        }));
+    } catch (error) {
+        console.error('加载高效时段统计失败:', error);
+        return;
+    }
+    
     // 销毁旧图表
     if (chartInstances.productivity) {
         chartInstances.productivity.destroy();
@@ -1152,7 +1352,7 @@ function updateProductivityChart() {
             labels: ['上午', '中午', '下午', '晚上'],
             datasets: [{
                 label: '任务完成数',
-                data: [8, 3, 7, 5],
+                data: [periods.morning, periods.noon, periods.afternoon, periods.evening],
                 backgroundColor: 'rgba(54, 162, 235, 0.7)',
                 borderColor: 'rgba(54, 162, 235, 1)',
                 borderWidth: 1
@@ -1165,7 +1365,7 @@ function updateProductivityChart() {
                 y: {
                     beginAtZero: true,
                     ticks: {
-                        stepSize: 2
+                        precision: 0
                     }
                 }
             }
@@ -1173,42 +1373,35 @@ function updateProductivityChart() {
     });
 }
 
-function updateTaskStatsTable() {
-    // 模拟统计数据
+async function updateTaskStatsTable(startDate, endDate) {
     const statsTable = document.getElementById('stats-table-body');
-    statsTable.innerHTML = '';
     
-    // 获取所有类别
-    const categories = {};
-    allTasks.forEach(task => {
-        const category = task.category || '其他';
-        if (!categories[category]) {
-            categories[category] = {
-                pending: 0,
-                completed: 0,
-                avgTime: 0
-            };
-        }
-        
-        if (task.completed) {
-            categories[category].completed++;
-        } else {
-            categories[category].pending++;
-        }
-    });
+    // 范围内创建的任务按分类统计待处理、已完成数和平均完成天数
+    let categories;
+    try {
+        ({ categories } = await API.analytics.categories({
+            from: toISODate(startDate),
+            to: toISODate(endDate)
+        }));
+    } catch (error) {
+        console.error('加载任务统计失败:', error);
+        return;
+    }
+    
+    statsTable.innerHTML = '';
     
     // 生成表格行
-    Object.entries(categories).forEach(([category, stats]) => {
-        const total = stats.pending + stats.completed;
-        const completionRate = total > 0 ? Math.round((stats.completed / total) * 100) : 0;
+    categories.forEach(stats => {
+        const completionRate = stats.completion_rate === null ? 0 : Math.round(stats.completion_rate);
+        const avgDays = stats.avg_completion_days === null ? '-' : stats.avg_completion_days.toFixed(1);
         
         const row = document.createElement('tr');
         row.innerHTML = `
-            <td>${category}</td>
+            <td>${stats.category}</td>
             <td>${stats.pending}</td>
             <td>${stats.completed}</td>
             <td>${completionRate}%</td>
-            <td>${(Math.random() * 3 + 1).toFixed(1)}</td>
+            <td>${avgDays}</td>
         `;
         
         statsTable.appendChild(row);
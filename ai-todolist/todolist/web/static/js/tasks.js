@@ -11,7 +11,15 @@ document.addEventListener('DOMContentLoaded', () => {
         currentFilter: null,
         currentCategory: null,
         sortBy: 'date-asc',
-        viewMode: 'list'
+        viewMode: 'list',
+        nextCursor: null
+    };
+    
+    // 由服务器执行的排序方式
+    const SERVER_SORTS = {
+        'date-asc': 'due_date',
+        'date-desc': '-due_date',
+        'category': 'category'
     };
     
     // 初始化任务列表
@@ -33,12 +41,20 @@ document.addEventListener('DOMContentLoaded', () => {
         setupEventListeners();
     }
     
-    // 加载任务列表
-    async function loadTasks() {
+    // 加载任务列表，append为true时加载下一页
+    async function loadTasks(append = false) {
         try {
             // 构建过滤器
             const filters = {};
             
+            if (SERVER_SORTS[state.sortBy]) {
+                filters.sort = SERVER_SORTS[state.sortBy];
+            }
+            
+            if (append && state.nextCursor) {
+                filters.cursor = state.nextCursor;
+            }
+            
             if (state.currentCategory) {
                 filters.category = state.currentCategory;
             }
@@ -47,8 +63,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 const today = new Date().toISOString().split('T')[0];
                 filters.due_date = today;
             } else if (state.currentFilter === 'upcoming') {
-                // 服务器端需要支持upcoming过滤
-                filters.upcoming = 'true';
+                // 未来7天内到期的任务
+                filters.upcoming = '7';
             } else if (state.currentFilter === 'completed') {
                 filters.completed = 'true';
             } else if (state.currentFilter === 'incomplete') {
@@ -57,10 +73,13 @@ document.addEventListener('DOMContentLoaded', () => {
             
             // 获取任务
             const response = await API.tasks.getAll(filters);
-            state.tasks = response.tasks;
+            state.tasks = append ? state.tasks.concat(response.tasks) : response.tasks;
+            state.nextCursor = response.next_cursor || null;
             
-            // 排序任务
-            sortTasks();
+            // 服务器不支持的排序方式在本地排序
+            if (!SERVER_SORTS[state.sortBy]) {
+                sortTasks();
+            }
             
             // 渲染任务
             renderTasks();
@@ -74,7 +93,7 @@ document.addEventListener('DOMContentLoaded', () => {
             `;
             
             // 添加重试按钮监听器
-            document.getElementById('retry-load')?.addEventListener('click', loadTasks);
+            document.getElementById('retry-load')?.addEventListener('click', () => loadTasks());
         }
     }
     
@@ -162,8 +181,19 @@ document.addEventListener('DOMContentLoaded', () => {
             `;
         });
         
+        // 还有更多任务时显示加载更多按钮
+        if (state.nextCursor) {
+            html += `
+                <div class="load-more">
+                    <button id="load-more-tasks" class="btn btn-secondary">加载更多</button>
+                </div>
+            `;
+        }
+        
         taskList.innerHTML = html;
         
+        document.getElementById('load-more-tasks')?.addEventListener('click', () => loadTasks(true));
+        
         // 添加任务项事件监听器
         addTaskItemListeners();
     }
@@ -390,8 +420,12 @@ document.addEventListener('DOMContentLoaded', () => {
         if (sortSelect) {
             sortSelect.addEventListener('change', () => {
                 state.sortBy = sortSelect.value;
-                sortTasks();
-                renderTasks();
+                if (SERVER_SORTS[state.sortBy]) {
+                    loadTasks();
+                } else {
+                    sortTasks();
+                    renderTasks();
+                }
             });
         }
         